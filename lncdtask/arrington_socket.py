@@ -4,17 +4,29 @@ Connect to arrington viewpoint via socket
 
 import socket
 import os
-from externalcom import ExternalCom
+from psychopy import core
+try:
+    from externalcom import ExternalCom
+except ImportError:
+    from lncdtask.externalcom import ExternalCom
 
 
 class ArringtonSocket(ExternalCom):
-    """ Arrington eyetracking software. connected via ethernet. 
+    """ Arrington eyetracking software. connected via ethernet.
     can get away without running client software if we use socket?
+
+    all commands for one event go out in a single write (TCP_NODELAY, no Nagle wait).
+    'say' echo of each event can be turned off or limited to one per say_interval seconds
     """
-    def __init__(self, host=None, port=5000, verbose=True, recVideo=False):
+    def __init__(self, host=None, port=5000, verbose=True, recVideo=False, say=True, say_interval=0):
         self.verbose = verbose
         self.recVideo = recVideo
+        self.say = say
+        self.say_interval = say_interval
+        self.last_say = None
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # small messages should go now, not when Nagle thinks there's enough to send
+        self.server.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         if host is None:
             print("getting ArringtonSocket host from env ET_HOST")
             host = os.environ.get("ET_HOST")
@@ -25,34 +37,114 @@ class ArringtonSocket(ExternalCom):
 
         # TODO: get status, confirm working
 
-    def send_cmd(self, cmd):
+    @staticmethod
+    def frame(cmd) -> bytes:
+        """VPX2 framing for one command
+        >>> ArringtonSocket.frame('say "hi"')
+        b'VPX2 9;220;say "hi";'
+        """
         cmd = cmd + ";"
         cmdl = len(cmd)
-        buf = f"VPX2 {cmdl};220;{cmd}"
-        self.server.send(buf.encode())
+        return f"VPX2 {cmdl};220;{cmd}".encode()
+
+    def send_cmds(self, *cmds):
+        """frame each command and send them all in one write"""
+        self.server.sendall(b"".join(self.frame(cmd) for cmd in cmds))
+
+    def send_cmd(self, cmd):
+        self.send_cmds(cmd)
+
+    def want_say(self):
+        """should this event also be echoed with 'say'"""
+        if not self.say:
+            return False
+        now = core.getTime()
+        if self.last_say is not None and now - self.last_say < self.say_interval:
+            return False
+        self.last_say = now
+        return True
 
     def event(self, code=None):
         if code is None:
             return
-        self.send_cmd('dataFile_InsertString "%s"' % code)
-        self.send_cmd('say "sent %s"' % code)
+        cmds = ['dataFile_InsertString "%s"' % code]
+        if self.want_say():
+            cmds.append('say "sent %s"' % code)
+        self.send_cmds(*cmds)
+
+    def drain(self) -> bytes:
+        """read (without waiting) whatever is already on the socket. e.g. replies nobody read"""
+        waiting = []
+        self.server.setblocking(False)
+        try:
+            while data := self.server.recv(4096):
+                waiting.append(data)
+        except (BlockingIOError, InterruptedError):
+            pass
+        finally:
+            self.server.setblocking(True)
+        return b"".join(waiting)
+
+    def probe(self, n=10, cmd='say "latency probe {i}"', timeout=.5) -> list:
+        """
+        round trip latency: seconds from sending cmd (VPX2 framed) to its reply.
+        cmd's {i} is the probe number: the reply is what comes back with that probe's text in it.
+        stale bytes (earlier replies never read) are drained before each send so they aren't counted.
+        None when no reply came back within timeout.
+        compare to the DLL path (Arrington) like debug/logs_socket* did by hand
+        """
+        rtts = []
+        try:
+            for i in range(n):
+                this_cmd = cmd.format(i=i)
+                # the cmd as it'd be quoted back. without quotes: the whole cmd
+                tag = (this_cmd.split('"')[1] if '"' in this_cmd else this_cmd).encode()
+                self.drain()
+                t0 = core.getTime()
+                self.send_cmd(this_cmd)
+                got = b""
+                rtt = None
+                while (left := timeout - (core.getTime() - t0)) > 0:
+                    self.server.settimeout(left)
+                    try:
+                        data = self.server.recv(4096)
+                    except socket.timeout:
+                        break
+                    if not data:
+                        break  # closed
+                    got += data
+                    if tag in got:
+                        rtt = core.getTime() - t0
+                        break
+                rtts.append(rtt)
+        finally:
+            self.server.settimeout(None)
+        if self.verbose:
+            got = [x for x in rtts if x is not None]
+            if got:
+                print(f"socket rtt: n={len(got)}/{n} max={max(got)*1000:.2f}ms min={min(got)*1000:.2f}ms")
+            else:
+                print(f"socket rtt: no responses in {n} probes")
+        return rtts
 
     def new(self, fname):
         self.runEyeName = fname.replace(".txt", "")
-        self.send_cmd('dataFile_Pause 1')
-        self.send_cmd('dataFile_NewName "%s"' % fname)
+        cmds = ['dataFile_Pause 1', 'dataFile_NewName "%s"' % fname]
         if self.verbose:
             print("tried to open eyetracking file %s" % fname)
-            self.send_cmd('say "newfile %s"' % fname)
+            cmds.append('say "newfile %s"' % fname)
+        self.send_cmds(*cmds)
 
     def start(self):
-        self.send_cmd('dataFile_Pause 0')
+        cmds = ['dataFile_Pause 0']
         if self.recVideo:
             print("send eyeMoive_NewName cmd")
-            self.send_cmd('eyeMovie_NewName "%s.avi"' % self.runEyeName)
+            cmds.append('eyeMovie_NewName "%s.avi"' % self.runEyeName)
+        self.send_cmds(*cmds)
 
     def stop(self):
-        self.send_cmd('dataFile_Close 0')
+        cmds = ['dataFile_Close 0']
         if self.recVideo:
             print("send end movie cmd")
-            self.send_cmd('eyeMovie_Close')
+            cmds.append('eyeMovie_Close')
+        self.send_cmds(*cmds)
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+headless per event overhead benchmark for every task class.
+no display needed: the window and psychopy stims are stubs (see headless()), externals only record.
+each task's real run() goes over its generated schedule with every deadline already passed,
+so what's timed is our own code between flips:
+
+  draw      event function start to flip (less external calls made there)
+  flip      stub flip itself (~0, the cost of a real flip is the driver's problem)
+  external  mark_func callbacks on flip + direct externals.event calls
+  dispatch  the rest of the event cycle: run() loop, arguments, results, after flip work
+
+results (median and 95th percentile microseconds per event type) are appended to a json history
+and compared to the last entry. run from the repo root (DollarReward reads images/):
+
+  python lncdtask/benchmark.py --repeat 5
+  python lncdtask/benchmark.py --check   # exit 1 if something got slower
+
+medians are per run, then the median of those over repeats. --check compares to the median of the
+last few history entries and reruns anything that looks slower: one noisy run isn't a regression
+"""
+try:
+    from externalcom import ExternalCom, FileLogger
+except ImportError:
+    from lncdtask.externalcom import ExternalCom, FileLogger
+
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+from time import perf_counter
+import numpy as np
+import psychopy
+# psychopy.visual (and the tasks) are imported only when needed: main() turns off pyglet's
+# shadow window first, so no display is needed. tests do the same in tests/conftest.py
+from psychopy import core
+
+#: measured parts of each event. see module doc
+PARTS = ['draw', 'flip', 'external', 'dispatch', 'total']
+#: stim classes replaced by StubStim inside headless()
+STUBBED_STIMS = ['TextStim', 'ImageStim', 'Circle', 'Rect', 'BufferImageStim', 'ElementArrayStim']
+#: default history file
+HISTORY = 'benchmark_history.json'
+
+
+class StubStim():
+    """stands in for any psychopy stim: keeps attributes, draw() does nothing"""
+    defaults = {'pos': (0, 0), 'size': (1, 1), 'height': .1, 'text': '', 'color': 'white',
+                'image': np.zeros((2, 2, 3))}
+
+    def __init__(self, win=None, *karg, **kargs):
+        self.win = win
+        for k, v in kargs.items():
+            setattr(self, k, v)
+        self.n_draws = 0
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self.defaults.get(name)
+
+    def draw(self, win=None):
+        self.n_draws += 1
+
+
+class StubWindow():
+    """
+    enough of psychopy.visual.Window for tasks to run: callOnFlip and flip.
+    flip runs the queued callbacks (timed as external) and tells timer
+    """
+    def __init__(self, size=(800, 600), frame_period=1/60):
+        self.size = np.array(size)
+        self.color = 'black'
+        self.units = 'height'
+        self.monitorFramePeriod = frame_period
+        self.on_flip = []
+        self.n_flips = 0
+        self.timer = None
+        self._closed = False
+
+    def callOnFlip(self, func, *karg, **kargs):
+        self.on_flip.append((func, karg, kargs))
+
+    def flip(self, clearBuffer=True):
+        start = perf_counter()
+        callbacks, self.on_flip = self.on_flip, []
+        external = 0.0
+        for func, karg, kargs in callbacks:
+            t = perf_counter()
+            if self.timer:
+                self.timer.in_callback = True
+            func(*karg, **kargs)
+            if self.timer:
+                self.timer.in_callback = False
+            external += perf_counter() - t
+        self.n_flips += 1
+        flip = core.getTime()
+        if self.timer:
+            self.timer.flipped(start, perf_counter(), external)
+        return flip
+
+    def close(self):
+        self._closed = True
+
+
+class QuietExternal(ExternalCom):
+    """ExternalCom that doesn't print. counts events"""
+    def __init__(self, lookup=None):
+        super().__init__(lookup)
+        self.n_events = 0
+
+    def print_time(self, msg):
+        pass
+
+    def event(self, code=None):
+        self.n_events += 1
+        if self.lookup and code is not None:
+            self.lookup(code)
+
+
+class EventTimer():
+    """
+    per event seconds for each of PARTS. event functions are wrapped (wrap),
+    the stub window reports flips (flipped), and externals.event is wrapped (watch_externals)
+
+    >>> timer = EventTimer()
+    >>> f = timer.wrap('x', lambda: sum(range(100)))
+    >>> f(); f()
+    4950
+    4950
+    >>> timer.summary()['x']['n']
+    2
+    """
+    def __init__(self):
+        self.records = {p: [] for p in PARTS}
+        self.names = []
+        self.runs = []  # run number of each record. see new_run
+        self.run = 0
+        self.current = None
+        self.last_end = None
+        self.in_callback = False
+
+    def wrap(self, name, func):
+        def timed(*karg, **kargs):
+            start = perf_counter()
+            self.current = {'start': start, 'flip_start': None, 'flip': 0.0, 'external': 0.0, 'pre_external': 0.0}
+            result = func(*karg, **kargs)
+            self.finish(name, perf_counter())
+            return result
+        timed.__name__ = getattr(func, '__name__', name)
+        return timed
+
+    def watch_externals(self, externals):
+        """time externals.event calls not already inside a flip callback"""
+        send = externals.event
+
+        def timed(*karg, **kargs):
+            if self.in_callback or self.current is None:
+                return send(*karg, **kargs)
+            t = perf_counter()
+            result = send(*karg, **kargs)
+            dur = perf_counter() - t
+            self.current['external'] += dur
+            if self.current['flip_start'] is None:
+                self.current['pre_external'] += dur
+            return result
+        externals.event = timed
+
+    def flipped(self, start, end, external):
+        cur = self.current
+        if cur is None:
+            return
+        if cur['flip_start'] is None:
+            cur['flip_start'] = start
+        cur['flip'] += end - start - external
+        cur['external'] += external
+
+    def finish(self, name, end):
+        cur = self.current
+        total = end - (self.last_end if self.last_end is not None else cur['start'])
+        flip_start = cur['flip_start'] if cur['flip_start'] is not None else end
+        draw = flip_start - cur['start'] - cur['pre_external']
+        self.names.append(name)
+        self.runs.append(self.run)
+        for part, value in zip(PARTS, [draw, cur['flip'], cur['external'],
+                                       total - draw - cur['flip'] - cur['external'], total]):
+            self.records[part].append(value)
+        self.last_end = end
+        self.current = None
+
+    def new_run(self):
+        """next event's cycle starts at its own start (not the last run's end)"""
+        self.last_end = None
+        self.run += 1
+
+    def summary(self):
+        """
+        event name => n and microseconds of each part:
+        median (of each run's median) and 95th percentile (all runs)
+        """
+        names = np.array(self.names)
+        runs = np.array(self.runs)
+        out = {}
+        for name in dict.fromkeys(self.names):
+            keep = names == name
+            stats = {'n': int(keep.sum())}
+            for part in PARTS:
+                us = np.array(self.records[part])[keep] * 1e6
+                run_medians = [np.median(us[runs[keep] == r]) for r in np.unique(runs[keep])]
+                stats[part] = round(float(np.median(run_medians)), 2)
+                stats[part + '_p95'] = round(float(np.percentile(us, 95)), 2)
+            out[name] = stats
+        return out
+
+
+@contextlib.contextmanager
+def headless():
+    """psychopy stims are StubStim (and keyboard waits fail loudly) until exit"""
+    from psychopy import visual, event
+    saved = {name: getattr(visual, name) for name in STUBBED_STIMS}
+    wait_keys = event.waitKeys
+
+    def no_keys(*karg, **kargs):
+        raise RuntimeError("benchmark: task waited for a key press")
+
+    try:
+        for name in STUBBED_STIMS:
+            setattr(visual, name, StubStim)
+        event.waitKeys = no_keys
+        yield
+    finally:
+        for name, cls in saved.items():
+            setattr(visual, name, cls)
+        event.waitKeys = wait_keys
+
+
+def make_externals(kind):
+    """
+    'quiet' (nothing sent) or 'file' (FileLogger: the real write path).
+    a run's stop() closes the log: see new_files for a file per repeat
+    """
+    if kind == 'quiet':
+        return [QuietExternal()]
+    if kind == 'file':
+        return [FileLogger()]
+    raise ValueError(f"unknown externals '{kind}'")
+
+
+def new_files(task, kind, tmpdir, i):
+    """give repeat i its own log file (a stopped FileLogger would only buffer)"""
+    if kind == 'file':
+        task.externals.new(os.path.join(tmpdir or '.', f'benchmark_events_{i}.log'))
+
+
+def run_schedule(task, onset_df, timer):
+    """task.run over onset_df with every onset already in the past: no waiting"""
+    task.reset(onset_df.copy())
+    timer.new_run()
+    last = float(onset_df.onset.max()) if 'onset' in onset_df.columns else 0
+    task.run(start_at=core.getTime() - last - 1)
+
+
+def run_rest(task, n_pulses, timer):
+    """RestTask.run with n_pulses scanner triggers ('=') then 'q'"""
+    from psychopy import event
+    keys = iter([['equal']]*n_pulses + [['q']])
+    timer.new_run()
+    wait_keys = event.waitKeys
+    event.waitKeys = lambda *karg, **kargs: next(keys)
+    try:
+        task.run(cross=False)
+    finally:
+        event.waitKeys = wait_keys
+
+
+class TaskBench():
+    """
+    how to benchmark one task class
+    :param make: (win, externals) => task
+    :param schedule: numpy Generator => onset_df (or anything drive takes)
+    :param drive: (task, schedule, timer) runs it. default run_schedule
+    :param events: event functions to time. default every add_event_type event
+    """
+    def __init__(self, make, schedule, drive=run_schedule, events=None):
+        self.make = make
+        self.schedule = schedule
+        self.drive = drive
+        self.events = events
+
+    def setup(self, win, externals, timer):
+        task = self.make(win, externals)
+        if not hasattr(task, 'eyelink'):
+            task.eyelink = None  # set by the run_* launchers
+        if self.events is None:
+            for name, runner in task.events.items():
+                runner.func = timer.wrap(name, runner.func)
+        else:
+            for name in self.events:
+                setattr(task, name, timer.wrap(name, getattr(task, name)))
+        timer.watch_externals(task.externals)
+        return task
+
+
+def task_benches():
+    """task class name => TaskBench. imported here so a broken task only breaks its own benchmark"""
+    try:
+        from dollarreward import DollarReward
+    except ImportError:
+        # imported as lncdtask.benchmark: lncdtask.lncdtask puts the task modules on the path
+        import lncdtask.lncdtask  # noqa: F401
+        from dollarreward import DollarReward
+    from mgs import MGSEye, random_pos_df as mgs_df
+    from vgs import VGSEye, random_pos_df as vgs_df
+    from eyecal import EyeCal, random_pos_df as eyecal_df
+    from rest import RestTask
+    from helloworldtask import HelloWorldTask, example_df
+
+    def seed(rng):
+        return int(rng.integers(2**32))
+
+    return {
+        'DollarReward': TaskBench(lambda win, ext: DollarReward(win=win, externals=ext),
+                                  lambda rng: DollarReward.generate_timing(seed(rng))),
+        'MGSEye': TaskBench(lambda win, ext: MGSEye(win=win, externals=ext), mgs_df),
+        'VGSEye': TaskBench(lambda win, ext: VGSEye(win=win, externals=ext), vgs_df),
+        'EyeCal': TaskBench(lambda win, ext: EyeCal(win=win, externals=ext), lambda rng: eyecal_df(rng=rng)),
+        'RestTask': TaskBench(lambda win, ext: RestTask(win=win, externals=ext),
+                              lambda rng: 300, drive=run_rest, events=['with_instructions']),
+        'HelloWorldTask': TaskBench(lambda win, ext: HelloWorldTask(win=win, externals=ext),
+                                    lambda rng: example_df()),
+    }
+
+
+def bench_task(bench, repeat=3, seed=0, externals='quiet', tmpdir=None):
+    """summary (see EventTimer.summary) of repeat runs of one task on a fresh stub window"""
+    rng = np.random.default_rng(seed)
+    timer = EventTimer()
+    win = StubWindow()
+    win.timer = timer
+    quiet = io.StringIO()
+    with headless(), contextlib.redirect_stdout(quiet):
+        task = bench.setup(win, make_externals(externals), timer)
+        for i in range(repeat):
+            new_files(task, externals, tmpdir, i)
+            bench.drive(task, bench.schedule(rng), timer)
+            quiet.seek(0)
+            quiet.truncate()  # tasks print a lot. don't keep it all
+    try:
+        from lncdtask import IMAGES
+    except ImportError:
+        from lncdtask.lncdtask import IMAGES
+    IMAGES.forget(win)
+    win.close()
+    return timer.summary()
+
+
+def git_commit():
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=here,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(tasks=None, repeat=3, seed=0, externals='quiet', tmpdir=None):
+    """one history entry: where and when, and task => event => timing summary"""
+    benches = task_benches()
+    tasks = tasks or list(benches)
+    results = {name: bench_task(benches[name], repeat, seed, externals, tmpdir) for name in tasks}
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'psychopy': psychopy.__version__,
+            'repeat': repeat,
+            'externals': externals,
+            'results': results}
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def append_history(path, entry):
+    history = read_history(path)
+    history.append(entry)
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=1)
+    return history
+
+
+def baseline(history, n=5):
+    """
+    task => event => part => median over the last n history entries that have it
+    >>> h = [{'results': {'T': {'dot': {'total': t}}}} for t in (10, 30, 12)]
+    >>> baseline(h)['T']['dot']['total']
+    12.0
+    """
+    values = {}
+    for entry in history[-n:]:
+        for task, events in entry['results'].items():
+            for ev, stats in events.items():
+                for part in PARTS:
+                    if part in stats:
+                        values.setdefault(task, {}).setdefault(ev, {}).setdefault(part, []).append(stats[part])
+    return {task: {ev: {part: float(np.median(v)) for part, v in parts.items()}
+                   for ev, parts in events.items()}
+            for task, events in values.items()}
+
+
+def regressions(base, cur, tolerance=1.5, floor=10):
+    """
+    (task, event, part, baseline us, cur us) where the median is more than tolerance times the baseline
+    (see baseline()) and slower by more than floor microseconds (a few us either way is noise)
+
+    >>> base = {'T': {'dot': {'draw': 10, 'total': 30}}}
+    >>> cur = {'results': {'T': {'dot': {'draw': 40, 'total': 33}}}}
+    >>> regressions(base, cur)
+    [('T', 'dot', 'draw', 10, 40)]
+    """
+    slower = []
+    for task, events in cur['results'].items():
+        for ev, stats in events.items():
+            before = base.get(task, {}).get(ev)
+            if before is None:
+                continue
+            for part in PARTS:
+                if part in stats and part in before and \
+                   stats[part] > before[part]*tolerance and stats[part] - before[part] > floor:
+                    slower.append((task, ev, part, before[part], stats[part]))
+    return slower
+
+
+def confirm(slower, base, repeat, seed, externals, tmpdir, tolerance=1.5, floor=10):
+    """run tasks with regressions again. only what is slow both times is kept (with the faster time)"""
+    if not slower:
+        return slower
+    again = run_benchmarks(sorted({task for task, *_ in slower}), repeat, seed, externals, tmpdir)
+    still = {(task, ev, part) for task, ev, part, *_ in regressions(base, again, tolerance, floor)}
+    return [(task, ev, part, before, min(now, again['results'][task][ev][part]))
+            for task, ev, part, before, now in slower if (task, ev, part) in still]
+
+
+def print_results(entry):
+    print(f"{'task':15s} {'event':18s} {'n':>5s} " + " ".join(f"{p:>9s}" for p in PARTS) + "  (median us)")
+    for task, events in entry['results'].items():
+        for ev, stats in events.items():
+            print(f"{task:15s} {ev:18s} {stats['n']:5d} " + " ".join(f"{stats[p]:9.1f}" for p in PARTS))
+
+
+def parse_args(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="headless per event overhead of each task")
+    parser.add_argument('--tasks', nargs='+', help="task classes to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of each task's schedule")
+    parser.add_argument('--seed', type=int, default=0, help="for generated schedules")
+    parser.add_argument('--externals', choices=['quiet', 'file'], default='quiet',
+                        help="'file' times the FileLogger write path too")
+    parser.add_argument('--history', default=HISTORY, help="json history to append to and compare against")
+    parser.add_argument('--no-save', action='store_true', help="compare but don't append to history")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="slower than this times the baseline is a regression")
+    parser.add_argument('--floor', type=float, default=10, help="and slower by more than this many microseconds")
+    parser.add_argument('--baseline', type=int, default=5, help="baseline is the median of this many recent history entries")
+    parser.add_argument('--check', action='store_true', help="exit 1 on regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=sys.argv[1:]):
+    import tempfile
+    # no display needed (or wanted): pyglet must not make its hidden window when psychopy.visual is imported
+    import pyglet
+    pyglet.options['shadow_window'] = False
+    args = parse_args(argv)
+    history = read_history(args.history)
+    base = baseline(history, args.baseline)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        entry = run_benchmarks(args.tasks, args.repeat, args.seed, args.externals, tmpdir)
+        print_results(entry)
+        slower = regressions(base, entry, args.tolerance, args.floor)
+        slower = confirm(slower, base, args.repeat, args.seed, args.externals, tmpdir,
+                         args.tolerance, args.floor)
+    for task, ev, part, before, now in slower:
+        print(f"REGRESSION: {task} {ev} {part}: {before:.1f}us => {now:.1f}us")
+    if not args.no_save:
+        append_history(args.history, entry)
+        print(f"appended to {args.history} ({len(history) + 1} entries)")
+    if args.check and slower:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
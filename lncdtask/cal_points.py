@@ -6,7 +6,7 @@ except ImportError:
 import numpy as np
 import pandas as pd
 import psychopy.core
-from psychopy import event
+from psychopy import event, visual
 
 
 def cpos(i, mx):
@@ -47,6 +47,8 @@ def gen_dots(rows=3, cols=3):
 class ArrCal(LNCDTask):
     """
     show dot at calibration points
+    grid (gray dots, numbers, usage) is drawn once into a BufferImageStim (see make_panel).
+    each keypress draws that and only the highlighted point. cost doesn't grow with rows*cols
     """
     def __init__(self, *karg, **kargs):
         """
@@ -62,38 +64,54 @@ class ArrCal(LNCDTask):
         # events
         self.add_event_type('dot', self.dot, ['dot_i'])
 
-        self.rows = 3
-        self.cols = 3
+        self.set_grid(3, 3)
+
+    def set_grid(self, rows, cols):
+        """change the calibration grid. panel is remade on next dot()"""
+        self.rows = rows
+        self.cols = cols
         self.dot_pos = gen_dots(self.rows, self.cols)
+        self.panel = None
+
+    def make_stims(self):
+        """window changed (see LNCDTask.attach): panel and labels need to be remade"""
+        super().make_stims()
+        self.panel = None
+
+    def make_panel(self):
+        """
+        gray dots, their numbers, and usage drawn once and captured from the back buffer.
+        also keeps a label per point and pixel positions for the highlight
+        """
+        (w, h) = self.win.size
+        self.dot_pix = [(x * w/2, y * h/2) for x, y in self.dot_pos]
+        self.labels = [visual.TextStim(self.win, text=str(i+1), pos=xy, color='black',
+                                       bold=True, name=f'cal_label_{i+1}')
+                       for i, xy in enumerate(self.dot_pos)]
+        usage = visual.TextStim(self.win, text="esc/q. #, space, arrow. enter to use",
+                                pos=(-.5, -.9), height=.05, color='gray', name='cal_usage')
+
+        self.win.clearBuffer()
+        usage.draw()
+        for i in range(len(self.dot_pos)):
+            self.draw_dot(i)
+        self.panel = visual.BufferImageStim(self.win, name='cal_panel')
+        self.win.clearBuffer()
+        self.panel_for = tuple(self.win.size)
 
     def draw_dot(self, i, color='gray'):
-        x = self.dot_pos[i][0]
-        y = self.dot_pos[i][1]
-        self.crcl.pos = (x * self.win.size[0]/2,
-                         y * self.win.size[1]/2)
+        self.crcl.pos = self.dot_pix[i]
         self.crcl.size = (1, 1)
         self.crcl.color = color
         self.crcl.draw()
-        self.msgbox.pos = (x, y)
-        self.msgbox.color = 'black'
-        self.msgbox.text = str(i+1)
-        self.msgbox.draw()
-
-    def usage(self):
-        self.msgbox.unit = 'pix'
-        self.msgbox.pos = (-.5, -.9)
-        self.msgbox.height = .05
-        self.msgbox.color = 'gray'
-        self.msgbox.text = "esc/q. #, space, arrow. enter to use"
-        self.msgbox.draw()
+        self.labels[i].draw()
 
     def dot(self, dot_i=0, used=False):
-        """all dots in gray. primary in yellow"""
+        """all dots in gray (cached panel). primary in yellow"""
         self.trialnum = self.trialnum + 1
-        self.usage()  # show instruction menu
-        # draw all circles in gray
-        for i in range(len(self.dot_pos)):
-            self.draw_dot(i)
+        if self.panel is None or self.panel_for != tuple(self.win.size):
+            self.make_panel()
+        self.panel.draw()
         # current in yellow
         color = 'red' if used else 'yellow'
         self.draw_dot(dot_i, color)
@@ -138,8 +156,7 @@ if __name__ == "__main__":
 
     dot_i = 0  # 0 to 9
     while True:
-        # print instruction text text on bottom
-        eyecal.msgbox.draw()
+        # instruction text on bottom is part of the cached panel
         # print(dot_i)
         eyecal.dot(dot_i)
         key = event.waitKeys()
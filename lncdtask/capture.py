@@ -0,0 +1,170 @@
+"""
+screenshots without stalling the next flip.
+the task thread only copies the framebuffer into a reusable buffer (glReadPixels).
+a worker thread hashes, dedups (identical frames are written once), and png encodes.
+every grab is reported (on_saved callback and/or poll()) once its file is on disk.
+the worker is a daemon thread: close_all (also run at exit) writes anything still queued
+"""
+import atexit
+import weakref
+import hashlib
+import os
+import queue
+import shutil
+import threading
+from collections import deque
+from time import perf_counter
+import numpy as np
+from PIL import Image
+
+
+class FrameCapture():
+    """
+    :param saveto: directory for png files
+    :param on_saved: called on the worker thread with (path, grab_time, name) once path is written.
+                     for things that aren't thread safe (pylink), use poll() from the task thread instead
+    :param max_pending: frames waiting to be encoded. grab waits for a free buffer past this
+
+    unnamed frames are saved as <prefix>_<hash>.png (content addressed: the same stimulus is one file,
+    even across runs). a repeat is reported with the existing file, not encoded again.
+    named frames are <name>.png, copied from an identical earlier frame when there is one
+
+    >>> import tempfile
+    >>> cap = FrameCapture(tempfile.mkdtemp())
+    >>> frame = np.zeros((4, 6, 3), dtype=np.uint8)
+    >>> cap.submit(frame, 1.0); cap.submit(frame, 2.0); cap.flush()
+    >>> [(os.path.basename(p), t) for p, t, name in cap.poll()]
+    [('frame_8e9264a70abb15b6d8958b422fc7ed48.png', 1.0), ('frame_8e9264a70abb15b6d8958b422fc7ed48.png', 2.0)]
+    >>> cap.n_dups
+    1
+    """
+    def __init__(self, saveto='screenshots', on_saved=None, max_pending=8, prefix='frame'):
+        self.saveto = saveto
+        self.on_saved = on_saved
+        self.prefix = prefix
+        self.max_pending = max_pending
+        self.buffers = {}              # shape => list of free buffers
+        self.n_buffers = 0
+        self.free = threading.Condition()
+        self.todo = queue.Queue()
+        self.saved = deque()           # (path, grab_time, name) not yet poll()ed
+        self.seen = {}                 # hash => path
+        self.n_dups = 0
+        self.worker = None
+        OPEN.add(self)
+
+    def start(self):
+        if self.worker is None or not self.worker.is_alive():
+            os.makedirs(self.saveto, exist_ok=True)
+            self.worker = threading.Thread(target=self.work, name="frame-capture", daemon=True)
+            self.worker.start()
+
+    def buffer(self, shape):
+        """a free buffer of shape. reuses encoded frames' buffers, waits if max_pending are in use"""
+        with self.free:
+            while True:
+                free = self.buffers.setdefault(shape, [])
+                if free:
+                    return free.pop()
+                if self.n_buffers < self.max_pending:
+                    self.n_buffers += 1
+                    return np.empty(shape, dtype=np.uint8)
+                self.free.wait()
+
+    def release(self, buf):
+        with self.free:
+            self.buffers.setdefault(buf.shape, []).append(buf)
+            self.free.notify()
+
+    def grab(self, win, t=None, name=None, buffer='back'):
+        """
+        copy win's framebuffer (back: what the next flip will show) and queue it for encoding.
+        t is when it will be/was on screen (default now, time.perf_counter)
+        """
+        from pyglet import gl
+        t = perf_counter() if t is None else t
+        w, h = [int(x) for x in getattr(win, 'frameBufferSize', win.size)]
+        buf = self.buffer((h, w, 3))
+        gl.glReadBuffer(gl.GL_BACK if buffer == 'back' else gl.GL_FRONT)
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+        gl.glReadPixels(0, 0, w, h, gl.GL_RGB, gl.GL_UNSIGNED_BYTE,
+                        buf.ctypes.data_as(gl.POINTER(gl.GLubyte)))
+        self.start()
+        self.todo.put((buf, t, name, True))
+
+    def submit(self, frame, t, name=None):
+        """queue an already captured (h, w, 3) frame (bottom row first, like glReadPixels)"""
+        self.start()
+        self.todo.put((frame, t, name, False))
+
+    def work(self):
+        while True:
+            item = self.todo.get()
+            if item is None:
+                self.todo.task_done()
+                return
+            frame, t, name, pooled = item
+            try:
+                self.save(frame, t, name)
+            except Exception as err:
+                print(f"WARNING: screenshot failed: {err}")
+            finally:
+                if pooled:
+                    self.release(frame)
+                self.todo.task_done()
+
+    def save(self, frame, t, name):
+        digest = hashlib.blake2b(frame, digest_size=16).hexdigest()
+        have = self.seen.get(digest)
+        path = os.path.join(self.saveto, f"{name or self.prefix + '_' + digest}.png")
+        if have is not None:
+            self.n_dups += 1
+            if name is None:
+                path = have
+            elif have != path:
+                shutil.copyfile(have, path)
+        elif not os.path.exists(path) or name is not None:
+            # gl rows are bottom up
+            Image.fromarray(frame[::-1]).save(path)
+        self.seen.setdefault(digest, path)
+        self.saved.append((path, t, name))
+        if self.on_saved is not None:
+            self.on_saved(path, t, name)
+
+    def poll(self):
+        """saved (path, grab_time, name) since the last poll. call from the task thread"""
+        done = []
+        while self.saved:
+            done.append(self.saved.popleft())
+        return done
+
+    def flush(self):
+        """wait for everything grabbed so far to be written"""
+        self.todo.join()
+
+    def close(self):
+        """write what's queued and stop the worker. grab/submit start it again"""
+        if self.worker is not None and self.worker.is_alive():
+            self.todo.put(None)
+            self.worker.join()
+
+
+#: every FrameCapture not yet garbage collected. see close_all
+OPEN = weakref.WeakSet()
+
+
+@atexit.register
+def close_all():
+    """finish every queued screenshot. daemon workers would otherwise die with them unwritten"""
+    for cap in list(OPEN):
+        cap.close()
+
+
+#: saveto directory => FrameCapture. see screen.take_screenshot
+CAPTURES = {}
+
+
+def capture_for(saveto):
+    if saveto not in CAPTURES:
+        CAPTURES[saveto] = FrameCapture(saveto)
+    return CAPTURES[saveto]
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+DollarReward MR design search. python version of timing/mk_timing.bash + best_timing.R + timing_to_txt.R
+
+ 1. random trial order: full (ring, prep, dot), catch1 (ring), catch2 (ring, prep) x (neu, rew)
+    with decaying (exponential) ITIs filling the run
+ 2. convolve events with a canonical (double gamma) HRF, sample at each TR
+ 3. score: summed normalized std. dev. of the contrasts best_timing.R ranked on. lower is better
+ 4. search many seeds across all cores. keep the top N
+ 5. write the winners as TSVs that dollarreward.read_timing_tr_independent reads
+
+USAGE:
+  python lncdtask/design.py --n 100000 --top 6 --outdir timing/dollarreward
+"""
+import heapq
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+try:
+    from trial_shuffle import constrained_order
+except ImportError:
+    from lncdtask.trial_shuffle import constrained_order
+
+#: defaults from timing/mk_timing.bash (TOTAL_RUNTIME=304.2, N_EA_TYPE=16)
+DESIGN = {
+    'tr': 1.3,
+    'total_runtime': 304.2,
+    'pre_rest': 4,
+    'event_dur': 1.5,    # ring, prep, and dot are each this long
+    'n_full': 16,        # per ring type (neu, rew)
+    'n_catch1': 5,       # per ring type. ring only (N_RING_C1, _c1)
+    'n_catch2': 2,       # per ring type. ring and prep, no dot (N_PREP_C2, _c2)
+    'iti_min': 1.5,
+    'iti_max': 15,
+    'max_catch_run': 2,  # no more than this many catch trials in a row
+    'max_class_run': 2,  # same trial type and ring type in a row (-max_consec 2 on the ring classes)
+    'max_side_run': 3,   # no more than this many dots on the same side in a row (without a catch between)
+    'positions': {'left': [7, 214], 'right': [426, 633]},  # eprime 640 wide
+}
+
+TRIAL_TYPES = ['full', 'catch1', 'catch2']
+TRIAL_EVENTS = {'full': ['ring', 'prep', 'dot'], 'catch1': ['ring'], 'catch2': ['ring', 'prep']}
+RING_TYPES = ['neu', 'rew']
+#: regressor order in the design matrix
+REGRESSORS = ['neu_ring', 'rew_ring', 'neu_prep', 'rew_prep', 'neu_dot', 'rew_dot']
+#: contrasts ranked on in best_timing.R. weights on REGRESSORS
+CONTRASTS = {
+    'Neu_Cue':   [1, 0, 0, 0, 0, 0],
+    'Neu_Prep':  [0, 0, 1, 0, 0, 0],
+    'Neu_Stim':  [0, 0, 0, 0, 1, 0],
+    'Diff_Cue':  [1, -1, 0, 0, 0, 0],
+    'Diff_Prep': [0, 0, 1, -1, 0, 0],
+    'Diff_Stim': [0, 0, 0, 0, 1, -1],
+}
+
+
+def gamma_pdf(t, shape):
+    t = np.clip(t, 0, None)
+    return t**(shape - 1) * np.exp(-t) / math.gamma(shape)
+
+
+@lru_cache()
+def hrf_response(dur, dt=.05, length=32):
+    """
+    canonical double gamma HRF (SPM: peak 6s, undershoot 16s, 1/6 ratio) convolved with a dur second boxcar
+    returns (times, response) for np.interp
+    """
+    t = np.arange(0, length, dt)
+    hrf = gamma_pdf(t, 6) - gamma_pdf(t, 16)/6
+    resp = np.convolve(hrf, np.ones(int(round(dur/dt))))[:len(t)] * dt
+    return t, resp / resp.max()
+
+
+def capped_shares(w, total, cap):
+    """
+    split total proportional to w with no share over cap: capped shares' excess goes to the rest (in proportion)
+    >>> capped_shares(np.array([1., 1., 8.]), 10, 4).tolist()
+    [3.0, 3.0, 4.0]
+    """
+    if total > cap * len(w):
+        raise ValueError(f"{total} does not fit in {len(w)} shares of at most {cap}")
+    share = total * w / w.sum()
+    fixed = np.zeros(len(w), dtype=bool)
+    # each pass caps at least one more share: at most len(w) passes
+    for _ in range(len(w)):
+        over = share > cap
+        if not over.any():
+            break
+        fixed |= over
+        share[fixed] = cap
+        free = ~fixed
+        share[free] = (total - cap * fixed.sum()) * w[free] / w[free].sum()
+    return share
+
+
+def generate(rng, params=DESIGN):
+    """
+    one random design. returns dictionary of per trial arrays:
+      trial_type (index into TRIAL_TYPES), ring (index into RING_TYPES),
+      onset (trial start), iti (rest after), position (640 wide eprime, -1 for catch)
+    """
+    p = params
+    counts = [p['n_full'], p['n_catch1'], p['n_catch2']]
+    trial_type = np.repeat(np.tile([0, 1, 2], 2), counts * 2)
+    ring = np.repeat([0, 1], sum(counts))
+
+    # dot side balanced within ring type (ring is blocked, so alternating splits each evenly)
+    full = np.flatnonzero(trial_type == 0)
+    side_of = np.full(len(trial_type), -1)
+    side_of[full] = np.arange(len(full)) % 2
+
+    # order in one pass: catch trials not clumped, no trial class (type x ring) more than max_class_run
+    # in a row, and dots not on one side more than max_side_run in a row (catch trials, side -1, are uncapped)
+    order = constrained_order({'catch': trial_type > 0, 'class': trial_type * 2 + ring, 'side': side_of},
+                              {'catch': {True: p['max_catch_run']}, 'class': p['max_class_run'],
+                               'side': {0: p['max_side_run'], 1: p['max_side_run']}}, rng=rng)
+    trial_type, ring, side_of = trial_type[order], ring[order], side_of[order]
+
+    # decaying ITI: min + exponential. scaled to fill the run, none longer than iti_max
+    n_events = np.array([len(TRIAL_EVENTS[t]) for t in TRIAL_TYPES])[trial_type]
+    task_time = n_events.sum() * p['event_dur']
+    # last iti is time before the end marker (which is shown for event_dur)
+    extra = p['total_runtime'] - p['pre_rest'] - task_time - p['event_dur'] - len(trial_type) * p['iti_min']
+    if extra < 0:
+        raise ValueError(f"{p['total_runtime']}s is not enough time for {len(trial_type)} trials")
+    iti = p['iti_min'] + capped_shares(rng.exponential(1, len(trial_type)), extra, p['iti_max'] - p['iti_min'])
+    trial_dur = n_events * p['event_dur'] + iti
+    onset = p['pre_rest'] + np.concatenate([[0], np.cumsum(trial_dur)[:-1]])
+
+    # position balanced within side
+    position = np.full(len(trial_type), -1)
+    full = np.flatnonzero(trial_type == 0)
+    side = side_of[full]
+    for s, name in enumerate(['left', 'right']):
+        is_s = np.flatnonzero(side == s)
+        opts = p['positions'][name]
+        position[full[is_s]] = rng.permutation(np.arange(len(is_s)) % len(opts)).choose(opts)
+
+    return {'trial_type': trial_type, 'ring': ring, 'onset': onset, 'iti': iti, 'position': position}
+
+
+def event_onsets(trials, params=DESIGN):
+    """onset and regressor index (into REGRESSORS) for every ring, prep, and dot"""
+    tt, ring, onset = trials['trial_type'], trials['ring'], trials['onset']
+    dur = params['event_dur']
+    has_prep = tt != 1
+    has_dot = tt == 0
+    onsets = np.concatenate([onset, onset[has_prep] + dur, onset[has_dot] + 2*dur])
+    reg = np.concatenate([ring, 2 + ring[has_prep], 4 + ring[has_dot]])
+    return onsets, reg
+
+
+def design_matrix(trials, params=DESIGN, polort=2):
+    """
+    task regressors (HRF convolved, one column per REGRESSORS) sampled at each TR
+    plus polynomial drift (polort, like 3dDeconvolve)
+    """
+    n_vols = int(params['total_runtime'] // params['tr'])
+    vol_times = np.arange(n_vols) * params['tr']
+    onsets, reg = event_onsets(trials, params)
+    t, resp = hrf_response(params['event_dur'])
+    # every event's response at every volume, then summed into its regressor
+    ev_resp = np.interp(vol_times[None, :] - onsets[:, None], t, resp, left=0, right=0)
+    one_hot = np.zeros((len(REGRESSORS), len(onsets)))
+    one_hot[reg, np.arange(len(onsets))] = 1
+    task = (one_hot @ ev_resp).T
+    drift = np.polynomial.legendre.legvander(np.linspace(-1, 1, n_vols), polort)
+    return np.hstack([task, drift])
+
+
+def score_design(X):
+    """
+    (score, max VIF). score is the summed norm. std. dev. of CONTRASTS (sqrt(c (X'X)^-1 c')).
+    lower is better. VIF of each task regressor from the others
+    """
+    n_task = len(REGRESSORS)
+    xtx_inv = np.linalg.inv(X.T @ X)
+    c = np.zeros((len(CONTRASTS), X.shape[1]))
+    c[:, :n_task] = list(CONTRASTS.values())
+    score = np.sqrt(np.einsum('ij,jk,ik->i', c, xtx_inv, c)).sum()
+
+    task = X[:, :n_task]
+    corr = np.corrcoef(task, rowvar=False)
+    vif = np.diag(np.linalg.inv(corr))
+    return score, vif.max()
+
+
+def evaluate(seed, params=DESIGN):
+    """score for the design made by seed. (score, max_vif, seed)"""
+    trials = generate(np.random.default_rng(seed), params)
+    score, vif = score_design(design_matrix(trials, params))
+    return float(score), float(vif), seed
+
+
+def search_seeds(seeds, params=DESIGN, top_n=6, max_vif=5):
+    """best top_n (score, max_vif, seed) of seeds. designs with VIF over max_vif are dropped"""
+    scored = (evaluate(seed, params) for seed in seeds)
+    return heapq.nsmallest(top_n, (s for s in scored if s[1] <= max_vif))
+
+
+def search(n, start_seed=0, params=DESIGN, top_n=6, max_vif=5, n_jobs=None, chunksize=2000):
+    """
+    score n designs (seeds start_seed to start_seed+n) on n_jobs processes (default: all cores)
+    returns top_n [(score, max_vif, seed)]. regenerate a winner with generate(np.random.default_rng(seed))
+    """
+    chunks = [range(i, min(i + chunksize, start_seed + n))
+              for i in range(start_seed, start_seed + n, chunksize)]
+    if n_jobs == 1:
+        results = [search_seeds(c, params, top_n, max_vif) for c in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(search_seeds, chunks,
+                                    [params]*len(chunks), [top_n]*len(chunks), [max_vif]*len(chunks)))
+    return heapq.nsmallest(top_n, (best for chunk in results for best in chunk))
+
+
+def to_onset_df(trials, params=DESIGN):
+    """
+    rows like timing/dollarreward/*.tsv: onset event_name ring_type position
+    rest at the start, an 'iti' row after each trial, and an end marker
+    """
+    rows = [(0, 'iti', 'iti', None)]
+    dur = params['event_dur']
+    for tt, ring, onset, iti, pos in zip(trials['trial_type'], trials['ring'], trials['onset'],
+                                         trials['iti'], trials['position']):
+        events = TRIAL_EVENTS[TRIAL_TYPES[tt]]
+        pos = None if pos < 0 else int(pos)
+        for i, ev in enumerate(events):
+            rows.append((onset + i*dur, ev, RING_TYPES[ring], pos))
+        rows.append((onset + len(events)*dur, 'iti', 'iti', None))
+    rows.append((params['total_runtime'] - dur, 'iti', None, None))
+    df = pd.DataFrame(rows, columns=['onset', 'event_name', 'ring_type', 'position'])
+    df['onset'] = df.onset.round(2)
+    df['position'] = df.position.astype('Int64')
+    return df
+
+
+def write_tsv(onset_df, fname):
+    """tab separated with NA for missing. see dollarreward.read_timing_tr_independent"""
+    onset_df.to_csv(fname, sep="\t", index=False, na_rep="NA")
+
+
+def parse_args(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='search for efficient DollarReward MR designs')
+    parser.add_argument('--n', type=int, default=100000, help='number of random designs to score')
+    parser.add_argument('--start_seed', type=int, default=0, help='first seed. seeds are start_seed to start_seed+n')
+    parser.add_argument('--top', type=int, default=6, help='how many designs to keep')
+    parser.add_argument('--max_vif', type=float, default=5, help='drop designs with any regressor VIF above this')
+    parser.add_argument('--jobs', type=int, default=None, help='processes to use. default all cores')
+    parser.add_argument('--outdir', type=str, default='timing/dollarreward', help='where to write tsv files')
+    return parser.parse_args(argv)
+
+
+def main():
+    import sys
+    parsed = parse_args(sys.argv[1:])
+    best = search(parsed.n, parsed.start_seed, top_n=parsed.top, max_vif=parsed.max_vif, n_jobs=parsed.jobs)
+    os.makedirs(parsed.outdir, exist_ok=True)
+    for score, vif, seed in best:
+        fname = os.path.join(parsed.outdir, f"dollar_reward_noTR_{DESIGN['total_runtime']}_{seed}.tsv")
+        write_tsv(to_onset_df(generate(np.random.default_rng(seed))), fname)
+        print(f"{fname}\tscore={score:.4f}\tmax_vif={vif:.2f}")
+
+
+if __name__ == "__main__":
+    main()
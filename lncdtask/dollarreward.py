@@ -1,19 +1,27 @@
 #!/usr/bin/env python3
 try:
-    from lncdtask import LNCDTask, create_window, replace_img, wait_for_scanner,\
+    from lncdtask import LNCDTask, create_window, wait_for_scanner,\
         ExternalCom, FileLogger, Participant, RunDialog,\
-        wait_until, shuf_for_ntrials
+        wait_until, IMAGES
 except ImportError as e:
     print(e)
-    from lncdtask.lncdtask import LNCDTask, create_window, replace_img, wait_for_scanner,\
+    from lncdtask.lncdtask import LNCDTask, create_window, wait_for_scanner,\
         ExternalCom, FileLogger, Participant, RunDialog, \
-        wait_until, shuf_for_ntrials
+        wait_until, IMAGES
+
+try:
+    import design
+    from session import SessionPlan
+except ImportError:
+    from lncdtask import design
+    from lncdtask.session import SessionPlan
 
 from psychopy import misc, visual
 import numpy as np
 import pandas as pd
-from math import floor, ceil
+from math import ceil
 import os
+import hashlib
 import psychopy
 
 # this is defined by enviromental variable
@@ -34,34 +42,143 @@ def eppos2relpos(x, orig_width=800):
     return (x-half_width)/half_width
 
 
+#: columns in the eprime extracted timing file (no header)
+EPRIME_COLS = ["run", "epevent", "position640", "ring_type", "event_name"]
+
+# parsed timing files (keyed on path and mtime) and ready to run onset_dfs made from them
+_TIMING_COLUMNS = {}
+_TIMING_DFS = {}
+
+
+def default_cache_dir():
+    """
+    per user cache, not next to the timing files (those are in the repo):
+    env LNCDTASK_CACHE, else %LOCALAPPDATA%/lncdtask or $XDG_CACHE_HOME (~/.cache)/lncdtask
+    """
+    if env := os.environ.get('LNCDTASK_CACHE'):
+        return env
+    base = os.environ.get('LOCALAPPDATA') if os.name == 'nt' else os.environ.get('XDG_CACHE_HOME')
+    return os.path.join(base or os.path.join(os.path.expanduser('~'), '.cache'), 'lncdtask')
+
+
+#: where parsed timing files are cached (see timing_columns). None to not cache on disk
+TIMING_CACHE_DIR = default_cache_dir()
+
+
+def timing_cache_path(path):
+    """
+    npz cache for (absolute) path in TIMING_CACHE_DIR: fname-<path hash>.npz
+    the hash keeps same named files in different directories apart
+    """
+    digest = hashlib.blake2b(path.encode(), digest_size=8).hexdigest()
+    return os.path.join(TIMING_CACHE_DIR, f"{os.path.basename(path)}-{digest}.npz")
+
+
+def read_timing_cache(path, mtime):
+    """columns from the npz cache. None if missing or made from a different version of path"""
+    if TIMING_CACHE_DIR is None:
+        return None
+    cache = timing_cache_path(path)
+    if not os.path.exists(cache):
+        return None
+    try:
+        with np.load(cache) as npz:
+            if str(npz['_path']) != path or int(npz['_mtime']) != mtime:
+                return None
+            cols = {}
+            for name in npz['_cols']:
+                col = npz[name]
+                na = npz.get(name + '__na')
+                if na is not None:
+                    col = col.astype(object)
+                    col[na] = np.nan
+                cols[str(name)] = col
+            return cols
+    except Exception as e:
+        print(f"WARNING: ignoring timing cache {cache}: {e}")
+        return None
+
+
+def write_timing_cache(path, mtime, cols):
+    """save columns without pickle: strings as unicode arrays plus a missing value mask"""
+    arrays = {'_path': np.array(path), '_mtime': np.array(mtime), '_cols': np.array(list(cols))}
+    for name, col in cols.items():
+        if col.dtype == object:
+            na = pd.isna(col)
+            arrays[name + '__na'] = na
+            col = np.where(na, '', col).astype(str)
+        arrays[name] = col
+    if TIMING_CACHE_DIR is None:
+        return
+    try:
+        os.makedirs(TIMING_CACHE_DIR, exist_ok=True)
+        with open(timing_cache_path(path), 'wb') as f:
+            np.savez(f, **arrays)
+    except OSError as e:
+        print(f"WARNING: cannot write timing cache: {e}")
+
+
+def timing_columns(fname, names=None):
+    """
+    tab separated timing file as a dictionary of numpy column arrays.
+    parsed at most once per session. on disk, cached in TIMING_CACHE_DIR (keyed on path and mtime)
+    so a warm cache skips pd.read_csv entirely.
+    :param names: column names if the file has no header (see EPRIME_COLS)
+    """
+    if not os.path.exists(fname):
+        raise Exception(f"cannot find timing file! '{fname}'")
+    path = os.path.abspath(fname)
+    mtime = os.stat(path).st_mtime_ns
+    key = (path, mtime)
+    cols = _TIMING_COLUMNS.get(key)
+    if cols is not None:
+        return cols
+
+    cols = read_timing_cache(path, mtime)
+    if cols is None:
+        df = pd.read_csv(fname, sep="\t", header=None if names else 'infer', names=names)
+        cols = {name: df[name].to_numpy(dtype=None if pd.api.types.is_numeric_dtype(df[name]) else object)
+                for name in df.columns}
+        write_timing_cache(path, mtime, cols)
+    _TIMING_COLUMNS[key] = cols
+    return cols
+
+
 def read_timing(run_num, fname="dollar_reward_events.txt", n_start_iti=3, tr=1.5):
     """
     read in timing extracted from eprime1 .es file
+    file is parsed once (see timing_columns). each run's onset_df is built once and copied out
     """
-    if not os.path.exists(fname):
-        raise Exception(f"cannot find eprime timing file! '{fname}'")
     print(fname)
-    ep_df = pd.read_csv(fname,sep="\t", header=None)
-    ep_df.columns=["run","epevent","position640", "ring_type","event_name"]
-    ep_df['position'] = eppos2relpos(ep_df.position640, 640)
-    ep_df = ep_df[ep_df.run==run_num].reset_index()
-    start_fix = pd.DataFrame({'event_name':['iti']*n_start_iti})
-    onset_df = pd.concat([start_fix, ep_df])
-    onset_df['onset'] = [x*tr for x in range(len(onset_df))]
-    return onset_df
+    cols = timing_columns(fname, EPRIME_COLS)
+    key = (os.path.abspath(fname), run_num, n_start_iti, tr)
+    (made_from, onset_df) = _TIMING_DFS.get(key, (None, None))
+    if made_from is not cols:
+        idx = np.flatnonzero(cols['run'] == run_num)
+        ep_df = pd.DataFrame({'index': idx, **{name: cols[name][idx] for name in EPRIME_COLS}})
+        ep_df['position'] = eppos2relpos(ep_df.position640, 640)
+        start_fix = pd.DataFrame({'event_name': ['iti']*n_start_iti})
+        onset_df = pd.concat([start_fix, ep_df], ignore_index=True)
+        onset_df['onset'] = np.arange(len(onset_df)) * tr
+        _TIMING_DFS[key] = (cols, onset_df)
+    # run() changes onsets in place. dont hand out the cached one
+    return onset_df.copy()
 
 
 def read_timing_tr_independent(fname):
     """
     timing that is not tr locked -- entirely specified by csv
+    columns: onset event_name ring_type position. parsed once (see timing_columns)
     """
-    if not os.path.exists(fname):
-        raise Exception(f"cannot find non-tr locked timing file! '{fname}'")
     print(fname)
-    df = pd.read_csv(fname, sep="\t")
-    print(df)
-    df['position'] = eppos2relpos(df.position, 640)
-    return df
+    cols = timing_columns(fname)
+    key = (os.path.abspath(fname), 'tr_independent')
+    (made_from, df) = _TIMING_DFS.get(key, (None, None))
+    if made_from is not cols:
+        df = pd.DataFrame(dict(cols))
+        df['position'] = eppos2relpos(df.position, 640)
+        _TIMING_DFS[key] = (cols, df)
+    return df.copy()
 
 def ttl_wrap(code):
     """
@@ -75,6 +192,23 @@ def ttl_wrap(code):
         #print(f"code: {code} from {einfo}")
     return code
 
+def event_messages(onset_df):
+    """
+    what each event will send to externals (see DollarReward.ring, prep, dot, iti).
+    trial number counts rings. ring's trial number goes to eyelink's trial_start, not the message
+    >>> event_messages(pd.DataFrame({'event_name': ['iti', 'ring', 'prep', 'dot'],
+    ...                              'ring_type': ['iti', 'rew', 'rew', 'rew'], 'position': [None, .5, .5, .5]}))
+    ['iti', 'ring rew 0.5', '1 cue rew 0.5', '1 dot rew 0.5']
+    """
+    names = onset_df.event_name.tolist()
+    trials = (onset_df.event_name == 'ring').cumsum().tolist()
+    rews = onset_df.ring_type.tolist()
+    positions = onset_df.position.tolist()
+    fmt = {'ring': "ring {1} {2}", 'prep': "{0} cue {1} {2}", 'dot': "{0} dot {1} {2}"}
+    return [fmt[name].format(trial, rew, pos) if name in fmt else name
+            for name, trial, rew, pos in zip(names, trials, rews, positions)]
+
+
 def ttl(trial, event=None, rew=None, pos=None):
     """
     input is same as what is given to flip_at
@@ -148,21 +282,12 @@ class DollarReward(LNCDTask):
         """
         super().__init__(*karg, **kargs)
 
-        # extra stims/objects, exending base LNCDTask class
-        self.ringimg = {}
         self.dotsize_edge = .15 # part of hack to get circle size
-        self.make_ring()
+        self.img_percents.append(self.dotsize_edge)
         self.trialnum = 0
         
         # eyelink setup
         self.eyelink = None
-        
-        self.ringpng = {
-            'rew': visual.ImageStim(self.win, name="ringrew", interpolate=True, image='images/dollarRing.png'),
-            'neu': visual.ImageStim(self.win, name="ringneu", interpolate=True, image='images/neutralRing.png')
-        }
-
-        self.instructionpng = visual.ImageStim(self.win, name="instruct", interpolate=True, image='images/instructions.png')
 
         # events
         self.add_event_type('ring', self.ring, ['onset','ring_type','position'])
@@ -170,6 +295,31 @@ class DollarReward(LNCDTask):
         self.add_event_type('dot', self.dot, ['onset','ring_type','position'])
         self.add_event_type('iti', self.iti, ['onset'])
 
+    def make_stims(self):
+        """extra stims/objects, exending base LNCDTask class. see LNCDTask.attach"""
+        super().make_stims()
+        self.ringimg = {}
+        self.make_ring()
+
+        # decoded once per session, uploaded once per window. see imagecache.py
+        self.ringpng = {
+            'rew': IMAGES.stim(self.win, 'images/dollarRing.png', name="ringrew", interpolate=True),
+            'neu': IMAGES.stim(self.win, 'images/neutralRing.png', name="ringneu", interpolate=True)
+        }
+        self.instructionpng = {
+            slide: IMAGES.stim(self.win, f'images/{slide}.png', name="instruct", interpolate=True)
+            for slide in ['instruction_1', 'instructions']}
+
+    def event_messages(self):
+        """ring, cue, and dot messages as composed by flip_at (see module event_messages)"""
+        return event_messages(self.onset_df)
+
+    def reset(self, onset_df=None, externals=None):
+        """next run on the same window. see LNCDTask.reset"""
+        super().reset(onset_df, externals)
+        self.trialnum = 0
+        self.eyelink = None
+
     # -- drawing functions
     def ring(self, onset, ring_type, position=None):
         """ display ring: reward or neutral """
@@ -192,9 +342,8 @@ class DollarReward(LNCDTask):
         """position dot on horz axis to cue anti saccade
         position is from -1 to 1
         """
-        # hack to get dot size
-        imgpos = replace_img(self.img, None, position, self.dotsize_edge)
-        self.crcl.pos = imgpos
+        # hack to get dot size: where replace_img would put a dotsize_edge image
+        self.crcl.pos = self.geometry.img_pos(position, self.dotsize_edge)
         self.crcl.size=(1,1) # TODO: needed in newer versions of psychopy? why?
         self.crcl.draw()
         #print(f"CIRCLE INFO:\n{self.crcl}")
@@ -202,13 +351,11 @@ class DollarReward(LNCDTask):
 
     def get_ready(self, triggers=['equal']):
         "flip the two instruction png, wait for the scanner trigger"
-        self.instructionpng.image = 'images/instruction_1.png'
-        self.instructionpng.draw()
+        self.instructionpng['instruction_1'].draw()
         self.win.flip()
         psychopy.event.waitKeys()
         print("Waiting for scanner")
-        self.instructionpng.image = 'images/instructions.png'
-        self.instructionpng.draw()
+        self.instructionpng['instructions'].draw()
         self.win.flip()
         psychopy.event.waitKeys(keyList=triggers)
 
@@ -254,53 +401,15 @@ class DollarReward(LNCDTask):
                 elementMask=None,
                 elementTex=buff.image)
     
-    def generate_timing(n=40, dur=1.5, n_catch1=6, n_catch2=6):
+    @staticmethod
+    def generate_timing(seed=None):
         """
-        generate timing with catches for rew and neutral
-        not implemented, unfinished
+        random TR independent timing. same as read_timing_tr_independent would give for the tsv
+        see design.py (design.search) for finding an efficient seed
         """
-        n_catch = n_catch1 + n_catch2 # 12
-        n_full = n - n_catch          # 28
-        rew_type    = ['rew','neu']
-
-        positions = [-1,-.66,-.33,.33,.66,1]
-
-        # full trials. balence left/rigth and rew/neu
-        partition_size = floor(n_full/4) # TODO: warn if not even?
-        trial_list = []
-        for side in ['left','right']:
-            for rew in rew_type:
-                pos_opts = positions[0:3] if side == "left" else positions[3:]
-                pos_vec = shuf_for_ntrials(pos_opts, partition_size)
-                df = pd.DataFrame({'ring_type':rew, 'side': side, 'pos': pos_vec, 'trial_type':'full', 'dur': tr*3})
-                trial_list.append(df)
-
-        # catch trials
-        for ctype in ['catch1','catch2']:
-            n_thiscatch = n_catch1 if ctype=="catch1" else n_catch2
-            partition_size = n_thiscatch/2 # 3 for each reward type
-            dur = tr if ctype=="catch1" else tr*2
-            for rew in rew_type:
-                df = pd.DataFrame({'ring_type':rew, 'side': side, 'pos': pos_vec, 'trial_type': ctype})
-                trial_list.append(np.repeat(df.valuse,partition_size,axis=0))
-        
-        # break into events
-        # TODO: random extra fixations
-        events = { 'full': ['ring','prep','sac'],
-                   'catch1': ['ring','prep'],
-                   'catch2': ['ring']}
-        event_list = []
-        for i, row in pd.concat(trial_list).iterrows():
-            evs = events[row['trial_type']]
-            event_dict = row.to_dict()
-            event_dict.update({'event_names': evs + ['fix']})
-            print(event_dict)
-            df = pd.DataFrame(event_dict)
-            df['dur'] = tr
-            event_list.append(df)
-        
-        onset_df = pd.concat(event_list)
-        onset_df['onset'] = np.cumsum(onset_df.dur)
+        df = design.to_onset_df(design.generate(np.random.default_rng(seed)))
+        df['position'] = eppos2relpos(df.position.astype(float), 640)
+        return df
 
     def excersise(self):
        # exercise functions
@@ -373,6 +482,11 @@ def run_dollarreward(parsed):
         n_runs = 4
         read_file_func = lambda runnum: read_timing(runnum, fname="dollar_reward_events.txt")
 
+    # read and check every run now instead of while someone waits in the scanner
+    session = SessionPlan(read_file_func, n_runs, message_func=event_messages, ttl_func=ttl_wrap,
+                          events=['ring', 'prep', 'dot', 'iti'])
+    session.plan_all()
+
     # default settings change based on where we are
     # 1) screenhack for mr b/c something funny with win7+psychopy (gamma?) at MRRC
     # 2) only need '=' trigger for MR (scanner triggers task start)
@@ -403,7 +517,10 @@ def run_dollarreward(parsed):
 
     
 
-    # open a dialog and then a psychopy window for each run
+    # open a dialog for each run. one psychopy window and task for the session
+    win = None
+    win_opts = None  # (screenhack, fullscreen) win was made with
+    dr = None
     while run_info.run_num() <= n_runs:
         if not run_info.dlg_ok():
             break
@@ -411,38 +528,50 @@ def run_dollarreward(parsed):
         # update participant (logging info)
         if run_info.has_changed('subjid') or participant is None:
             participant = run_info.mk_participant(['DollarReward'])
-            
+            session.set_participant(participant, 'DR')
 
         run_num = run_info.run_num()
+        session.set_truncate(5 if run_info.info['truncated'] else None)
+        plan = session.get(run_num)
+
+        # window only remade if the dialog changed how it should be made
+        want_opts = (run_info.info['screenhack'], run_info.info['fullscreen'])
+        if win is None or want_opts != win_opts:
+            if win is not None:
+                IMAGES.forget(win)
+                win.close()
+            if run_info.info['screenhack']:
+                # pygame (default), pyglet (newer), glfw (experimental)
+                # MR res = [1024,768]
+                # fullscreen doesn't exist. goes into power saving mode
+                win = visual.Window([1024, 768])#, winType='pyglet')
+                win.winHandle.activate()  # make sure the display window has focus
+                win.mouseVisible = False  # and that we don't see the mouse
+                win.color = (-1, -1, -1)
+                win.flip()
+                win.flip()
+            else:
+                win = create_window(run_info.info['fullscreen'])
+            win_opts = want_opts
+        else:
+            win.winHandle.activate()  # focus back from the dialog
 
-        if run_info.info['screenhack']:
-            # pygame (default), pyglet (newer), glfw (experimental)
-            # MR res = [1024,768]
-            # fullscreen doesn't exist. goes into power saving mode
-            win = visual.Window([1024, 768])#, winType='pyglet')
-            win.winHandle.activate()  # make sure the display window has focus
-            win.mouseVisible = False  # and that we don't see the mouse
-            win.color = (-1, -1, -1)
-            win.flip()
-            win.flip()
+        if dr is None:
+            dr = DollarReward(win=win, externals=[printer])
+            dr.gobal_quit_key()  # escape quits
+            dr.DEBUG = True
         else:
-            win = create_window(run_info.info['fullscreen'])
-        dr = DollarReward(win=win, externals=[printer])
-        dr.gobal_quit_key()  # escape quits
-        dr.DEBUG = True
+            dr.attach(win)  # stims only rebuilt if win is new
+        if dr.frame_period is None:
+            dr.lock_to_frames()  # flip on vsync nearest each onset
 
         # read_file_func goes through specified files
         # or defaults to original eprime task list
-        onset_df = read_file_func(run_num)
-
-        if run_info.info['truncated']:
-            onset_df = onset_df[0:5]
-
-        dr.set_onsets(onset_df)
-        dr.trialnum = 0
+        # already read and checked by session planner
+        dr.reset(plan.onset_df.copy(), externals=[printer])  # run() shifts onsets in place
 
         # write to external files
-        run_id = f"{participant.ses_id()}_task-DR_run-{run_num}"
+        run_id = plan.run_id
         print(f"RUNNINFO: {run_info.info}")
         if run_info.info['EyeTracking'] == "Arrington":
             from externalcom import Arrington
@@ -482,19 +611,24 @@ def run_dollarreward(parsed):
 
         # added after eyetracker
         # timing more important to eyetracker than log file
-        logger.new(participant.log_path(run_id))
+        logger.new(plan.log_path)
         dr.externals.append(logger)
 
 
         # RUN
         dr.get_ready(triggers=triggers)
         dr.run(end_wait=1.5)
-        dr.onset_df.to_csv(participant.run_path(f"onsets_{run_num:02d}"))
+        dr.onset_df.to_csv(plan.onsets_path)
+        # next run is readied while the experimenter looks at this message
+        if run_num < n_runs:
+            session.prepare(run_num + 1)
         dr.msg(f"Finished run {run_num}/{n_runs}!")
-        dr.win.close()
 
         run_info.next_run()
 
+    if win is not None:
+        win.close()
+
 
 def main():
     import sys
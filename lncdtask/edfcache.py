@@ -0,0 +1,185 @@
+"""
+EyeLink EDF files converted once (eyelinkio.read_edf) into a sidecar cache next to the edf:
+
+  .edfcache/<edf name>-<content hash>/
+     samples.npy times.npy     memory mapped on load: only the pages a trial window touches are read
+     <discrete>.npy            blinks, saccades, fixations, ... as structured arrays
+     msg_time.npy msg_text.npy messages decoded once. see ConvertedEDF.find
+     info.json                 sample_fields, screen size (GAZE_COORDS), and the rest of the edf info
+
+the hash is of the file contents, so a re-exported edf with the same name is converted again.
+.edfcache/index.json remembers each edf's size and mtime => hash so unchanged files aren't re-read to hash.
+it is keyed by absolute path: edfs with the same name in different directories can share a cache_root
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import numpy as np
+
+#: bump when the layout changes. old caches are ignored (and converted again)
+CACHE_VERSION = 1
+CACHE_DIR = '.edfcache'
+
+
+def content_hash(fname, chunk=1024**2) -> str:
+    """
+    >>> import tempfile
+    >>> f = tempfile.NamedTemporaryFile(delete=False); _ = f.write(b'edf'); f.close()
+    >>> content_hash(f.name)
+    '3b6364ea059ad059ed9e609f8d71a1e9'
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(fname, 'rb') as f:
+        while block := f.read(chunk):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cached_hash(fname, cache_root) -> str:
+    """content_hash, but only computed again when size or mtime changed (see index.json)"""
+    index_path = os.path.join(cache_root, 'index.json')
+    st = os.stat(fname)
+    stamp = [st.st_size, st.st_mtime_ns]
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    name = os.path.abspath(fname)
+    have = index.get(name)
+    if have and have['stamp'] == stamp:
+        return have['hash']
+    digest = content_hash(fname)
+    index[name] = {'stamp': stamp, 'hash': digest}
+    os.makedirs(cache_root, exist_ok=True)
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump(index, f)
+    os.replace(index_path + '.tmp', index_path)
+    return digest
+
+
+def screen_coords(msg_text):
+    """(screen_x, screen_y) from the GAZE_COORDS message. strings like the edf has them"""
+    reg = re.compile('GAZE_COORDS [0-9.]+ [0-9.]+ ([0-9.]+) ([0-9.]+)')
+    for msg in msg_text:
+        if gaz := reg.search(msg):
+            return gaz.groups()
+    return (None, None)
+
+
+def jsonable(x):
+    """edf info to something json can write (numpy values, dates)"""
+    if isinstance(x, dict):
+        return {str(k): jsonable(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [jsonable(v) for v in x]
+    if isinstance(x, np.ndarray):
+        return jsonable(x.tolist())
+    if isinstance(x, np.generic):
+        return x.item()
+    if isinstance(x, bytes):
+        return x.decode(errors='replace')
+    if x is None or isinstance(x, (str, int, float, bool)):
+        return x
+    return str(x)
+
+
+def write_cache(edf, outdir):
+    """
+    write what read_edf gave (samples, times, discrete, info) to outdir.
+    written to a temporary directory first and renamed: outdir is complete or missing
+    """
+    parent = os.path.dirname(outdir) or '.'
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.converting-')
+    try:
+        np.save(os.path.join(tmp, 'samples.npy'), np.ascontiguousarray(edf['samples']))
+        np.save(os.path.join(tmp, 'times.npy'), np.asarray(edf['times'], dtype=float))
+
+        discrete = edf['discrete']
+        messages = discrete.get('messages', [])
+        msg_time = np.array([t for t, _ in messages], dtype=float)
+        msg_text = [m.decode(errors='replace') if isinstance(m, bytes) else str(m) for _, m in messages]
+        np.save(os.path.join(tmp, 'msg_time.npy'), msg_time)
+        np.save(os.path.join(tmp, 'msg_text.npy'), np.array(msg_text, dtype=str))
+
+        events = []
+        for name, values in discrete.items():
+            if name == 'messages':
+                continue
+            values = np.asarray(values)
+            if values.dtype.names is None or values.dtype.hasobject:
+                continue  # only plain structured arrays
+            np.save(os.path.join(tmp, f'{name}.npy'), values)
+            events.append(name)
+
+        info = jsonable(dict(edf['info']))
+        info['screen_x'], info['screen_y'] = screen_coords(msg_text)
+        info['events'] = events
+        info['cache_version'] = CACHE_VERSION
+        with open(os.path.join(tmp, 'info.json'), 'w') as f:
+            json.dump(info, f)
+        if os.path.isdir(outdir):
+            shutil.rmtree(outdir)  # stale (older version)
+        os.replace(tmp, outdir)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return outdir
+
+
+class ConvertedEDF():
+    """
+    a cache directory (see write_cache) opened for reading.
+    samples and times are read only memory maps. events are small and read whole
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, 'info.json')) as f:
+            self.info = json.load(f)
+        self.samples = np.load(os.path.join(cache_dir, 'samples.npy'), mmap_mode='r')
+        self.times = np.load(os.path.join(cache_dir, 'times.npy'), mmap_mode='r')
+        self.events = {name: np.load(os.path.join(cache_dir, f'{name}.npy'))
+                       for name in self.info['events']}
+        self.msg_time = np.load(os.path.join(cache_dir, 'msg_time.npy'))
+        self.msg_text = np.load(os.path.join(cache_dir, 'msg_text.npy'))
+        self._text = None
+
+    def find(self, pattern) -> np.ndarray:
+        """indices of messages matching regex pattern (re.search)"""
+        if self._text is None:
+            self._text = self.msg_text.tolist()
+        reg = re.compile(pattern)
+        return np.array([i for i, m in enumerate(self._text) if reg.search(m)], dtype=int)
+
+    def messages(self, pattern=None):
+        """(time, message) for every message (matching pattern)"""
+        idx = self.find(pattern) if pattern is not None else slice(None)
+        return list(zip(self.msg_time[idx].tolist(), self.msg_text[idx].tolist()))
+
+
+def cache_dir_for(fname, cache_root=None):
+    """where fname's conversion lives. default cache_root is .edfcache next to the edf"""
+    if cache_root is None:
+        cache_root = os.path.join(os.path.dirname(os.path.abspath(fname)), CACHE_DIR)
+    name = os.path.splitext(os.path.basename(fname))[0]
+    return os.path.join(cache_root, f"{name}-{cached_hash(fname, cache_root)}")
+
+
+def load_edf(fname, cache_root=None) -> ConvertedEDF:
+    """
+    fname through the cache: read_edf only the first time this content is seen
+    """
+    outdir = cache_dir_for(fname, cache_root)
+    try:
+        cached = ConvertedEDF(outdir)
+        if cached.info.get('cache_version') == CACHE_VERSION:
+            return cached
+    except (OSError, ValueError, KeyError):
+        pass
+    from eyelinkio import read_edf
+    write_cache(read_edf(fname), outdir)
+    return ConvertedEDF(outdir)
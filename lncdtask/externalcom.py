@@ -3,8 +3,15 @@ import os.path
 from time import time
 from psychopy import core
 import re
+import threading
+import queue
+from collections import deque
 
 class ExternalCom():
+    #: event_at can be called from a background thread (AllExternal's workers).
+    #: False for devices whose library is also used directly from the task thread
+    threadsafe = True
+
     def __init__(self, lookup=None):
         self.lookup = lookup
     def print_time(self, msg):
@@ -20,6 +27,19 @@ class ExternalCom():
         else:
             self.print_time(f"event {code}")
 
+    def event_at(self, t, code=None):
+        """
+        event that happened at t (core.getTime()) but is only being sent now.
+        used by AllExternal's background workers. default ignores t, so devices that don't
+        override it are never queued (see honors_time): their timestamp would be when it was sent.
+        FileLogger (logs t) and Eyelink (message offset) override it
+        """
+        self.event(code)
+
+    def prepare(self, messages):
+        """messages we know will be sent (from the schedule). chance to precompute before the run"""
+        pass
+
     def new(self, fname):
         self.print_time("new files %s" % fname)
 
@@ -31,24 +51,97 @@ class ExternalCom():
         
 
 class FileLogger(ExternalCom):
-    def __init__(self, lookup=None):
-        pass
-
-    def write(self, msg):
-        self.fh.write(f"{time():.5f} {msg}\n")
+    """
+    log events to a file. lines are 'walltime monotonic message'
+    (time.time() and psychopy core.getTime(), the clock flip times use).
+    write() only appends to a buffer. a background thread writes it out
+    every flush_interval seconds or as soon as flush_lines are waiting,
+    and fsyncs every fsync_interval seconds. stop() writes and syncs everything.
+    after a crash the file is complete up to the last flush
+    """
+    def __init__(self, lookup=None, flush_interval=.5, flush_lines=100, fsync_interval=5):
+        self.fh = None
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.fsync_interval = fsync_interval
+        self.buffer = []
+        self.lock = threading.Lock()     # buffer
+        self.io_lock = threading.Lock()  # file handle
+        self.wake = threading.Event()
+        self.thread = None
+        self.stopping = False
+
+    def write(self, msg, t=None):
+        """buffer msg. t is when it happened (core.getTime()), default now"""
+        now = core.getTime()
+        if t is None:
+            t = now
+        wall = time() - (now - t)
+        with self.lock:
+            self.buffer.append(f"{wall:.5f} {t:.6f} {msg}\n")
+            n_waiting = len(self.buffer)
+        if n_waiting >= self.flush_lines:
+            self.wake.set()
+
+    def flush(self, sync=False):
+        """
+        write out the buffer. optionally fsync so it survives a power loss.
+        without a file (before new, after close) lines stay buffered for the next one
+        """
+        with self.io_lock:
+            if self.fh is None:
+                return
+            with self.lock:
+                lines, self.buffer = self.buffer, []
+            if lines:
+                self.fh.write("".join(lines))
+            self.fh.flush()
+            if sync:
+                os.fsync(self.fh.fileno())
+
+    def work(self):
+        last_sync = core.getTime()
+        while not self.stopping:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            sync = core.getTime() - last_sync > self.fsync_interval
+            self.flush(sync)
+            if sync:
+                last_sync = core.getTime()
+
+    def close(self):
+        """stop the flusher, write everything, close the file"""
+        if self.thread is not None:
+            self.stopping = True
+            self.wake.set()
+            self.thread.join()
+            self.thread = None
+        if self.fh is not None:
+            self.flush(sync=True)
+            with self.io_lock:
+                self.fh.close()
+                self.fh = None
 
     def new(self, fname):
+        self.close()  # previous run's file, if any
         self.fh = open(fname, 'a+')
+        self.stopping = False
+        self.thread = threading.Thread(target=self.work, name="filelogger", daemon=True)
+        self.thread.start()
 
     def event(self, code=None):
         self.write(code)
 
+    def event_at(self, t, code=None):
+        """log with the time the event happened instead of now"""
+        self.write(code, t)
+
     def start(self):
         self.write("starting task")
 
     def stop(self):
         self.write("stopping task")
-        self.fh.close()
+        self.close()
 
 
 class Arrington(ExternalCom):
@@ -122,7 +215,12 @@ class Eyelink(ExternalCom):
     pylink_helper imports pylink
     TODO: calibration is usually done as part of the task
     see eyeTrkCalib
+
+    not threadsafe: pylink isn't, and tasks call it directly (trial_start/trial_end, IMGLOAD backdrops).
+    events are always sent on the task thread so they stay in order with those
     """
+    threadsafe = False
+
     def __init__(self, winsize, verbose=True):
         self.verbose=verbose
 
@@ -138,6 +236,22 @@ class Eyelink(ExternalCom):
         if code is None:
             return
         self.eyelink.trigger(code)
+
+    def event_at(self, t, code=None):
+        """message with an offset (ms) back to t: edf time is when it happened, not when it was sent"""
+        if code is None:
+            return
+        self.eyelink.trigger(code, offset=round((core.getTime() - t)*1000))
+
+    def prepare(self, messages):
+        """clean (spaces to _) known messages now instead of in trigger"""
+        try:
+            from lncdtask.pylink_help import clean_msg
+        except ImportError:
+            from pylink_help import clean_msg
+        for msg in messages:
+            if isinstance(msg, str):
+                clean_msg(msg)
     
     def new(self, fname):
         # sepcifically grab the first id looking thing
@@ -151,16 +265,103 @@ class Eyelink(ExternalCom):
         return self.eyelink.stop()
 
 
+class TTLScheduler():
+    """
+    raise a TTL code now and zero it pulse_width later from a background thread
+    so the caller (flip callback) does not wait on the pulse.
+    codes that come in while a pulse is up are queued and sent one after another
+    (pulse_width + gap apart) instead of overwriting the one on the port.
+    realized times are in 'pulses': [code, requested, start, end] (core.getTime() seconds)
+    """
+    def __init__(self, port, pulse_width=.01, gap=.002):
+        """
+        :param port: anything with setData(int). e.g. psychopy.parallel.ParallelPort
+        :param pulse_width: seconds code stays on the port
+        :param gap: seconds at zero between back to back codes
+        """
+        self.port = port
+        self.pulse_width = pulse_width
+        self.gap = gap
+        self.pulses = []
+        self.pending = deque()  # (code, requested) waiting for the port
+        self.up = None          # index into pulses of the code currently on the port
+        self.next_ok = 0        # earliest time the next code can go up
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.work, name="ttl", daemon=True)
+        self.thread.start()
+
+    def send(self, code):
+        """put code on the port now if it is free. otherwise queue it"""
+        now = core.getTime()
+        with self.cond:
+            if self.up is None and not self.pending and now >= self.next_ok:
+                self.raise_code(code, now)
+            else:
+                self.pending.append((code, now))
+            self.cond.notify_all()
+
+    def raise_code(self, code, requested):
+        """must hold self.cond"""
+        self.port.setData(code)
+        self.pulses.append([code, requested, core.getTime(), None])
+        self.up = len(self.pulses) - 1
+
+    def work(self):
+        """zero the port when a pulse is done. then send the next queued code"""
+        with self.cond:
+            while True:
+                now = core.getTime()
+                if self.up is not None:
+                    wait = self.pulses[self.up][2] + self.pulse_width - now
+                    if wait > 0:
+                        self.cond.wait(wait)
+                        continue
+                    self.port.setData(0)
+                    end = core.getTime()
+                    self.pulses[self.up][3] = end
+                    self.up = None
+                    self.next_ok = end + self.gap
+                    self.cond.notify_all()
+                elif self.pending:
+                    wait = self.next_ok - now
+                    if wait > 0:
+                        self.cond.wait(wait)
+                        continue
+                    self.raise_code(*self.pending.popleft())
+                else:
+                    self.cond.wait()
+
+    def flush(self, timeout=1):
+        """block until every code has been sent and zeroed"""
+        give_up = core.getTime() + timeout
+        with self.cond:
+            while self.up is not None or self.pending:
+                if core.getTime() > give_up:
+                    print(f"WARNING: ttl flush timed out with {len(self.pending)} codes waiting")
+                    return
+                self.cond.wait(.01)
+
+    def report(self):
+        """summary of realized pulses (seconds)"""
+        done = [p for p in self.pulses if p[3] is not None]
+        if not done:
+            return {'n': 0}
+        widths = [p[3] - p[2] for p in done]
+        delays = [p[2] - p[1] for p in done]
+        return {'n': len(done),
+                'width_max': max(widths),
+                'width_min': min(widths),
+                'delay_max': max(delays)}
+
+
 class ParallelPortEEG(ExternalCom):
     """EEG parallel port ttl"""
 
-    def __init__(self, pp_address, zeroTTL=True, lookup_func=int, verbose=True):
+    def __init__(self, pp_address, zeroTTL=True, lookup_func=int, verbose=True, pulse_width=.01):
         """
         send codes to LPT 'pp_address'.
-        optionally set the TTL to zero after
+        optionally set the TTL to zero after pulse_width seconds (TTLScheduler, does not block)
         b/c TTL is limited 0-255. use lookup_func to lookup codes for event
-        NB. this introduces a .01 second lag
-        TODO: use async?
         """
         from psychopy import parallel
         self.zeroTTL = zeroTTL
@@ -171,26 +372,24 @@ class ParallelPortEEG(ExternalCom):
         self.lookup_func = lookup_func
         self.verbose = verbose
 
-        # need core.wait for zeroing
-        if zeroTTL:
-            from psychopy import core
+        # background zeroing
+        self.ttl = TTLScheduler(self.port, pulse_width) if zeroTTL else None
 
     def event(self, *kargs):
         """
         send ttl trigger to parallel port
-        wait 10ms and send 0
+        zeroed pulse_width (10ms) later by self.ttl
         """
         if kargs is None:
             return
         #print(f"# ttl event: have {kargs}")
         thistrigger = self.lookup_func(*kargs)
-        self.port.setData(thistrigger)
+        if self.ttl:
+            self.ttl.send(thistrigger)
+        else:
+            self.port.setData(thistrigger)
         if self.verbose:
             print("eeg code %s" % thistrigger)
-        if self.zeroTTL:
-            # core imported at __init__ if zeroTTL
-            core.wait(.01)  # wait 10ms and send zero
-            self.port.setData(0)
 
     def new(self, fname):
         "no way to start a new file"
@@ -203,6 +402,9 @@ class ParallelPortEEG(ExternalCom):
     def stop(self):
         "eeg devices stops recording when recives 129"
         self.event(129)
+        if self.ttl:
+            self.ttl.flush()
+            print(f"ttl pulses: {self.ttl.report()}")
 
 
 class MuteWinSound(ExternalCom):
@@ -244,22 +446,123 @@ class MuteWinSound(ExternalCom):
     def event(self, code): pass
     
 
+def honors_time(extern) -> bool:
+    """
+    extern records the time passed to event_at (not when it was sent)
+    >>> honors_time(ExternalCom()), honors_time(FileLogger())
+    (False, True)
+    """
+    return type(extern).event_at is not ExternalCom.event_at
+
+
+def can_queue(extern) -> bool:
+    """
+    extern's events can go through a background worker: it honors_time and is threadsafe
+    >>> can_queue(FileLogger()), can_queue(ExternalCom())
+    (True, False)
+    """
+    return honors_time(extern) and extern.threadsafe
+
+
+class ExternalWorker():
+    """
+    send events to one external device from a background thread.
+    events stay in the order they were given. tracks queue depth and latency
+    """
+    def __init__(self, extern):
+        self.extern = extern
+        self.name = type(extern).__name__
+        self.queue = queue.Queue()
+        self.n = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.thread = threading.Thread(target=self.work, name=f"external-{self.name}", daemon=True)
+        self.thread.start()
+
+    def put(self, t, code):
+        """queue event 'code' that happened at 't' (core.getTime())"""
+        self.queue.put((t, code))
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            t, code = item
+            try:
+                self.extern.event_at(t, code)
+            except Exception as e:
+                print(f"WARNING: {self.name} failed to send '{code}': {e}")
+            latency = core.getTime() - t
+            self.n += 1
+            self.latency_total += latency
+            if latency > self.latency_max:
+                self.latency_max = latency
+            self.queue.task_done()
+
+    def drain(self):
+        """block until everything queued has been sent"""
+        self.queue.join()
+
+    def close(self):
+        """send what is left and end the thread"""
+        self.queue.put(None)
+        self.thread.join()
+
+    def stats(self):
+        return {'device': self.name,
+                'depth': self.queue.qsize(),
+                'n': self.n,
+                'latency_mean': self.latency_total/self.n if self.n else 0,
+                'latency_max': self.latency_max}
+
+
 class AllExternal(ExternalCom):
-    """ugly copy paste. better than using string accessors?"""
-    def __init__(self, externals=[]):
+    """ugly copy paste. better than using string accessors?
+
+    with asynchronous=True, event() only timestamps and queues: each device gets its
+    own ExternalWorker thread so a slow device does not hold up the next flip.
+    only devices that record that timestamp and can be used from another thread (can_queue: FileLogger)
+    are queued. the rest (Eyelink, Arrington, ArringtonSocket, ParallelPortEEG, ...) and devices added with
+    prepend(..., inline=True) are still called directly.
+    """
+    def __init__(self, externals=[], asynchronous=False):
         self.externals = externals
+        self.asynchronous = asynchronous
+        self.inline = set()  # id() of externals always called on the flip thread
+        self.workers = {}    # id() of external => ExternalWorker
 
     def append(self, extern):
         self.externals.append(extern)
 
-    def prepend(self, extern: ExternalCom):
+    def prepend(self, extern: ExternalCom, inline=False):
         """
         Add device to start of externals list.
         Useful to put the more time sensitive device first.
         `start`, `stop`, `event`, etc all issue commands to devices in the order they are in `externals`
         :param extern: external device
+        :param inline: when asynchronous, still send events to this device synchronously
         """
         self.externals.insert(0,extern)
+        if inline:
+            self.inline.add(id(extern))
+
+    def worker(self, extern) -> ExternalWorker:
+        """background sender for extern. created on first use"""
+        w = self.workers.get(id(extern))
+        if w is None:
+            w = self.workers[id(extern)] = ExternalWorker(extern)
+        return w
+
+    def drain(self):
+        """wait for all queued events to be sent"""
+        for w in self.workers.values():
+            w.drain()
+
+    def queue_stats(self) -> list[dict]:
+        """depth and latency (seconds from event to sent) per asynchronous device"""
+        return [w.stats() for w in self.workers.values()]
 
     def start(self):
         for ext in self.externals:
@@ -267,12 +570,33 @@ class AllExternal(ExternalCom):
 
     def stop(self) -> list[str]:
         """stop all externals.return list for eyelink is save file location"""
+        # queued events go out before 'stop'
+        for w in self.workers.values():
+            w.close()
+        if self.workers:
+            print(f"external queues: {self.queue_stats()}")
+        self.workers = {}
         return [ext.stop() for ext in self.externals]
 
+    def prepare(self, messages):
+        for ext in self.externals:
+            ext.prepare(messages)
+
     def new(self, fname):
+        self.drain()
         for ext in self.externals:
             ext.new(fname)
 
     def event(self, code):
+        if not self.asynchronous:
+            for ext in self.externals:
+                ext.event(code)
+            return
+
+        # timestamp now (likely on flip). device io happens in the workers
+        t = core.getTime()
         for ext in self.externals:
-            ext.event(code)
+            if id(ext) in self.inline or not can_queue(ext):
+                ext.event(code)
+            else:
+                self.worker(ext).put(t, code)
@@ -1,44 +1,35 @@
 #!/usr/bin/env python3
 try:
     from lncdtask import LNCDTask, create_window, replace_img, \
-            wait_for_scanner, ExternalCom, RunDialog, FileLogger
+            wait_for_scanner, ExternalCom, RunDialog, FileLogger, \
+            build_schedule, block_permutations
 except ImportError:
     from lncdtask.lncdtask import LNCDTask, create_window, replace_img,\
-            wait_for_scanner, ExternalCom, RunDialog, FileLogger
+            wait_for_scanner, ExternalCom, RunDialog, FileLogger, \
+            build_schedule, block_permutations
 
 import sys
 import numpy as np
 import pandas as pd
 
 
-def random_positions(center=.2, edge=.9, n=20, reps=1):
+def random_positions(center=.2, edge=.9, n=20, reps=1, rng=None):
     # default is 20 steps from center .2 to edge .9 (right side)
     # left side is that but negative: center -.2 to edge -.9
     # for the right side
     p_r = np.linspace(center, edge, n)
     p_lr = np.concatenate([p_r, -1 * p_r])
-    ridx = [p for ii in range(reps) for p in np.random.permutation(len(p_lr)) ]
-    return p_lr[ridx]
+    return p_lr[block_permutations(len(p_lr), reps, rng)]
 
 
-def random_pos_df(dur=.5, **kargs):
-    positions = random_positions(**kargs)
-    events = []
-    onset = 0
-    for p in positions:
-        events.append({'event_name': 'iti',
-                       'position': p, 'onset': onset})
-        onset = onset + dur
-
-        events.append({'event_name': 'dot',
-                       'position': p, 'onset': onset})
-        onset = onset + dur
+def random_pos_df(dur=.5, rng=None, **kargs):
+    positions = random_positions(rng=rng, **kargs)
+    events = build_schedule({'position': positions}, {'iti': dur, 'dot': dur})
 
     # last iti so we see all of final dot
-    events.append({'event_name': 'iti',
-                   'position': 0, 'onset': onset})
-
-    return pd.DataFrame(events)
+    last = pd.DataFrame({'event_name': ['iti'], 'position': [0.0],
+                         'onset': [len(positions) * 2 * dur]})
+    return pd.concat([events, last], ignore_index=True)
 
 def ttl_wrap(desc):
     print(desc)
@@ -65,12 +56,26 @@ class EyeCal(LNCDTask):
         self.add_event_type('dot', self.dot, ['onset', 'position'])
         self.add_event_type('iti', self.iti, ['onset'])
 
+    def event_messages(self):
+        """'<trial> dot <position>' for each dot (see dot), 'iti' otherwise"""
+        names = self.schedule.event_names
+        positions = self.schedule.columns['position']
+        messages = []
+        trial = self.trialnum
+        for name, pos in zip(names, positions):
+            if name == 'dot':
+                trial += 1
+                messages.append(f"{trial} dot {pos}")
+            else:
+                messages.append(name)
+        return messages
+
     def dot(self, onset, position=0):
         """position dot on horz axis to cue anti saccade
         position is from -1 to 1
         """
         self.trialnum = self.trialnum + 1
-        self.crcl.pos = (position * self.win.size[0]/2, 0)
+        self.crcl.pos = self.geometry.dot_pos(position)
         self.crcl.size = (1, 1)
         self.crcl.draw()
         return(self.flip_at(onset, self.trialnum, 'dot', position))
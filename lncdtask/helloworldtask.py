@@ -1,4 +1,7 @@
-from lncdtask import LNCDTask, create_window
+try:
+    from lncdtask import LNCDTask
+except ImportError:
+    from lncdtask.lncdtask import LNCDTask
 from psychopy import misc, visual
 import numpy as np
 import pandas as pd
@@ -26,6 +29,17 @@ class HelloWorldTask(LNCDTask):
         flip_dict = self.flip_at(onset, mesg, name)
         return(flip_dict)
 
+
+def example_df():
+    """hello, goodbye, done with an iti between"""
+    return pd.DataFrame({
+      'onset'     :[     0,     1,           1.5,   2.5,    3  ],
+      'event_name':['mesg', 'iti',        'mesg', 'iti', 'mesg' ],
+      'mesg':      ['Hello', None,     'Goodbye',  None, 'DONE' ],
+      'name':      ['World', None, 'cruel world',  None, ''     ]
+    })
+
+
 if __name__ == "__main__":
     from lncdtask import ExternalCom
     from psychopy import core
@@ -34,12 +48,7 @@ if __name__ == "__main__":
     task = HelloWorldTask(externals=[printer])
 
     # describe events
-    onset_df= pd.DataFrame({
-      'onset'     :[     0,     1,           1.5,   2.5,    3  ],
-      'event_name':['mesg', 'iti',        'mesg', 'iti', 'mesg' ],
-      'mesg':      ['Hello', None,     'Goodbye',  None, 'DONE' ],
-      'name':      ['World', None, 'cruel world',  None, ''     ]
-    })
+    onset_df = example_df()
 
     # add events to task
     task.set_onsets(onset_df)
@@ -0,0 +1,110 @@
+"""
+process wide image cache: decode each png once per session (not once per run or slide change).
+decoded images are keyed by path and mtime (an edited file is read again).
+ImageStims (uploaded textures) are cached per window. both are evicted least recently used first
+once over a memory cap.
+"""
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+
+def image_key(path):
+    """(absolute path, mtime) so a changed file is not served from cache"""
+    path = os.path.abspath(path)
+    return (path, os.stat(path).st_mtime_ns)
+
+
+class ImageCache():
+    """
+    LRU of decoded PIL images and per window psychopy ImageStims under max_bytes.
+    psychopy takes PIL images directly (image=...), skipping its own file read + decode
+
+    >>> import numpy as np, tempfile
+    >>> fname = os.path.join(tempfile.mkdtemp(), 'x.png')
+    >>> Image.fromarray(np.zeros((4, 4, 3), dtype=np.uint8)).save(fname)
+    >>> cache = ImageCache(max_bytes=1000)
+    >>> cache.image(fname) is cache.image(fname)
+    True
+    >>> cache.hits, cache.misses, cache.nbytes
+    (1, 1, 48)
+    """
+    def __init__(self, max_bytes=512*1024**2):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key => (object, nbytes, window or None)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, obj, nbytes, win=None):
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+            self.entries[key] = (obj, nbytes, win)
+            self.nbytes += nbytes
+            self.evict()
+
+    def evict(self):
+        """drop stims for closed windows, then least recently used until under max_bytes"""
+        for key, (_, nbytes, win) in list(self.entries.items()):
+            if win is not None and getattr(win, '_closed', False):
+                del self.entries[key]
+                self.nbytes -= nbytes
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, nbytes, _) = self.entries.popitem(last=False)
+            self.nbytes -= nbytes
+
+    def image(self, path) -> Image.Image:
+        """decoded image. read from disk only the first time (or after the file changes)"""
+        key = ('img',) + image_key(path)
+        img = self.get(key)
+        if img is None:
+            with Image.open(path) as f:
+                img = f.copy()  # decodes now. file is closed
+            self.put(key, img, img.width * img.height * len(img.getbands()))
+        return img
+
+    def preload(self, paths):
+        """decode paths now (e.g. on a worker thread before they are needed)"""
+        for path in paths:
+            self.image(path)
+
+    def stim(self, win, path, **kargs):
+        """
+        ImageStim for path on win, made (and texture uploaded) once.
+        shared by everything asking for the same path and kargs on this window:
+        draw it, don't move it (or put it back)
+        """
+        key = ('stim', id(win)) + image_key(path) + tuple(sorted(kargs.items()))
+        stim = self.get(key)
+        if stim is None or stim.win is not win:
+            from psychopy import visual
+            img = self.image(path)
+            stim = visual.ImageStim(win, image=img, **kargs)
+            # texture is RGBA. close enough for the cap
+            self.put(key, stim, img.width * img.height * 4, win)
+        return stim
+
+    def forget(self, win):
+        """drop everything made for win (e.g. before closing it)"""
+        with self.lock:
+            for key, (_, nbytes, w) in list(self.entries.items()):
+                if w is win:
+                    del self.entries[key]
+                    self.nbytes -= nbytes
+
+
+#: shared by every task in the process
+IMAGES = ImageCache()
@@ -24,10 +24,13 @@ except ModuleNotFoundError:
     from participant import Participant
 
 from rundialog import RunDialog
-from screen import wait_until, create_window, take_screenshot, msg_screen, replace_img, wait_for_scanner
+from screen import wait_until, create_window, take_screenshot, finish_screenshots, msg_screen, replace_img, wait_for_scanner, frame_deadline, measure_frame_period, ScreenGeometry
 from externalcom import Arrington, Eyelink, MuteWinSound, ParallelPortEEG, AllExternal, ExternalCom, FileLogger
 from arrington_socket import ArringtonSocket
 from trial_shuffle import shuf_for_ntrials
+from schedule import EventSchedule, build_schedule, block_permutations
+from results import ResultStore
+from imagecache import IMAGES
 import psychopy
 from psychopy import visual, core
 import pandas as pd
@@ -43,6 +46,8 @@ class EventRunner():
         if event_name is None:
             event_name = self.func.__name__
         self.event_name = event_name
+        #: where onset is in the argument list. 'event' timing mode replaces it
+        self.onset_pos = args_cols.index('onset') if 'onset' in args_cols else None
 
     def run(self, event_row):
         """
@@ -60,6 +65,21 @@ class EventRunner():
 
         return(self.func(*event_vals))
 
+    def bind(self, columns, i):
+        """
+        resolve arguments once for row i of compiled columns (see EventSchedule)
+        :param columns: dictionary of column name => list of values
+        :return: tuple to use like self.func(*args)
+        """
+        event_vals = [None]*len(self.args_cols)
+        for j, key in enumerate(self.args_cols):
+            col = columns.get(key)
+            if col is not None:
+                event_vals[j] = col[i]
+            if event_vals[j] is None:
+                print(f"WARNING! no value for column '{key}' when running event function '{self.event_name}' (event {i})")
+        return tuple(event_vals)
+
 
 class LNCDTask():
     """
@@ -69,28 +89,19 @@ class LNCDTask():
      {cue,isi,iti}_fix 'TextStim' (default: blue,yellow,white)
      img  ImageStims (See img_replace)
      crcl Circle (yellow)
-    
+
+    one window can be used for many runs (and tasks): see attach, detach, and reset
     """
     def __init__(self, onset_df=None, win=None, externals=[], participant=None):
         if win is None:
             win = create_window(True)
-        self.win = win
-        
-        # could have just one and change the color
-        self.iti_fix = visual.TextStim(win, text='+', name='iti_fixation',
-                                       color='white', bold=True)
-        self.isi_fix = visual.TextStim(win, text='+', name='isi_fixation',
-                                       color='yellow', bold=True)
-        self.cue_fix = visual.TextStim(win, text='+', name='cue_fixation',
-                                       color='royalblue', bold=True)
-        self.msgbox = visual.TextStim(win, text='', name='message_box',
-                                       color='white', bold=True)
-
-        # images
-        self.img = visual.ImageStim(win, name="imgdot", interpolate=True)
-        self.crcl = visual.Circle(win, radius=10, lineColor=None,
-                                  fillColor='yellow', name="circledot")
-        self.crcl.units = 'pix'
+        self.win = None
+        self.stims_for = None  # (window, size) make_stims last ran for
+        #: pixel positions for onset_df 'position' values. see set_onsets
+        self.geometry = ScreenGeometry()
+        #: image sizes (fraction of screen width) to precompute positions for. see ScreenGeometry.img_pos
+        self.img_percents = []
+        self.attach(win)
 
 
         # talk to the outside world
@@ -100,7 +111,10 @@ class LNCDTask():
 
         # to be set
         self.events = {}      # dictionary of event=>EventRunners
-        self.results = [{}]   # list of dict per event
+        self.results = ResultStore(0)  # columns per event. see set_onsets
+        self.schedule = None  # onset_df compiled by set_onsets
+        self.timing = None    # EventTiming. per event flip telemetry, see timing_report
+        self.running = False  # in run(). flip_at only records timing then
         if onset_df is not None:
             self.set_onsets(onset_df)
         else:
@@ -108,9 +122,75 @@ class LNCDTask():
 
         #: zero-based index of current event number. updated by run()
         self.event_number = 0
+        #: how far past onset the last flip_at wait_until returned
+        self.wait_overshoot = 0
+
+        #: flip on the vsync nearest onset instead of the one after. see lock_to_frames()
+        self.frame_locked = False
+        self.frame_period = None
+        self.frame_anchor = None  # first flip of the run. vsync grid reference
+        self.last_flip = None
 
         self.DEBUG = False
 
+    def make_stims(self):
+        """
+        create stimuli for self.win. called by attach only when the window or its size changed.
+        subclasses with their own stims extend this (call super().make_stims())
+        """
+        win = self.win
+        # could have just one and change the color
+        self.iti_fix = visual.TextStim(win, text='+', name='iti_fixation',
+                                       color='white', bold=True)
+        self.isi_fix = visual.TextStim(win, text='+', name='isi_fixation',
+                                       color='yellow', bold=True)
+        self.cue_fix = visual.TextStim(win, text='+', name='cue_fixation',
+                                       color='royalblue', bold=True)
+        self.msgbox = visual.TextStim(win, text='', name='message_box',
+                                       color='white', bold=True)
+
+        # images
+        self.img = visual.ImageStim(win, name="imgdot", interpolate=True)
+        self.crcl = visual.Circle(win, radius=10, lineColor=None,
+                                  fillColor='yellow', name="circledot")
+        self.crcl.units = 'pix'
+
+    def attach(self, win):
+        """
+        draw on an existing window. stims are only rebuilt if they were made for another window or size.
+        a new window means the measured frame period (lock_to_frames) might not hold: it's dropped
+        """
+        if self.win is not None and self.win is not win:
+            self.frame_period = None
+        self.win = win
+        size = tuple(win.size)
+        self.geometry.set_size(size)  # only rebuilt if size changed
+        if self.stims_for is None or self.stims_for[0] is not win or self.stims_for[1] != size:
+            self.make_stims()
+            self.stims_for = (win, size)
+
+    def detach(self):
+        """stop using the window (to give it to another task). returns it. stims are kept for attach"""
+        win = self.win
+        self.win = None
+        return win
+
+    def reset(self, onset_df=None, externals=None):
+        """
+        ready for another run on the same window: clear per-run state.
+        stims, events, and frame locking are kept.
+        :param externals: replace externals (old ones should have been stopped by run)
+        """
+        self.event_number = 0
+        self.wait_overshoot = 0
+        self.running = False
+        self.frame_anchor = None
+        self.last_flip = None
+        if externals is not None:
+            self.externals = AllExternal(externals)
+        if onset_df is not None:
+            self.set_onsets(onset_df)
+
     def gobal_quit_key(self, key='escape'):
         if not psychopy.event.globalKeys.get(key):
             psychopy.event.globalKeys.add(key=key, func=self.mark_and_quit, name='shutdown')
@@ -118,6 +198,7 @@ class LNCDTask():
     def mark_and_quit(self):
         self.mark_external("FORCE_QUIT")
         out_files = self.externals.stop()
+        finish_screenshots()
         core.quit()
 
     def mark_external(self, *kargs):
@@ -138,16 +219,52 @@ class LNCDTask():
     def flip_at(self, onset, *kargs, mark_func=None):
        """wait and then flip.
        send event notification to external sources with mark_func (def to mark_external)
+       when frame_locked, flip is requested one frame early so it lands on the vsync nearest onset
        returns dictionary with 'flip' time"""
        if mark_func is None:
            mark_func = self.mark_external
        if len(kargs) > 0:
            self.win.callOnFlip(mark_func, *kargs)
-       # timing
-       wait_until(onset)
+       # timing. sleeps most of the wait, spins the last few ms. see screen.wait_until
+       if self.frame_locked and self.last_flip is not None:
+           deadline = frame_deadline(onset, self.last_flip, self.frame_period)
+       else:
+           deadline = onset
+       self.wait_overshoot = wait_until(deadline)
+       request = core.getTime()
        flip = self.win.flip()
+       if self.frame_locked:
+           self.track_frame(flip)
+       if self.running:
+           self.timing.flipped(self.event_number, onset, request, flip)
        return({'flip': flip})
 
+    def lock_to_frames(self, frame_period=None):
+        """
+        use frame locked flips (see flip_at). measures refresh rate if frame_period is not given.
+        measuring flips the window for a second or two: call before instructions/run.
+        stimuli are already drawn before flip_at waits (draw, then flip_at), so draw time
+        is spent in the previous event and not in the deadline
+        """
+        if frame_period is None:
+            frame_period = measure_frame_period(self.win)
+        self.frame_period = frame_period
+        self.frame_locked = True
+        print(f"frame locked: {1/frame_period:.2f}Hz ({frame_period*1000:.3f}ms/frame)")
+
+    def track_frame(self, flip):
+        """
+        keep the vsync grid current. refine frame_period from all flips since the anchor
+        so a slightly off measurement does not drift over a long delay
+        """
+        self.last_flip = flip
+        if self.frame_anchor is None:
+            self.frame_anchor = flip
+            return
+        n_frames = round((flip - self.frame_anchor)/self.frame_period)
+        if n_frames > 0:
+            self.frame_period = (flip - self.frame_anchor)/n_frames
+
     def eyelink_trial_mark_plus_external(self, trial, *kargs):
         """
         for SR EyeLink: want a trial start and end marker
@@ -177,11 +294,29 @@ class LNCDTask():
         if not 'event_name' in onset_df.columns:
             raise Exception("onset_df must have 'event_name' column")
 
-        # list of dictonaries for event outcomes
+        # preallocated event outcomes (flip time, telemetry, anything else events return)
         n_events = onset_df.shape[0]
         self.onset_df = onset_df
-        self.results = [{'fliptime': -1}] * n_events 
-        
+        self.results = ResultStore(n_events)
+        self.timing = self.results.timing
+
+        # pull dataframe apart now instead of between flips
+        # runners and arguments are bound in run() (events are often added after set_onsets)
+        self.schedule = EventSchedule(onset_df)
+
+        # event functions look up pixel positions instead of computing them
+        if 'position' in self.schedule.columns:
+            self.geometry.prepare(set(self.schedule.columns['position']), self.img_percents)
+
+
+    def event_messages(self):
+        """
+        messages run() will send to externals, given to their prepare() before the run.
+        default is the 'code' column. tasks that compose messages from other columns override this
+        """
+        if self.schedule is None:
+            return []
+        return self.schedule.columns.get('code', [])
 
     def add_event_type(self, name, func, arg_cols=['onset']):
         """
@@ -208,57 +343,94 @@ class LNCDTask():
         if 'onset' in self.onset_df.columns:
             self.onset_df['onset0'] = self.onset_df.onset
             self.onset_df['onset'] = self.onset_df.onset + start_at
+            self.schedule.shift_onsets(start_at)
             self.timing_mode = 'cummulative' #: fixed event onsets
         elif 'dur' in self.onset_df.columns:
             self.timing_mode = 'event'     #: fixed durations
             print("Using 'dur' duration instead of 'onset' for timing. Run length will be variable.")
         else:
             raise Exception("onset_df has no 'onset' or 'dur' column")
-        
+
+        # resolve event functions and their arguments before anything is on the screen
+        sched = self.schedule
+        if self.frame_locked:
+            if self.frame_period is None:
+                self.frame_period = self.win.monitorFramePeriod
+            self.frame_anchor = None
+            self.last_flip = None
+            if self.timing_mode == 'cummulative':
+                # only checks for events sharing a frame. flip_at snaps each onset to the real vsync
+                sched.frame_lock(self.frame_period, start_at)
+        sched.bind(self.events)
+        if len(self.results) < sched.n_events:
+            raise Exception("results is not initialized! see set_onsets()")
+
+        self.timing.reset(self.frame_period or getattr(self.win, 'monitorFramePeriod', None))
+
+        # known event messages (e.g. eyelink cleans them once here)
+        self.externals.prepare(set(self.event_messages()))
+
         # tell everyone we are starting
         self.externals.start()
+        self.running = True
 
-        for (i, row) in self.onset_df.iterrows():
-            event_name = row['event_name']
-            ev = self.events.get(event_name, None)
+        # NB. i is position in onset_df, not the index label
+        for i in range(sched.n_events):
+            ev = sched.runners[i]
+            args = sched.args[i]
             self.event_number = i
 
             #: need to update time when we are in event mode
             if self.timing_mode == 'event':
                 if i > 0:
-                    #: NB!! requires downstream to update dur to be RT
+                    #: NB!! requires downstream to update dur to be RT.
+                    #: read from onset_df each time (not schedule.durs) so an event can set onset_df.loc[i, 'dur']
                     if self.DEBUG:
                         print(f"prev res: {self.results[i-1]}")
-                    row['onset'] = self.results[i-1]['flip'] + self.onset_df.loc[i-1, 'dur']
+                    onset = self.results.flip[i-1] + float(self.onset_df['dur'].iat[i-1])
                 else:
-                    row['onset'] = start_at
+                    onset = start_at
+                args = sched.args_with_onset(i, onset)
 
             if self.DEBUG:
-                print(row)
+                print(self.onset_df.iloc[i])
             if ev is None:
-                print(f"WARNING: event {i} unknown event '{event_name}'. add it with add_event_type()!")
+                print(f"WARNING: event {i} unknown event '{sched.event_names[i]}'. add it with add_event_type()!")
                 continue
 
-            if len(self.results) < i:
-                raise Exception("results is not initialized! see set_onsets()")
-
-            self.results[i] = ev.run(row)
+            self.timing.draw(i, core.getTime())
+            self.results[i] = ev.func(*args)
 
+        self.running = False
 
         # based on onsets. dont have durations. might need to wait at the end
         if end_wait:
             core.wait(end_wait)
         out_files = self.externals.stop()
+        finish_screenshots()  # take_screenshot pngs still being written
         print(f"outputs: {out_files}")
+        print(f"timing: {self.timing_report()}")
         return(self.results)
 
     def all_results(self):
         """
         Generate a complete summary of the run.
-        self.results is a list of dicts per event. column bind it to onset_df
-        For the most basic task, this will just add the 'flip' column.
+        self.results has columns per event (see results.ResultStore). column bind it to onset_df
+        For the most basic task, this will just add the 'flip' column
+        and timing telemetry (scheduled, draw_start, flip_request, flip_time, late, dropped_frames)
+        """
+        res = self.results.to_df()
+        res.index = self.onset_df.index
+        return self.onset_df.join(res)
+
+    def timing_report(self):
+        """
+        summary of how late flips were in the last run (seconds). see telemetry.EventTiming
+        per event values are in all_results()
         """
-        return self.onset_df.join(pd.DataFrame(self.results))
+        if self.timing is None:
+            return {}
+        return self.timing.report()
       
     # --- Examples
 
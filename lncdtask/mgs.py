@@ -28,39 +28,35 @@ MGS_TIMING={
 
 try:
     from lncdtask import LNCDTask, create_window, replace_img, \
-            wait_for_scanner, ExternalCom, RunDialog, FileLogger, msg_screen
+            wait_for_scanner, ExternalCom, RunDialog, FileLogger, msg_screen, \
+            build_schedule, block_permutations, IMAGES
 except ImportError:
     from lncdtask.lncdtask import LNCDTask, create_window, replace_img,\
-            wait_for_scanner, ExternalCom, RunDialog, FileLogger, msg_screen
+            wait_for_scanner, ExternalCom, RunDialog, FileLogger, msg_screen, \
+            build_schedule, block_permutations, IMAGES
 
 import sys
 import numpy as np
-import pandas as pd
 
 
-def random_positions(pos=[-.875,-.5,.5,.875], delay=[2.5,7.5], reps=4):
+def random_positions(pos=[-.875,-.5,.5,.875], delay=[2.5,7.5], reps=4, rng=None):
     """
     randomize position and delay pairs with 'reps' number of repeats
+    rng is a numpy.random.Generator (default: fresh unseeded)
     """
-    pos_delay = np.array([(p,d) for p in pos for d in delay])
-    ridx = [pd for ii in range(reps) for pd in np.random.permutation(len(pos_delay)) ]
-    return pos_delay[ridx]
+    pos_delay = np.stack(np.meshgrid(pos, delay, indexing='ij'), axis=-1).reshape(-1, 2)
+    return pos_delay[block_permutations(len(pos_delay), reps, rng)]
 
 
-def random_pos_df():
-    pos_delays = random_positions()
-    events = []
-    onset = 0
-
-    for p,d in pos_delays:
-        for event in ['mgscue','mgstarget','mgsdelay','mgsexec','helper']:
-            events.append({'event_name': event, 'position': p, 'delay': d, 'onset': onset, 'code':f'{event}_{d}_{p}'})
-            # accumulates onsets
-            # 2 seconds for all but mgs_delay which is variable (likely 2.5 or 7.5)
-            dur = d if event == 'mgsdelay' else MGS_TIMING[event]
-            onset = onset + dur
-
-    return pd.DataFrame(events)
+def random_pos_df(rng=None):
+    """
+    events in MGS_TIMING order for each position/delay pair
+    2 seconds for all but mgs_delay which is variable (likely 2.5 or 7.5)
+    """
+    pos_delays = random_positions(rng=rng)
+    return build_schedule({'position': pos_delays[:, 0], 'delay': pos_delays[:, 1]},
+                          MGS_TIMING, variable={'mgsdelay': 'delay'},
+                          code_cols=['delay', 'position'])
 
 def ttl_wrap(desc):
     print(desc)
@@ -107,7 +103,7 @@ class MGSEye(LNCDTask):
         return self.instruction_welcome(msg)
 
     def instruction_dot(self):
-        self.crcl.pos = (0.9 * self.win.size[0]/2, 0)
+        self.crcl.pos = self.geometry.dot_pos(0.9)
         self.crcl.draw()
         return msg_screen(self.msgbox,'A dot will appear.\nLook at it!', pos=(0,.9))
     def instruction_cross(self):
@@ -127,8 +123,7 @@ class MGSEye(LNCDTask):
 
     def instruction_summary(self):
         self.win.color = '#000080'; self.win.flip()
-        self.img.image = 'images/mgs/mgs_summary.png'
-        self.img.draw()
+        IMAGES.stim(self.win, 'images/mgs/mgs_summary.png', name="summary", interpolate=True).draw()
         resp = msg_screen(self.msgbox,'')
         self.win.color = 'black'; self.win.flip()
         return resp
@@ -159,7 +154,7 @@ class MGSEye(LNCDTask):
         NB. code='dot' now overwrote by value in
             code column of events dataframe
         """
-        self.crcl.pos = (position * self.win.size[0]/2, 0)
+        self.crcl.pos = self.geometry.dot_pos(position)
         self.crcl.draw()
         return self.flip_at(onset, code)
 
@@ -253,6 +248,7 @@ def run_mgseye(parsed):
     mgs.gobal_quit_key()  # escape quits
     mgs.DEBUG = False
     mgs.eyelink = None
+    mgs.lock_to_frames()  # flip on vsync nearest each onset
 
     participant = run_info.mk_participant(['MGSEye'])
     run_id = f"{participant.ses_id()}_task-MGS_run-{run_info.run_num()}"
@@ -15,8 +15,11 @@ install instructions
 TODO: use pyGaze instead
 """
 import pylink as pl
+import os
 import re
 import datetime
+from functools import lru_cache
+from time import perf_counter
 
 def seconds_36base() -> str:
     """
@@ -32,6 +35,17 @@ def seconds_36base() -> str:
         now = int(time.time())
     return numpy.base_repr(int(now),36)
 
+@lru_cache(maxsize=4096)
+def clean_msg(eventname: str) -> str:
+    """
+    spaces to underscores for eyelink messages.
+    cached: task messages repeat (codes like 'mgscue_2.5_-0.5') so each is only cleaned once
+    >>> clean_msg('1 ring rew 0.5')
+    '1_ring_rew_0.5'
+    """
+    return eventname.replace(' ', '_')
+
+
 class eyelink:
     """
     quick access to eyelink
@@ -59,11 +73,20 @@ class eyelink:
         self.el = el
         self.sp = sp
 
+        # record_status_message (host pc status bar) is a command round trip.
+        # only send once every status_interval seconds. None to never send
+        self.status_interval = 1
+        self.last_status = None
+        #: seconds each trigger() took to return
+        self.trigger_durations = []
+
         # sub+session. data file name. set in open. saved to tracker. copied locally
         self.sessionid = None
         # where to save outputfiles (used by self.savename())
         # expect to be set manually outside of class
         self.task_savedir = None
+        # screenshots for data viewer backdrops. see win_screenshot
+        self.capture = None
 
     def open(self, dfn, sessionid=None, base36enc=False):
         """open file"""
@@ -99,6 +122,10 @@ class eyelink:
 
     def stop(self):
         """cose file and stop tracking. reurns where data was saved"""
+        print(f"eyelink trigger timing: {self.trigger_report()}")
+        if self.capture is not None:
+            self.capture.flush()
+            self.send_backdrops()
         self.el.sendMessage("END")
         pl.endRealTimeMode()
         # el.sendCommand("set_offline_mode = YES")
@@ -125,12 +152,26 @@ class eyelink:
         print(f"saved eyelink data to {saveas}")
         return saveas
 
-    def trigger(self, eventname):
-        """send event discription"""
+    def trigger(self, eventname, offset=0):
+        """send event discription. offset: ms ago it happened (edf time is now - offset)"""
         # event name must be <=120 characters?
-        eventname = re.sub(' ','_', eventname) # this might be slow? millisecond offset?
-        self.el.sendMessage(eventname)
-        self.el.sendCommand(f"record_status_message {eventname}")
+        t0 = perf_counter()
+        eventname = clean_msg(eventname)
+        self.el.sendMessage(f"{offset} {eventname}" if offset > 0 else eventname)
+        if self.capture is not None and self.capture.saved:
+            self.send_backdrops()
+        if self.status_interval is not None and \
+           (self.last_status is None or t0 - self.last_status >= self.status_interval):
+            self.el.sendCommand(f"record_status_message {eventname}")
+            self.last_status = t0
+        self.trigger_durations.append(perf_counter() - t0)
+
+    def trigger_report(self):
+        """how long trigger() took (seconds). expect well under a millisecond"""
+        durs = self.trigger_durations
+        if not durs:
+            return {'n': 0}
+        return {'n': len(durs), 'max': max(durs), 'mean': sum(durs)/len(durs)}
 
     def trial_start(self,trialid):
         "12 numbers and letters that uniquely identify the trial"
@@ -142,19 +183,36 @@ class eyelink:
     def var_data(self, condition, value):
         self.el.sendMessage(f"!V TRIAL_VAR_DATA {condition} {value}");
 
-    def update_screen(self, image_path):
-        # todo write
-        self.el.sendMessage(f"!V IMGLOAD FILL {image_path}");
-
-    def win_screenshot(self,win):
-        from tempfile import mkstemp
-        import os
-        screenshotname = mkstemp(suffix=".png")[1]
-        print(screenshotname)
-        win.getMovieFrame(buffer='back')
-        win.saveMovieFrames(screenshotname)
-        self.update_screen(screenshotname)
-        os.unlink(screenshotname)
+    def update_screen(self, image_path, offset=0):
+        """data viewer backdrop. offset: ms ago the image was on screen.
+        path is relative to the edf (task_savedir) so keep the file!"""
+        offset = f"{offset} " if offset else ""
+        self.el.sendMessage(f"{offset}!V IMGLOAD FILL {image_path}");
+
+    def win_screenshot(self, win):
+        """
+        backdrop for what the next flip will show (back buffer).
+        only copies pixels here. the png is written on a worker thread and
+        IMGLOAD is sent (from trigger/stop on this thread, pylink isn't thread safe)
+        once the file exists, with an offset back to when it was grabbed.
+        repeated screens are one file
+        """
+        if self.capture is None:
+            try:
+                from lncdtask.capture import FrameCapture
+            except ImportError:
+                from capture import FrameCapture
+            saveto = os.path.join(self.task_savedir or '.', 'screenshots')
+            self.capture = FrameCapture(saveto, prefix='backdrop')
+        self.capture.grab(win, buffer='back')
+        self.send_backdrops()
+
+    def send_backdrops(self):
+        """IMGLOAD for screenshots finished since the last call"""
+        now = perf_counter()
+        for path, t, _ in self.capture.poll():
+            path = os.path.relpath(path, self.task_savedir or '.')
+            self.update_screen(path, offset=max(0, round((now - t)*1000)))
 
     def eyeTrkCalib(self, colordepth=32):
         """
@@ -28,12 +28,61 @@ except ImportError:
     )
 
 import sys
+import math
+from collections import deque
 import numpy as np
 import pandas as pd
 from pathlib import Path
 from psychopy import core, event, visual
 
 TRDIFFTHRES = .1
+#: only the most recent bad TRs are listed on screen (all are counted)
+MAX_BAD_SHOWN = 20
+REST_INSTRUCTIONS = ("Turn of projector.\n"
+                     + "Instructions: keep eyes open and let mind wonder.\n\n"
+                     + "Push q to quit\n"
+                     + "waiting for scanner ('=')")
+
+
+class TRStats():
+    """
+    running TR interval summary in constant memory (no list of every pulse)
+    >>> s = TRStats()
+    >>> [round(s.add(t), 2) for t in [10, 11.5, 13, 14.6]]
+    [0, 1.5, 1.5, 1.6]
+    >>> s.n, s.first, round(s.mean, 3), round(s.max, 2)
+    (3, 1.5, 1.533, 1.6)
+    """
+    def __init__(self):
+        self.last_time = None
+        self.first = 0     # first interval. what everything else is compared to
+        self.n = 0         # number of intervals
+        self.mean = 0
+        self.m2 = 0        # Welford sum of squared differences
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, time: float) -> float:
+        """pulse at time. returns interval since the last pulse (0 for the first)"""
+        time = float(time)
+        last, self.last_time = self.last_time, time
+        if last is None:
+            return 0
+        tr = time - last
+        if self.n == 0:
+            self.first = tr
+        self.n += 1
+        delta = tr - self.mean
+        self.mean += delta/self.n
+        self.m2 += delta*(tr - self.mean)
+        self.min = min(self.min, tr)
+        self.max = max(self.max, tr)
+        return tr
+
+    @property
+    def sd(self):
+        return math.sqrt(self.m2/(self.n - 1)) if self.n > 1 else 0
+
 
 class RestTask(LNCDTask):
     """
@@ -49,25 +98,39 @@ class RestTask(LNCDTask):
         >> r.watch_keys()
         >> # r.run()
         """
-        self.times = []
-        self.bad_trs = {}
-        self.tr = 0
+        self.stats = TRStats()
+        #: most recent MAX_BAD_SHOWN (pulse count, seconds off). n_bad counts all of them
+        self.bad_trs = deque(maxlen=MAX_BAD_SHOWN)
+        self.n_bad = 0
         super().__init__(*karg, **kargs)
 
+    @property
+    def tr(self):
+        """first TR interval. 0 until there are two pulses"""
+        return self.stats.first
+
+    def make_stims(self):
+        """
+        stims made once and kept. per pulse only the status numbers change
+        (and the bad TR list when there's a new one)
+        """
+        super().make_stims()
+        win = self.win
+        self.start_bg = visual.Rect(win, size=(2, 2), fillColor="blue")
+        self.bad_bg = visual.Rect(win, size=(2, 2), fillColor="red")
+        self.instructions = visual.TextStim(win, text=REST_INSTRUCTIONS, pos=(0, -0.6), name='rest_instructions',
+                                            color='white', bold=True)
+        self.status = visual.TextStim(win, text='', pos=(0, 0.3), name='rest_status',
+                                      color='white', bold=True)
+        self.bad_list = visual.TextStim(win, text='', pos=(-.9, 0), name='rest_bad_trs',
+                                        height=self.msgbox.height*.3, color='purple', bold=True)
+
     def new_tr(self, time: float) -> float:
         """
         Add time of tr and calculate tr
-        set self.tr if not set
+        first interval is kept as self.tr
         """
-        self.times.append(float(time))
-        if len(self.times) <= 1:
-            return 0
-
-        tr = self.times[-1] - self.times[-2]
-        # set to first
-        if self.tr == 0:
-            self.tr = tr
-        return tr
+        return self.stats.add(time)
 
     def with_instructions(self, cnt=0, time=0, code="rest flip"):
         """show instructions about resting state"""
@@ -75,51 +138,43 @@ class RestTask(LNCDTask):
 
         tr = self.new_tr(time)
         tr_diff = tr - self.tr
-        if abs(tr_diff) > TRDIFFTHRES:
-            self.bad_trs[cnt] = tr_diff
+        is_bad = abs(tr_diff) > TRDIFFTHRES
+        if is_bad:
+            self.n_bad += 1
+            self.bad_trs.append((cnt, tr_diff))
+            bad_msg = "\n".join([f"acq #{k+1} off by {v:.2f} secs" for k, v in self.bad_trs])
+            if self.n_bad > MAX_BAD_SHOWN:
+                bad_msg = f"(last {MAX_BAD_SHOWN} of {self.n_bad})\n" + bad_msg
+            self.bad_list.text = bad_msg
 
         # window color changes when starting
         # and when TR is not consistent
         if cnt == 1:
-            visual.Rect(self.win, size=(2, 2), fillColor="blue").draw()
-        elif abs(tr_diff) > TRDIFFTHRES:
-            visual.Rect(self.win, size=(2, 2), fillColor="red").draw()
+            self.start_bg.draw()
+        elif is_bad:
+            self.bad_bg.draw()
 
         ## write instructions
-        self.msgbox.pos = (0, -0.6)
-        self.msgbox.text = (
-            "Turn of projector.\n"
-            + "Instructions: keep eyes open and let mind wonder.\n\n"
-            + "Push q to quit\n"
-            + "waiting for scanner ('=')"
-        )
-        self.msgbox.draw()
+        self.instructions.draw()
 
         if cnt or time:
             tr_msg = ""
             if self.tr > 0:
-                tr_msg = f"TR: first={self.tr:.2f} cur={tr:.2f} (diff={tr_diff:.2f})\n"
-
-            if self.bad_trs:
-                height = self.msgbox.height
-                self.msgbox.pos=(-.9,0)
-                self.msgbox.height *= .3
-                self.msgbox.text = "\n".join([f"acq #{k+1} off by {v:.2f} secs" for k,v in self.bad_trs.items()])
-                self.msgbox.color='purple'
-                self.msgbox.draw()
-                self.msgbox.height = height
-                # count total in normal messae
-                tr_msg += f"{len(self.bad_trs)} bad TRs"
+                tr_msg = (f"TR: first={self.tr:.2f} cur={tr:.2f} (diff={tr_diff:.2f})\n"
+                          + f"mean={self.stats.mean:.3f} sd={self.stats.sd:.3f} "
+                          + f"range={self.stats.min:.2f}-{self.stats.max:.2f}\n")
 
+            if self.n_bad:
+                self.bad_list.draw()
+                # count total in normal messae
+                tr_msg += f"{self.n_bad} bad TRs"
 
-            self.msgbox.pos = (0, 0.3)
-            self.msgbox.color='white'
-            self.msgbox.text = (
+            self.status.text = (
                 f"Scanner TTL/TR pulse count: {cnt or 0}\n"
                 + f"Total rest time: {time or 0}\n"
                 + tr_msg
             )
-            self.msgbox.draw()
+            self.status.draw()
 
         flip = self.win.flip()
         return {"flip": flip}
@@ -0,0 +1,60 @@
+"""
+per event results for LNCDTask.run, sized once by set_onsets
+"""
+import numpy as np
+import pandas as pd
+try:
+    from telemetry import EventTiming
+except ImportError:
+    from lncdtask.telemetry import EventTiming
+
+
+class ResultStore():
+    """
+    preallocated columns instead of a list of dicts.
+    event functions return dicts like {'flip': flip}. 'flip' goes into a float array,
+    anything else a task returns goes into a side table (only allocated for those events).
+    timing telemetry (telemetry.EventTiming) lives here too
+
+    >>> res = ResultStore(3)
+    >>> res[0] = {'flip': 1.5}
+    >>> res[1] = {'flip': 2.5, 'resp': 'left'}
+    >>> res[1]
+    {'flip': 2.5, 'resp': 'left'}
+    >>> res.to_df()[['flip', 'resp']].values.tolist()
+    [[1.5, nan], [2.5, 'left'], [nan, nan]]
+    """
+    def __init__(self, n_events):
+        self.n_events = n_events
+        self.flip = np.full(n_events, np.nan)
+        self.extras = {}  # event index => dict of task specific results
+        self.timing = EventTiming(n_events)
+
+    def __len__(self):
+        return self.n_events
+
+    def __setitem__(self, i, res):
+        """store what event function i returned"""
+        if res is None:
+            return
+        flip = res.get('flip')
+        if flip is not None:
+            self.flip[i] = flip
+        if len(res) > (flip is not None):
+            self.extras[i] = {k: v for k, v in res.items() if k != 'flip'}
+
+    def __getitem__(self, i) -> dict:
+        """like the old list of dicts: {'flip': ..., **extras}"""
+        return {'flip': float(self.flip[i]), **self.extras.get(i, {})}
+
+    def __repr__(self):
+        return f"ResultStore({self.n_events} events, flip={self.flip})"
+
+    def to_df(self) -> pd.DataFrame:
+        """one row per event: flip, timing telemetry, extras"""
+        df = self.timing.to_df()
+        df.insert(0, 'flip', self.flip)
+        if self.extras:
+            extras = pd.DataFrame.from_dict(self.extras, orient='index')
+            df = df.join(extras)
+        return df
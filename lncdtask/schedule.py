@@ -0,0 +1,163 @@
+"""
+compiled event schedule: onset_df pulled apart once so `LNCDTask.run` only indexes lists/arrays
+pandas lookups (iterrows, to_dict, column by name) happen here instead of between flips
+
+also builds onset_dfs from event templates (e.g. mgs.MGS_TIMING) with whole-array numpy ops
+"""
+import numpy as np
+import pandas as pd
+
+
+def block_permutations(n, reps=1, rng=None, n_runs=None):
+    """
+    reps back-to-back permutations of range(n): every item once per block.
+    with n_runs, that many candidate orders at once (one per row) for screening counterbalancing
+
+    >>> order = block_permutations(4, 2, np.random.default_rng(1))
+    >>> sorted(order[:4].tolist()), sorted(order[4:].tolist())
+    ([0, 1, 2, 3], [0, 1, 2, 3])
+    >>> block_permutations(4, 2, np.random.default_rng(1), n_runs=1000).shape
+    (1000, 8)
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    shape = (reps, n) if n_runs is None else (n_runs, reps, n)
+    order = np.argsort(rng.random(shape), axis=-1)
+    return order.reshape(shape[:-2] + (-1,))
+
+
+def template_durations(n_trials, events, timing, trials=None, variable=None):
+    """
+    (n_trials, len(events)) duration of every event.
+    fixed from timing[event], events in variable ({event: trial column}) from trials
+    """
+    variable = variable or {}
+    durs = np.tile([0.0 if e in variable else float(timing[e]) for e in events], (n_trials, 1))
+    for j, e in enumerate(events):
+        if e in variable:
+            durs[:, j] = trials[variable[e]]
+    return durs
+
+
+def build_schedule(trials, timing, events=None, variable=None, code_cols=None, start=0):
+    """
+    onset_df for a run from an event template. every trial has the same events in order.
+    :param trials: dict (or DataFrame) of per trial columns (e.g. position, delay)
+    :param timing: event => duration in seconds. e.g. MGS_TIMING
+    :param events: events in each trial. default: timing order
+    :param variable: event => trial column for per trial durations. e.g. {'mgsdelay': 'delay'}
+    :param code_cols: trial columns joined to event name for a 'code' column: 'event_col1_col2'
+    :param start: onset of first event
+    returns onset_df with columns event_name, trial columns, onset (, code)
+
+    >>> build_schedule({'position': [-1, 1], 'delay': [2, 3]}, {'cue': 1, 'wait': 0},
+    ...                variable={'wait': 'delay'}, code_cols=['position']).onset.tolist()
+    [0.0, 1.0, 3.0, 4.0]
+    """
+    trials = {col: np.asarray(vals) for col, vals in dict(trials).items()}
+    events = list(timing) if events is None else events
+    n_trials = len(next(iter(trials.values())))
+    n_events = len(events)
+
+    durs = template_durations(n_trials, events, timing, trials, variable).ravel()
+    onset = start + np.concatenate([[0], np.cumsum(durs[:-1])])
+
+    event_name = np.tile(np.array(events, dtype=str), n_trials)
+    df = pd.DataFrame({'event_name': event_name,
+                       **{col: np.repeat(vals, n_events) for col, vals in trials.items()},
+                       'onset': onset})
+    if code_cols:
+        code = event_name
+        for col in code_cols:
+            code = np.char.add(np.char.add(code, '_'), df[col].to_numpy().astype(str))
+        df['code'] = code
+    return df
+
+
+class EventSchedule():
+    """
+    onset_df as per-column arrays
+    and per-event bound EventRunners with argument tuples already resolved
+
+    >>> import pandas as pd
+    >>> sched = EventSchedule(pd.DataFrame({'onset': [0, 1.5], 'event_name': ['iti', 'x']}))
+    >>> sched.n_events
+    2
+    >>> sched.onsets
+    array([0. , 1.5])
+    """
+    def __init__(self, onset_df):
+        """columns to lists (python types are faster to index than pandas)"""
+        self.n_events = onset_df.shape[0]
+        self.columns = {col: onset_df[col].tolist() for col in onset_df.columns}
+        self.event_names = self.columns['event_name']
+
+        #: float copies of timing columns. None if not in onset_df.
+        #: copies: later changes to onset_df are not seen here. ('event' timing reads onset_df's dur as it runs)
+        self.onsets = self.float_col('onset')
+        self.durs = self.float_col('dur')
+        if self.onsets is None:
+            # 'event' timing: onset is set per event by run(). see args_with_onset
+            self.columns['onset'] = [0.0] * self.n_events
+
+        #: set by frame_lock(). frame index of each onset from run start
+        self.frames = None
+
+        #: set by bind(). EventRunner (or None when unknown) and argument tuple per event
+        self.runners = [None] * self.n_events
+        self.args = [()] * self.n_events
+
+    def float_col(self, col):
+        if col not in self.columns:
+            return None
+        return np.array(self.columns[col], dtype=float)
+
+    def shift_onsets(self, start_at):
+        """
+        onsets relative to start_at. like run() does to onset_df
+        call before bind() so argument tuples see the new onsets
+        """
+        self.onsets = self.float_col('onset') + start_at
+        self.columns['onset'] = self.onsets.tolist()
+
+    def frame_lock(self, frame_period, start_at=0):
+        """
+        frame number (from start_at) of each onset. events that land on the same frame
+        as the event before would never be seen: warn about them.
+        onsets are not moved: start_at is not a vsync, so snapping here and again to the
+        real vsync in flip_at (frame_deadline) would add up to a whole frame of error
+
+        >>> import pandas as pd
+        >>> sched = EventSchedule(pd.DataFrame({'onset': [0, .5, .505, 1], 'event_name': ['a']*4}))
+        >>> sched.frame_lock(1/60)
+        WARNING: 1 event(s) share a frame with the previous event: [2]
+        >>> sched.frames.tolist()
+        [0, 30, 30, 60]
+        >>> sched.onsets.tolist()
+        [0.0, 0.5, 0.505, 1.0]
+        """
+        if self.onsets is None:
+            return
+        self.frames = np.round((self.onsets - start_at)/frame_period).astype(int)
+        same_frame = np.flatnonzero(np.diff(self.frames) < 1) + 1
+        if len(same_frame):
+            print(f"WARNING: {len(same_frame)} event(s) share a frame with the previous event: {same_frame.tolist()}")
+
+    def bind(self, events):
+        """
+        attach an EventRunner and its arguments to each row
+        :param events: dictionary of event_name => EventRunner (LNCDTask.events)
+        """
+        for i, name in enumerate(self.event_names):
+            ev = events.get(name)
+            self.runners[i] = ev
+            self.args[i] = ev.bind(self.columns, i) if ev is not None else ()
+
+    def args_with_onset(self, i, onset):
+        """argument tuple for event i with onset replaced. for 'event' (duration) timing"""
+        ev = self.runners[i]
+        args = self.args[i]
+        if ev is None or ev.onset_pos is None:
+            return args
+        args = list(args)
+        args[ev.onset_pos] = onset
+        return tuple(args)
@@ -2,27 +2,104 @@
 utility functions for using screen
 """
 from psychopy import core, visual, event
+import time
+import numpy as np
+try:
+    from imagecache import IMAGES
+except ImportError:
+    from lncdtask.imagecache import IMAGES
+try:
+    from capture import capture_for, close_all
+except ImportError:
+    from lncdtask.capture import capture_for, close_all
 
 # this causes some artifacts!?
-def take_screenshot(win, name, saveto='screenshots'):
-    os.makedirs(saveto, exist_ok=True)
-    win.getMovieFrame()   # Defaults to front buffer, I.e. what's on screen now
-    win.saveMovieFrames(saveto + '/' + name + '.png')
+def take_screenshot(win, name, saveto='screenshots', buffer='front'):
+    """
+    save what's on screen now (front buffer) as saveto/name.png.
+    only the pixel copy happens here. png is written in the background (capture.FrameCapture)
+    """
+    capture_for(saveto).grab(win, name=name, buffer=buffer)
+
+
+def finish_screenshots():
+    """wait for take_screenshot pngs still being written (end of run, quitting)"""
+    close_all()
 
 
-def wait_until(stoptime, maxwait=30):
+#: wait_until sleeps until this many seconds before the deadline, then spins
+WAIT_SPIN_MARGIN = .015
+#: longest single sleep. short enough to notice e.g. a quit key between slices
+WAIT_SLEEP_SLICE = .1
+
+
+def wait_until(stoptime, maxwait=30, spin_margin=None, sleep_slice=None):
     """
     just like core.wait, but instead of waiting a duration
     we wait until a stoptime.
     optional maxwait will throw an error if we are wating too long
     so we dont get stuck. defaults to 30 seconds
+
+    sleep (OS, gives up the cpu) in chunks of at most sleep_slice
+    until spin_margin seconds before stoptime. only busy loop for that last bit.
+    margin should cover OS sleep granularity (~1ms linux, can be ~15ms on windows)
+
+    returns how late we are (seconds past stoptime; negative never expected)
+    >>> wait_until(core.getTime() + .03) < .005
+    True
     """
-    if stoptime - core.getTime() > maxwait:
+    if spin_margin is None:
+        spin_margin = WAIT_SPIN_MARGIN
+    if sleep_slice is None:
+        sleep_slice = WAIT_SLEEP_SLICE
+
+    remaining = stoptime - core.getTime()
+    if remaining > maxwait:
         raise ValueError("request to wait until stoptime is more than " +
                          "30 seconds, secify maxwait to avoid this error")
-    # will hog cpu -- no pyglet.media.dispatch_events here
-    while core.getTime() < stoptime:
-        continue
+
+    # coarse: let eyetracker dll, sockets, and the compositor have the cpu
+    while remaining > spin_margin:
+        time.sleep(min(sleep_slice, remaining - spin_margin))
+        remaining = stoptime - core.getTime()
+
+    # fine: will hog cpu -- no pyglet.media.dispatch_events here
+    now = core.getTime()
+    while now < stoptime:
+        now = core.getTime()
+    return now - stoptime
+
+
+def frame_deadline(onset, last_flip, frame_period, margin=.25):
+    """
+    when to request a flip so it lands on the vsync closest to onset.
+    vsyncs are expected every frame_period after last_flip (a flip timestamp).
+    win.flip() blocks until the next vsync, so ask just after the vsync
+    one frame *before* the target instead of waiting for onset and
+    landing on whatever vsync follows (up to a frame late).
+
+    :param margin: fraction of a frame past the previous vsync to wait. absorbs jitter
+    >>> round(frame_deadline(1.0, 0.0, .1), 3)
+    0.925
+    >>> frame_deadline(1.0, .95, .1)  # next vsync is the target. flip asap
+    0.95
+    """
+    n_frames = round((onset - last_flip)/frame_period)
+    if n_frames <= 1:
+        return last_flip
+    return last_flip + (n_frames - 1 + margin)*frame_period
+
+
+def measure_frame_period(win, fallback=1/60):
+    """
+    seconds per frame from flipping the window (screen goes blank while measuring).
+    use before the task starts. falls back to psychopy's monitorFramePeriod
+    """
+    fps = win.getActualFrameRate(nIdentical=20, nMaxFrames=240, nWarmUpFrames=10)
+    if fps:
+        return 1/fps
+    print(f"WARNING: could not measure refresh rate. using {getattr(win, 'monitorFramePeriod', fallback)}")
+    return getattr(win, 'monitorFramePeriod', fallback)
 
 
 def center_textbox(textbox):
@@ -93,44 +170,117 @@ def ratio(screen, image, scale):
     return(float(screen) * scale/float(image))
 
 
+def img_layout(horz, win_size, img_size=(225, 255), imgpercent=.04, vertOffset=0):
+    """
+    pixel x positions and (w, h) size for an image imgpercent of the screen width
+    at horz (-1 to 1, scalar or array). kept fully on screen
+    >>> x, y, size = img_layout([-1, 0, .5], (800, 600), (100, 100), .1)
+    >>> x.tolist(), y, size
+    ([-360.0, 0.0, 200.0], 0.0, (80.0, 80.0))
+    """
+    (sw, sh) = win_size
+    (iw, ih) = img_size
+    # scale evenly in relation to x-axis
+    scalew = ratio(sw, iw, imgpercent)
+    # horz=-1 => -400 for 800 wide screen
+    winmax = sw/2.0
+    halfimgsize = scalew*iw/2.0
+    # are we partially off the screen? max edges perfect
+    horzpos = np.clip(np.asarray(horz, dtype=float)*winmax, halfimgsize - winmax, winmax - halfimgsize)
+    # where to show the image
+    vertpos = (vertOffset)*sh/2.0
+    return horzpos, vertpos, (scalew*iw, scalew*ih)
+
+
+class ScreenGeometry():
+    """
+    pixel positions for the horizontal positions (-1 to 1) a run uses, computed once per window size.
+    dot_pos is position * half the width. img_pos is replace_img's position (image kept on screen)
+    positions not prepared are computed (and kept) on first use
+
+    >>> geo = ScreenGeometry((800, 600))
+    >>> geo.prepare([-1, .5], img_percents=[.15])
+    >>> geo.dot_pos(.5), geo.img_pos(-1, .15)
+    ((200.0, 0), (-340.0, 0.0))
+    >>> geo.set_size((400, 300))
+    True
+    >>> geo.dot_pos(.5)
+    (100.0, 0)
+    """
+    def __init__(self, size=None):
+        self.size = None
+        self.positions = set()
+        self.img_percents = set()
+        self.dots = {}  # position => (x, 0)
+        self.imgs = {}  # (position, imgpercent) => (x, y)
+        if size is not None:
+            self.set_size(size)
+
+    def set_size(self, size):
+        """new window size: tables rebuilt for everything prepared so far. True if changed"""
+        size = tuple(float(x) for x in size)
+        if size == self.size:
+            return False
+        self.size = size
+        self.dots.clear()
+        self.imgs.clear()
+        self.build(self.positions, self.img_percents)
+        return True
+
+    def prepare(self, positions, img_percents=()):
+        """add (unique, non missing) positions to the tables"""
+        positions = {float(p) for p in positions if isinstance(p, (int, float)) and p == p}
+        img_percents = set(img_percents)
+        self.positions |= positions
+        self.img_percents |= img_percents
+        if self.size is not None:
+            self.build(self.positions, self.img_percents)
+
+    def build(self, positions, img_percents):
+        positions = sorted(positions)
+        if not positions or self.size is None:
+            return
+        half = self.size[0]/2
+        self.dots.update({p: (p*half, 0) for p in positions})
+        for pct in img_percents:
+            xs, y, _ = img_layout(positions, self.size, imgpercent=pct)
+            self.imgs.update({(p, pct): (x, y) for p, x in zip(positions, xs.tolist())})
+
+    def dot_pos(self, position):
+        pos = self.dots.get(position)
+        if pos is None:
+            pos = (position*self.size[0]/2, 0)
+            self.dots[position] = pos
+        return pos
+
+    def img_pos(self, position, imgpercent=.04):
+        key = (position, imgpercent)
+        pos = self.imgs.get(key)
+        if pos is None:
+            x, y, _ = img_layout(position, self.size, imgpercent=imgpercent)
+            pos = (float(x), y)
+            self.imgs[key] = pos
+        return pos
+
+
 def replace_img(img, filename, horz, imgpercent=.04, defsize=(225, 255), vertOffset=0):
     '''
     replace_img adjust the image and position of a psychopy.visual.ImageStim
+    see ScreenGeometry.img_pos for positions without the ImageStim
     '''
     # set image, get props
     if filename is not None:
-        img.image = filename
+        img.image = IMAGES.image(filename)  # decoded once per session
         (iw, ih) = img._origSize
     else:
         (iw, ih) = defsize
 
-    (sw, sh) = img.win.size
     img.units = 'pix'
-
-    # resize img
-    scalew = ratio(sw, iw, imgpercent)
-    # scaleh= ratio(sh,ih,imgpercent)
-    # scale evenly in relation to x-axis
-    # img.size=(scalew*iw,scalew*sw/sh*ih) # if units were 'norm'
-    img.size = (scalew*iw, scalew*ih)  # square pixels
-    # img._requestedSize => (80,80) if imgprecent=.1*sw=800
-
-    # # position
-    winmax = sw/float(2)
-    # horz=-1 => -400 for 800 wide screen
-    horzpos = horz*winmax
-    halfimgsize = scalew*iw/2.0
-    # are we partially off the screen? max edges perfect
-    if horzpos - halfimgsize < -winmax:
-        horzpos = halfimgsize - winmax
-    elif horzpos + halfimgsize > winmax:
-        horzpos = winmax - halfimgsize
-
-    # where to show the image
-    vertpos = (vertOffset)*sh/2.0
+    horzpos, vertpos, size = img_layout(horz, img.win.size, (iw, ih), imgpercent, vertOffset)
+    img.size = size  # square pixels
 
     # set
-    img.pos = (horzpos, vertpos)
+    img.pos = (float(horzpos), vertpos)
 
     # # draw if we are not None
     if filename is not None:
@@ -0,0 +1,173 @@
+"""
+whole session planned at launch: every run's onset_df, external messages/TTL codes, and output names
+are read and checked before anyone is in the scanner.
+between runs (while "Finished run" is on screen) the next run is (re)prepared on a worker thread.
+only non-GL work happens there -- psychopy windows and stims stay on the main thread
+"""
+import gc
+import os
+import threading
+import numpy as np
+
+
+def check_onsets(onset_df, events=None):
+    """
+    problems with an onset_df as a list of strings. empty list is good
+    >>> import pandas as pd
+    >>> check_onsets(pd.DataFrame({'onset': [0, 2, 1], 'event_name': ['a', 'b', 'c']}), events=['a', 'b'])
+    ['onsets go backwards at row(s) [2]', "unknown event(s): ['c']"]
+    """
+    problems = []
+    if 'event_name' not in onset_df.columns:
+        problems.append("no 'event_name' column")
+    if 'onset' in onset_df.columns:
+        onsets = onset_df['onset'].to_numpy(dtype=float)
+        if np.isnan(onsets).any():
+            problems.append(f"missing onset at row(s) {np.flatnonzero(np.isnan(onsets)).tolist()}")
+        backwards = np.flatnonzero(np.diff(onsets) < 0) + 1
+        if len(backwards):
+            problems.append(f"onsets go backwards at row(s) {backwards.tolist()}")
+    elif 'dur' not in onset_df.columns:
+        problems.append("no 'onset' or 'dur' column")
+    if events is not None and 'event_name' in onset_df.columns:
+        unknown = sorted(set(onset_df.event_name) - set(events))
+        if unknown:
+            problems.append(f"unknown event(s): {unknown}")
+    return problems
+
+
+class RunPlan():
+    """
+    what a run needs that isn't drawn: onset_df, what each event sends to externals, and output names
+    """
+    def __init__(self, run_num, onset_df, messages=None, ttl=None):
+        self.run_num = run_num
+        self.onset_df = onset_df
+        self.messages = messages  # per event string sent to externals (None if unknown)
+        self.ttl = ttl            # per event TTL code from messages
+        self.run_id = None        # set by SessionPlan.set_participant
+        self.log_path = None
+        self.onsets_path = None
+        self.ready = None         # whatever SessionPlan.prepare's func made
+
+    def __repr__(self):
+        return f"RunPlan(run {self.run_num}: {self.onset_df.shape[0]} events, {self.run_id})"
+
+
+class SessionPlan():
+    """
+    plan every run up front (plan_all) then prepare the next run in the background (prepare/get).
+
+    :param read_func: run number => onset_df
+    :param n_runs: runs are 1 to n_runs
+    :param message_func: onset_df => list of messages events will send (optional)
+    :param ttl_func: message => TTL code (0-255). needs message_func
+    :param events: known event names (e.g. LNCDTask.events). others are an error
+    :param truncate: only keep this many events (for testing)
+    """
+    def __init__(self, read_func, n_runs, message_func=None, ttl_func=None, events=None, truncate=None):
+        self.read_func = read_func
+        self.n_runs = n_runs
+        self.message_func = message_func
+        self.ttl_func = ttl_func
+        self.events = events
+        self.truncate = truncate
+        self.runs = {}      # run_num => RunPlan
+        self.participant = None
+        self.task = None
+        self.worker = None  # (run_num, thread, errors)
+
+    def plan(self, run_num) -> RunPlan:
+        """read and check one run. raises ValueError listing everything wrong"""
+        onset_df = self.read_func(run_num)
+        if self.truncate:
+            onset_df = onset_df[0:self.truncate]
+        problems = check_onsets(onset_df, self.events)
+        messages = ttl = None
+        if self.message_func is not None and not problems:
+            messages = self.message_func(onset_df)
+            if self.ttl_func is not None:
+                ttl = np.array([self.ttl_func(m) for m in messages])
+                bad = np.flatnonzero((ttl < 0) | (ttl > 255))
+                if len(bad):
+                    problems.append(f"TTL code outside 0-255 at row(s) {bad.tolist()}")
+        if problems:
+            raise ValueError(f"run {run_num}: " + "; ".join(problems))
+        plan = RunPlan(run_num, onset_df, messages, ttl)
+        self.runs[run_num] = plan
+        if self.participant is not None:
+            self.name_run(plan)
+        return plan
+
+    def set_truncate(self, truncate):
+        """change truncate (from the run dialog). plans made with the old value are dropped"""
+        self.wait()
+        if truncate != self.truncate:
+            self.truncate = truncate
+            self.runs.clear()
+
+    def plan_all(self):
+        """plan every run now so a bad timing file stops the session before it starts"""
+        problems = []
+        for run_num in range(1, self.n_runs + 1):
+            try:
+                self.plan(run_num)
+            except (ValueError, OSError) as err:
+                problems.append(str(err))
+        if problems:
+            raise ValueError("bad session plan:\n  " + "\n  ".join(problems))
+        return self.runs
+
+    def set_participant(self, participant, task):
+        """output names for every planned run. call again if the participant changes"""
+        self.wait()
+        self.participant = participant
+        self.task = task
+        for plan in self.runs.values():
+            self.name_run(plan)
+
+    def name_run(self, plan):
+        plan.run_id = f"{self.participant.ses_id()}_task-{self.task}_run-{plan.run_num}"
+        plan.log_path = self.participant.log_path(plan.run_id)
+        plan.onsets_path = self.participant.run_path(f"onsets_{plan.run_num:02d}")
+
+    def prepare(self, run_num, func=None):
+        """
+        in the background: plan run_num again (cheap if cached by read_func), make output directories,
+        and run func(plan) if given (non-GL only!). result of func is put in plan.ready.
+        also collect the last run's garbage now instead of during the next run
+        """
+        errors = []
+
+        def work():
+            try:
+                plan = self.plan(run_num)
+                for path in (plan.log_path, plan.onsets_path):
+                    if path:
+                        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                plan.ready = func(plan) if func else None
+                gc.collect()
+            except Exception as err:
+                errors.append(err)
+
+        thread = threading.Thread(target=work, name=f"prepare-run-{run_num}", daemon=True)
+        self.worker = (run_num, thread, errors)
+        thread.start()
+        return thread
+
+    def wait(self):
+        """let a running prepare() finish before plans are changed. its errors are raised by get()"""
+        if self.worker is not None:
+            self.worker[1].join()
+
+    def get(self, run_num) -> RunPlan:
+        """plan for run_num. waits for prepare() if it is working on this run. plans now otherwise"""
+        self.wait()
+        if self.worker is not None and self.worker[0] == run_num:
+            errors = self.worker[2]
+            self.worker = None
+            if errors:
+                raise errors[0]
+        if run_num not in self.runs:
+            self.plan(run_num)
+        return self.runs[run_num]
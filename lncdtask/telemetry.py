@@ -0,0 +1,97 @@
+"""
+per event flip timing recorded by LNCDTask.run/flip_at
+replaces exporting logs and comparing in R (debug/socket_timing.org) for most questions
+"""
+import numpy as np
+import pandas as pd
+
+#: columns recorded for each event. all times in psychopy core.getTime() seconds
+TIMING_COLS = ['scheduled', 'draw_start', 'flip_request', 'flip_time', 'late']
+
+
+class EventTiming():
+    """
+    preallocated arrays (one slot per event) so recording is a few array writes.
+    'late' is flip_time - scheduled. 'dropped_frames' is frames between this flip and the previous one
+    beyond what the schedule asked for.
+
+    >>> t = EventTiming(3, frame_period=.1)
+    >>> t.draw(0, 0); t.flipped(0, 1, 1.0, 1.01)
+    >>> t.draw(1, 1.01); t.flipped(1, 2, 2.0, 2.21)
+    >>> int(t.dropped_frames[1]), t.n_late
+    (2, 1)
+    >>> t.report()['n']
+    2
+    """
+    def __init__(self, n_events, frame_period=None, late_thres=None):
+        self.n_events = n_events
+        self.cols = {col: np.full(n_events, np.nan) for col in TIMING_COLS}
+        self.dropped_frames = np.zeros(n_events, dtype=int)
+        self.reset(frame_period, late_thres)
+
+    def reset(self, frame_period=None, late_thres=None):
+        """clear running summary (start of run). frame_period used for dropped frames and late default"""
+        self.frame_period = frame_period if frame_period else 1/60
+        #: more than this many seconds after scheduled is late. default: missed a whole frame
+        self.late_thres = late_thres if late_thres is not None else self.frame_period
+        for col in self.cols.values():
+            col.fill(np.nan)
+        self.dropped_frames.fill(0)
+        self.prev = None  # index of last flipped event
+        # running summary
+        self.n = 0
+        self.n_late = 0
+        self.max_late = -np.inf
+        self.sum_late = 0.0
+        self.n_dropped = 0
+
+    def draw(self, i, t):
+        """event i function called (drawing starts) at t"""
+        self.cols['draw_start'][i] = t
+
+    def flipped(self, i, scheduled, request, flip):
+        """event i was scheduled for 'scheduled', asked to flip at 'request', and flipped at 'flip'"""
+        late = flip - scheduled
+        cols = self.cols
+        cols['scheduled'][i] = scheduled
+        cols['flip_request'][i] = request
+        cols['flip_time'][i] = flip
+        cols['late'][i] = late
+
+        if self.prev is not None:
+            prev = self.prev
+            want = round((scheduled - cols['scheduled'][prev])/self.frame_period)
+            got = round((flip - cols['flip_time'][prev])/self.frame_period)
+            if got > want:
+                self.dropped_frames[i] = got - want
+                self.n_dropped += got - want
+        self.prev = i
+
+        self.n += 1
+        self.sum_late += late
+        if late > self.max_late:
+            self.max_late = late
+        if late > self.late_thres:
+            self.n_late += 1
+
+    def report(self):
+        """summary of lateness (seconds) across recorded events"""
+        late = self.cols['late'][~np.isnan(self.cols['late'])]
+        if len(late) == 0:
+            return {'n': 0}
+        p50, p95 = np.percentile(late, [50, 95])
+        return {'n': self.n,
+                'n_late': self.n_late,
+                'late_thres': self.late_thres,
+                'late_mean': self.sum_late/self.n,
+                'late_p50': p50,
+                'late_p95': p95,
+                'late_max': self.max_late,
+                'dropped_frames': self.n_dropped,
+                'frame_period': self.frame_period}
+
+    def to_df(self):
+        """one row per event"""
+        df = pd.DataFrame(self.cols, copy=False)
+        df['dropped_frames'] = self.dropped_frames
+        return df
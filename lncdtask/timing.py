@@ -1,5 +1,57 @@
 import glob
 import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+
+def parse_1d(text):
+    """
+    parse AFNI stim times text. one line per run. tokens like
+      onset, onset:dur, onset*mod, onset*mod:dur, or '*' (no event; placeholder)
+    parsed for all tokens at once with numpy string functions
+    returns dict of arrays: onset, dur, mod (nan when not given), and run (0-based line)
+
+    >>> d = parse_1d("1.5:2 3*0.5 7\\n*\\n4.25*2:1")
+    >>> d['onset'].tolist(), d['dur'].tolist()[0], d['run'].tolist()
+    ([1.5, 3.0, 7.0, 4.25], 2.0, [0, 0, 0, 2])
+    >>> d['mod'].tolist()[1], d['mod'].tolist()[3]
+    (0.5, 2.0)
+    """
+    lines = [line for line in text.splitlines() if not line.lstrip().startswith('#')]
+    tokens = [line.split() for line in lines]
+    run = np.repeat(np.arange(len(tokens)), [len(t) for t in tokens])
+    tokens = np.array([tok for line in tokens for tok in line], dtype=str)
+    keep = tokens != '*'
+    tokens, run = tokens[keep], run[keep]
+    if len(tokens) == 0:  # np.char.partition fails on empty
+        empty = np.array([], dtype=float)
+        return {'onset': empty, 'dur': empty, 'mod': empty, 'run': run}
+
+    # onset*mod:dur => ['onset*mod', ':', 'dur'] => ['onset', '*', 'mod']
+    timemod, _, dur = np.char.partition(tokens, ':').T
+    onset, _, mod = np.char.partition(timemod, '*').T
+
+    def to_float(x):
+        return np.where(x == '', 'nan', x).astype(float)
+
+    return {'onset': to_float(onset), 'dur': to_float(dur), 'mod': to_float(mod), 'run': run}
+
+
+def read_1d(fname):
+    """one AFNI 1D file. see parse_1d"""
+    with open(fname) as f:
+        return parse_1d(f.read())
+
+
+def onset_files(onsetprefix):
+    onsetfiles = sorted(glob.glob(onsetprefix + '*1D'))
+    if(len(onsetfiles) <= 0):
+        msg = 'no onset files in %s' % onsetprefix
+        raise Exception(msg)
+    return onsetfiles
+
+
 def read_timing(onsetprefix):
     """
     read onsets files given a pattern. will append *1D to pattern
@@ -19,19 +71,38 @@ def read_timing(onsetprefix):
          vgs_Right_Indoor.1D
          vgs_Right_None.1D
          vgs_Right_Outdoor.1D
+    see read_onset_df to keep durations and get one sorted dataframe
     """
     onsetdict = {}
-    onsetfiles = glob.glob(onsetprefix + '*1D')
-    if(len(onsetfiles) <= 0):
-        msg = 'no onset files in %s' % onsetprefix
-        raise Exception(msg)
-    for onset1D in onsetfiles:
+    for onset1D in onset_files(onsetprefix):
         # key name will be file name but
         # remove the last 3 chars (.1D) and the glob part
         # onsettype = onset1D[:-3].replace(onsetprefix, '')
         onsettype = os.path.basename(onset1D)[:-3]
-        with open(onset1D) as f:
-            onsetdict[onsettype] = [float(x.split(':')[0])
-                                    for x in f.read().split()]
+        onsetdict[onsettype] = read_1d(onset1D)['onset'].tolist()
     return(onsetdict)
 
+
+def read_onset_df(onsetprefix):
+    """
+    all *1D files matching onsetprefix merged into one onset sorted dataframe
+    columns: onset, dur, mod, run, event_name (file name without .1D)
+    """
+    parts = []
+    for onset1D in onset_files(onsetprefix):
+        d = read_1d(onset1D)
+        d['event_name'] = np.repeat(os.path.basename(onset1D)[:-3], len(d['onset']))
+        parts.append(d)
+    merged = {col: np.concatenate([d[col] for d in parts]) for col in parts[0]}
+    order = np.lexsort((merged['onset'], merged['run']))
+    return pd.DataFrame({col: vals[order] for col, vals in merged.items()})
+
+
+def read_onset_dfs(onsetprefixes, max_workers=None):
+    """
+    read_onset_df for many prefixes (e.g. every stims/<seed>/) concurrently.
+    returns dictionary of prefix => onset_df
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        dfs = pool.map(read_onset_df, onsetprefixes)
+        return dict(zip(onsetprefixes, dfs))
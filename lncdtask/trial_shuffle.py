@@ -1,38 +1,35 @@
 #!/usr/bin/env python3
 import numpy
-import math
-import numpy.matlib
-import numpy.random
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-def shuf_for_ntrials(vec, ntrials):
+
+def shuf_for_ntrials(vec, ntrials, rng=None):
     '''
      shuf_for_ntrials creates a shuffled vector
      repeated to match the number of trials
-    >>> x = shuf_for_ntrials([1,2,3,4,5], 40) 
+     vec is not modified. rng is a numpy.random.Generator (default: fresh unseeded)
+    >>> x = shuf_for_ntrials([1,2,3,4,5], 40)
     >>> len(x)
     40
-    >>> x = shuf_for_ntrials([1,2,3,4,5], 2) 
+    >>> x = shuf_for_ntrials([1,2,3,4,5], 2)
     >>> len(x)
     2
     '''
     nitems = len(vec)
     if nitems == 0 or ntrials == 0:
         return([])
+    rng = numpy.random.default_rng() if rng is None else rng
 
-    items_over = ntrials % nitems
-    nfullvec = int(math.floor(ntrials/nitems))
     # have 3 items want 5 trials
     # nfullvec=1; items_over=2
+    nfullvec, items_over = divmod(ntrials, nitems)
+    vec = numpy.asarray(vec)
 
     # repeat full vector as many times as we can
-    mat = numpy.matlib.repmat(vec, 1, nfullvec).flatten()
     # then add a truncated shuffled vector as needed
-    if items_over > 0:
-        numpy.random.shuffle(vec)
-        mat = numpy.append(mat, vec[:items_over])
-
-    numpy.random.shuffle(mat)
-    return(mat)
+    mat = numpy.concatenate([numpy.tile(vec, nfullvec), rng.permutation(vec)[:items_over]])
+    return(rng.permutation(mat))
 
 
 def dist_total_into_n(total, n):
@@ -55,3 +52,163 @@ def dist_total_into_n(total, n):
         raise ValueError('total %d not matched in %s' % (total, arr))
     numpy.random.shuffle(arr)
     return(arr)
+
+
+def max_run(x, value=None) -> int:
+    """
+    longest run of the same value (only runs of value if given)
+    >>> max_run([1, 1, 0, 0, 0, 1])
+    3
+    >>> max_run([1, 1, 0, 0, 0, 1], value=1)
+    2
+    """
+    x = numpy.asarray(x)
+    if len(x) == 0:
+        return 0
+    ends = numpy.concatenate([numpy.flatnonzero(x[1:] != x[:-1]), [len(x) - 1]])
+    lengths = numpy.diff(numpy.concatenate([[-1], ends]))
+    if value is not None:
+        lengths = lengths[x[ends] == value]
+    return int(lengths.max()) if len(lengths) else 0
+
+
+def transition_counts(x):
+    """
+    first-order transitions: counts[i, j] is how often level i is followed by level j
+    levels are sorted unique values of x
+    >>> transition_counts(['L', 'R', 'R', 'L']).tolist()
+    [[0, 1], [1, 1]]
+    """
+    levels, codes = numpy.unique(x, return_inverse=True)
+    counts = numpy.zeros((len(levels), len(levels)), dtype=int)
+    numpy.add.at(counts, (codes[:-1], codes[1:]), 1)
+    return counts
+
+
+def constrained_order(factors, max_runs=None, balance=(), rng=None, max_tries=1000):
+    """
+    order trials so no factor repeats a level more than max_runs[factor] times in a row
+    and (for factors in balance) first-order transitions are close to what an even mix would give.
+
+    built one trial at a time (a Markov chain over what's left): trials that would break a run cap
+    are not candidates, the rest are weighted by how many of that kind remain and by how short
+    the transition into them is of its target. restarts (up to max_tries) only on a dead end.
+
+    :param factors: factor name => level of every trial. e.g. {'side': [...], 'rew': [...]}
+    :param max_runs: factor name => longest allowed run. e.g. {'side': 3}
+                     or a dict to cap only some levels. e.g. {'catch': {True: 2}}
+    :param balance: factor names to balance first-order transitions for
+    :param rng: numpy.random.Generator
+    returns index array into the trials: the new order
+
+    >>> side = ['L']*8 + ['R']*8
+    >>> order = constrained_order({'side': side}, {'side': 2}, rng=numpy.random.default_rng(1))
+    >>> max_run(numpy.array(side)[order]) <= 2, sorted(order.tolist()) == list(range(16))
+    (True, True)
+    """
+    rng = numpy.random.default_rng() if rng is None else rng
+    max_runs = max_runs or {}
+    names = list(factors)
+    # each factor as integer codes. trials with the same codes are interchangeable ("kinds")
+    uniq = [numpy.unique(factors[f], return_inverse=True) for f in names]
+    codes = numpy.column_stack([inv.ravel() for _, inv in uniq])
+    n_trials = codes.shape[0]
+    # unique rows via one integer key per trial (unique(axis=0) is much slower)
+    dims = codes.max(axis=0) + 1
+    keys, kind_of = numpy.unique(numpy.ravel_multi_index(codes.T, dims), return_inverse=True)
+    kinds = numpy.column_stack(numpy.unravel_index(keys, dims))
+    kind_of = kind_of.ravel()
+    kind_count = numpy.bincount(kind_of, minlength=len(kinds))
+    n_kinds, n_names = kinds.shape
+
+    # few kinds, one draw per trial: python lists beat numpy's per call overhead in the loop below
+    # same[a][j]: kinds matching kind a on factor j. caps per kind (the cap of its level)
+    same = [[numpy.flatnonzero(kinds[:, j] == kinds[a, j]).tolist() for j in range(n_names)]
+            for a in range(n_kinds)]
+    caps = []
+    for j, f in enumerate(names):
+        if f not in max_runs:
+            continue
+        cap = max_runs[f]
+        levels = uniq[j][0].tolist()
+        # per level cap. levels not given are not capped
+        if isinstance(cap, dict):
+            cap = [cap.get(lvl, n_trials) for lvl in levels]
+        else:
+            cap = [cap] * len(levels)
+        caps.append((j, [cap[kinds[a, j]] for a in range(n_kinds)]))
+    balanced = []
+    for f in balance:
+        j = names.index(f)
+        n_lvl = numpy.bincount(codes[:, j])
+        # transitions expected if levels were evenly mixed
+        target = numpy.outer(n_lvl, n_lvl) * (n_trials - 1) / n_trials**2
+        balanced.append((j, target))
+    kind_lvl = kinds.tolist()
+
+    for _ in range(max_tries):
+        remaining = kind_count.tolist()
+        last = None
+        run = [0] * n_names
+        used = [numpy.zeros_like(target) for _, target in balanced]
+        seq = []
+        draws = rng.random(n_trials).tolist()
+        for i in range(n_trials):
+            weight = list(remaining)
+            if last is not None:
+                for j, cap in caps:
+                    if run[j] >= cap[last]:
+                        for b in same[last][j]:
+                            weight[b] = 0
+                for (j, target), u in zip(balanced, used):
+                    a = kinds[last, j]
+                    # under-used transitions are favored. over-used still possible (never 0)
+                    favor = numpy.clip(target[a, kinds[:, j]] - u[a, kinds[:, j]], 0, None) + .1
+                    weight = (weight * favor).tolist()
+            total = sum(weight)
+            if total <= 0:
+                break  # dead end. start over
+            # weighted draw
+            pick = draws[i] * total
+            k = 0
+            while k < n_kinds - 1 and pick >= weight[k]:
+                pick -= weight[k]
+                k += 1
+            while weight[k] == 0:  # float rounding ran off the end
+                k -= 1
+            if last is not None:
+                run = [r + 1 if x == y else 1 for r, x, y in zip(run, kind_lvl[k], kind_lvl[last])]
+                for (j, _), u in zip(balanced, used):
+                    u[kinds[last, j], kinds[k, j]] += 1
+            else:
+                run = [1] * n_names
+            remaining[k] -= 1
+            seq.append(k)
+            last = k
+        else:
+            # kinds to trial indices: shuffle within each kind
+            order = numpy.empty(n_trials, dtype=int)
+            seq = numpy.array(seq)
+            for k in range(n_kinds):
+                order[seq == k] = rng.permutation(numpy.flatnonzero(kind_of == k))
+            return order
+    raise ValueError(f'no order meeting {max_runs} found in {max_tries} tries')
+
+
+def _order_from_seed(seed_seq, factors, max_runs, balance, max_tries):
+    return constrained_order(factors, max_runs, balance, numpy.random.default_rng(seed_seq), max_tries)
+
+
+def constrained_orders(n, factors, max_runs=None, balance=(), seed=None, n_jobs=1, max_tries=1000):
+    """
+    n independent constrained_order()s. each gets its own generator spawned from seed
+    (numpy.random.SeedSequence), so results are the same regardless of n_jobs.
+    n_jobs > 1 (or None for all cores) splits the work across processes
+    """
+    children = numpy.random.SeedSequence(seed).spawn(n)
+    make = partial(_order_from_seed, factors=factors, max_runs=max_runs,
+                   balance=balance, max_tries=max_tries)
+    if n_jobs == 1:
+        return [make(c) for c in children]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(make, children, chunksize=max(1, n // 64)))
@@ -21,38 +21,34 @@ VGS_DOT_POS = [-.875, -.43, .43,.875] #  (c(40,180,460,600) - 640/2) /(640/2)
 
 try:
     from lncdtask import LNCDTask, create_window, replace_img, \
-            wait_for_scanner, ExternalCom, RunDialog, FileLogger, msg_screen
+            wait_for_scanner, ExternalCom, RunDialog, FileLogger, msg_screen, \
+            build_schedule, block_permutations
 except ImportError:
     from lncdtask.lncdtask import LNCDTask, create_window, replace_img,\
-            wait_for_scanner, ExternalCom, RunDialog, FileLogger, msg_screen
+            wait_for_scanner, ExternalCom, RunDialog, FileLogger, msg_screen, \
+            build_schedule, block_permutations
 
 import sys
 import numpy as np
-import pandas as pd
 
-def random_positions(pos=VGS_DOT_POS, delay=VGS_CUE_DURS_SEC, reps=3):
+def random_positions(pos=VGS_DOT_POS, delay=VGS_CUE_DURS_SEC, reps=3, rng=None):
     """
     randomize position and delay pairs with 'reps' number of repeats
+    rng is a numpy.random.Generator (default: fresh unseeded)
     """
-    pos_delay = np.array([(p,d) for p in pos for d in delay])
-    ridx = [pd for ii in range(reps) for pd in np.random.permutation(len(pos_delay)) ]
-    return pos_delay[ridx]
+    pos_delay = np.stack(np.meshgrid(pos, delay, indexing='ij'), axis=-1).reshape(-1, 2)
+    return pos_delay[block_permutations(len(pos_delay), reps, rng)]
 
 
-def random_pos_df():
-    pos_delays = random_positions()
-    events = []
-    onset = 0
-
-    for p,d in pos_delays:
-        for event in ['vgscue','gap','vgstarget','blank']:
-            events.append({'event_name': event, 'position': p, 'delay': d, 'onset': onset, 'code':f'{event}_{d}_{p}'})
-            # accumulates onsets
-            # 2 seconds for all but vgs_delay which is variable (TODO: what values)
-            dur = d if event == 'vgscue' else VGS_TIMING[event]
-            onset = onset + dur
-
-    return pd.DataFrame(events)
+def random_pos_df(rng=None):
+    """
+    events in VGS_TIMING order for each position/delay pair
+    vgscue duration is the pair's delay (VGS_CUE_DURS_SEC)
+    """
+    pos_delays = random_positions(rng=rng)
+    return build_schedule({'position': pos_delays[:, 0], 'delay': pos_delays[:, 1]},
+                          VGS_TIMING, variable={'vgscue': 'delay'},
+                          code_cols=['delay', 'position'])
 
 def ttl_wrap(desc):
     print(desc)
@@ -95,7 +91,7 @@ class VGSEye(LNCDTask):
         return msg_screen(self.msgbox,'Look at the green cross', pos=(0,.9))
 
     def instruction_dot(self):
-        self.crcl.pos = (0.9 * self.win.size[0]/2, 0)
+        self.crcl.pos = self.geometry.dot_pos(0.9)
         self.crcl.draw()
         return msg_screen(self.msgbox,'A dot will appear.\nLook at it!', pos=(0,.9))
 
@@ -128,7 +124,7 @@ class VGSEye(LNCDTask):
         NB. prev did not pass 'code' column to self.dot when vgstarget
             now code set like rest of task events ('vsgtarget_{dur}_{pos}')
         """
-        self.crcl.pos = (position * self.win.size[0]/2, 0)
+        self.crcl.pos = self.geometry.dot_pos(position)
         self.crcl.draw()
         return self.flip_at(onset, code)
 
@@ -202,6 +198,7 @@ def run_vgseye(parsed):
     vgs.gobal_quit_key()  # escape quits
     vgs.DEBUG = False
     vgs.eyelink = None
+    vgs.lock_to_frames()  # flip on vsync nearest each onset
 
     participant = run_info.mk_participant(['VGSEye'])
     run_id = f"{participant.ses_id()}_task-VGS_run-{run_info.run_num()}"
@@ -1,28 +1,45 @@
 #!/usr/bin/env python3
-from eyelinkio import read_edf
+try:
+    from lncdtask.edfcache import load_edf
+except ImportError:
+    from edfcache import load_edf
 import numpy as np
 import re
 import logging
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
 
-def overlapping_data(idx, data, on, off, datatype):
-    overlap = []
-    if not data:
-        return (idx,overlap)
-    while idx < len(data) and (data[idx]['stime'] < on):
-        logging.debug("forward %s idx: onset %f < %f blink start",datatype, on, data[idx]['stime'])
-        idx += 1
-    while idx < len(data) and (data[idx]['etime'] < off):
-        logging.debug("include idx: onset %f+1 < %f blink end", off, data[idx]['etime'])
-        overlap.append(data[idx])
-        idx += 1
+def sample_windows(times, on, off):
+    """
+    index range [start, stop) of times within each [on, off) window. one searchsorted for every window.
+    only needs times sorted: irregular sampling and gaps are fine
+    >>> sample_windows(np.array([0, .002, .004, .010, .012]), [.001, .003], [.011, 1])
+    (array([1, 2]), array([4, 5]))
+    """
+    return (np.searchsorted(times, on, side='left'),
+            np.searchsorted(times, off, side='left'))
+
+
+def event_windows(events, on, off):
+    """
+    index range [start, stop) of discrete events (blinks, saccades; structured array sorted by 'stime')
+    that start at or after on and end before off. one eye's events don't overlap so etime is sorted too
+    (running max in case it isn't)
+    >>> ev = np.array([(.1, .2), (.5, .7), (.8, 1.2)], dtype=[('stime', 'f8'), ('etime', 'f8')])
+    >>> event_windows(ev, [0, .4, .75], [1, 1, 1])
+    (array([0, 1, 2]), array([2, 2, 2]))
+    """
+    start = np.searchsorted(events['stime'], on, side='left')
+    stop = np.searchsorted(np.maximum.accumulate(events['etime']), off, side='left')
+    return start, np.maximum(start, stop)
+
 
-    if idx >= len(data):
-        idx = len(data)-1
+def first_eye(discrete, names=('blinks', 'saccades')):
+    """blinks, saccades only for the first eye seen (structured arrays)"""
+    seen = [discrete[n]['eye'][0] for n in names if len(discrete[n])]
+    eye = seen[0] if seen else None
+    return [discrete[n][discrete[n]['eye'] == eye] for n in names]
 
-    logging.debug("%s hold: onset %f before %f next %s start",datatype, on, data[idx]['stime'], datatype)
-    return (idx, overlap)
 
 Seconds = float
 def extract_target(fname, msg_regex='dot',t_dur:Seconds =1) -> tuple:
@@ -30,76 +47,53 @@ def extract_target(fname, msg_regex='dot',t_dur:Seconds =1) -> tuple:
     """
     Find all events match mgs_regexp and collect saccades, blinks, and eye position within.
 
-    :param fname: EYD EyeLink file name. Read with eyelinkio
+    :param fname: EYD EyeLink file name. Read with eyelinkio once, then from its cache (see lncdtask/edfcache.py)
     :param msg_regex: pattern to match target message that denotes the start of event(s) to extract
     :param t_dur: duration in seconds to extract of event after event message
     :return: dict per event (likely each trial trial) with
           'msg' - the matched evet message
           'onset' - the time this event started
-          'blinks' - list of blinks within this event from 'discrete' portion of eyd file
-          'saccades' - list of saccades within this event from 'discrete' portion of eyd file
+          'blinks' - blinks within this event from 'discrete' portion of eyd file (structured array)
+          'saccades' - saccades within this event from 'discrete' portion of eyd file
               each saccade has keys: 'stime', 'etime', 'exp'
           'samples' - all samples of this event
               samples is 2D array like [(x,y,pupil x l,r) x sample]
               see hdr['sample_fields']
-          'times'   - list of times corresponding to each sample for this event.
-              expect times to have constant steps, e.g. @ 500Hz
+          'times'   - times corresponding to each sample for this event.
+              samples are those with onset <= time < onset+t_dur. gaps or uneven steps are fine
+        samples, times, blinks, and saccades are views into the whole recording's (memory mapped) arrays
         and eyd header dict -- importantly included screen resolution with key 'screen_x'
     """
 
-    edf_file = read_edf(fname)
-    reg = re.compile(msg_regex)
-    onsets = [(onset,msg.decode())
-              for (onset,msg) in edf_file['discrete']['messages']
-              if reg.search(msg.decode())]
-
-    hdr = dict(screen_x=None,screen_y=None,
-               sample_fields=edf_file['info']['sample_fields'])
-    for t,msg in edf_file['discrete']['messages']:
-         gaz = re.search('GAZE_COORDS [0-9.]+ [0-9.]+ ([0-9.]+) ([0-9.]+)',msg.decode())
-         if gaz:
-             hdr['screen_x'],hdr['screen_y'] = gaz.groups(1)
-             break
+    edf = load_edf(fname)
+    onsets = edf.messages(msg_regex)
 
+    hdr = dict(screen_x=edf.info['screen_x'], screen_y=edf.info['screen_y'],
+               sample_fields=edf.info['sample_fields'])
 
     # only look at first eye tracked
-    first_eye_seen =edf_file['discrete']['blinks'][0]['eye']
-    blinks = [x for x in edf_file['discrete']['blinks'] if x[0] == first_eye_seen]
-    saccs = [x for x in edf_file['discrete']['saccades'] if x[0] == first_eye_seen]
-    times = edf_file['times']
-    samp = times[1]-times[0]
-    t_data = [{'blinks':[], 'saccades':[],
-               'onset': x[0], 'msg': x[1],
-               'samples':[],
-               'times':[]}
-              for x in onsets]
-
-    idx = {'blink':0, 'sac': 0}
-    t_adjust = 0
-    for (i, (t, msg)) in enumerate(onsets):
-        (idx['blinks'], overlap) = overlapping_data(idx['blink'], blinks, t, t+t_dur, 'blinks')
-        t_data[i]['blinks'] = overlap
-
-        (idx['sac'], overlap) = overlapping_data(idx['sac'], saccs, t, t+t_dur, 'saccs')
-        t_data[i]['saccades'] = overlap
-
-        t_s = int(t//samp)
-        if abs(tdiff := t - times[t_s] ) > samp:
-            t_adjust = int(tdiff//samp)
-            logging.warning("stime adjusted %d samples (%f=%f-%f) on trial %d",
-                            t_adjust, tdiff,times[t_s],t, i)
-            t_s = int(t//samp) + t_adjust
-
-        t_e = int((t+t_dur)//samp) + t_adjust
-        if abs(tdiff := t + t_dur -times[t_e]) > samp:
-            logging.warning("etime adjusted %d samples (%f) on %d", t_adjust, tdiff, i)
-            t_adjust = int(tdiff*samp)
-            t_e = int((t+t_dur)//samp) + t_adjust
-
-        assert abs(times[t_s] - t) <= samp
-        assert abs(times[t_e] - t - t_dur) <= samp
-        t_data[i]['samples'] = edf_file['samples'][:,t_s:t_e]
-        t_data[i]['times'] = edf_file['times'][t_s:t_e]
+    blinks, saccs = first_eye(edf.events)
+    # memory mapped: windows below only read their own pages
+    times = edf.times
+    samples = edf.samples
+
+    on = np.array([t for t, _ in onsets], dtype=float)
+    off = on + t_dur
+    # every window at once
+    s_start, s_stop = sample_windows(times, on, off)
+    b_start, b_stop = event_windows(blinks, on, off)
+    a_start, a_stop = event_windows(saccs, on, off)
+
+    t_data = [{'onset': t, 'msg': msg,
+               'blinks': blinks[b_start[i]:b_stop[i]],
+               'saccades': saccs[a_start[i]:a_stop[i]],
+               'samples': samples[:, s_start[i]:s_stop[i]],
+               'times': times[s_start[i]:s_stop[i]]}
+              for i, (t, msg) in enumerate(onsets)]
+
+    for i, d in enumerate(t_data):
+        if len(d['times']) == 0:
+            logging.warning("no samples for trial %d (%s @ %f)", i, d['msg'], d['onset'])
 
     return (t_data, hdr)
 
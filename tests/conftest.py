@@ -0,0 +1,3 @@
+# no display here: pyglet must not make its hidden (shadow) window when psychopy.visual is imported
+import pyglet
+pyglet.options['shadow_window'] = False
@@ -0,0 +1,63 @@
+import socket
+import threading
+import time
+from lncdtask.arrington_socket import ArringtonSocket
+
+
+def echo_server(received, delay=0):
+    """listen on a free local port. record what comes in and echo it back (after delay seconds)"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    s.listen(1)
+
+    def serve():
+        con, _ = s.accept()
+        while data := con.recv(4096):
+            received.append(data)
+            time.sleep(delay)
+            con.sendall(data)
+        con.close()
+        s.close()
+    threading.Thread(target=serve, daemon=True).start()
+    return s.getsockname()[1]
+
+
+def test_event_one_write():
+    received = []
+    port = echo_server(received)
+    et = ArringtonSocket('127.0.0.1', port, verbose=False)
+    assert et.server.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+
+    rtts = et.probe(n=2)
+    assert all(x is not None for x in rtts)
+
+    received.clear()
+    et.event("1 ring rew 0.5")
+    et.server.recv(4096)  # echo means server has it
+    assert received == [b'VPX2 39;220;dataFile_InsertString "1 ring rew 0.5";' +
+                        b'VPX2 26;220;say "sent 1 ring rew 0.5";']
+    et.server.close()
+
+
+def test_say_rate_limit():
+    received = []
+    port = echo_server(received)
+    et = ArringtonSocket('127.0.0.1', port, verbose=False, say_interval=60)
+    assert et.want_say()
+    assert not et.want_say()
+    et.say = False
+    et.last_say = None
+    assert not et.want_say()
+    et.server.close()
+
+
+def test_probe_skips_stale_reply():
+    """a reply nobody read is drained, not taken as the probe's"""
+    received = []
+    port = echo_server(received, delay=.1)
+    et = ArringtonSocket('127.0.0.1', port, verbose=False)
+    et.event("1 ring rew 0.5")
+    time.sleep(.15)  # its echo is waiting, unread
+    rtts = et.probe(n=2)
+    assert all(x is not None and x >= .09 for x in rtts)
+    et.server.close()
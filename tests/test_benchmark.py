@@ -0,0 +1,45 @@
+from lncdtask.benchmark import task_benches, bench_task, regressions, baseline, PARTS
+
+
+def test_bench_eyecal_rest():
+    """runs headless. every event type timed"""
+    benches = task_benches()
+    cal = bench_task(benches['EyeCal'], repeat=1)
+    assert set(cal) == {'iti', 'dot'}
+    assert cal['dot']['n'] == 40
+    rest = bench_task(benches['RestTask'], repeat=1)
+    assert rest['with_instructions']['n'] == 301
+    assert all(part in cal['dot'] for part in PARTS)
+    assert cal['dot']['total'] >= cal['dot']['draw']
+
+
+def test_no_regression_against_self():
+    entry = {'results': {'EyeCal': bench_task(task_benches()['EyeCal'], repeat=1)}}
+    assert regressions(baseline([entry]), entry) == []
+
+
+def test_event_messages_prepared():
+    """every message a run sends was given to the externals' prepare() first"""
+    import io
+    import contextlib
+    import numpy as np
+    from lncdtask.benchmark import QuietExternal, StubWindow, EventTimer, headless
+
+    class Recorder(QuietExternal):
+        def prepare(self, messages):
+            self.prepared = set(messages)
+
+        def event(self, code=None):
+            self.sent.append(code)
+
+    benches = task_benches()
+    for name in ['DollarReward', 'EyeCal', 'MGSEye']:
+        bench = benches[name]
+        rec = Recorder()
+        rec.sent = []
+        timer = EventTimer()
+        with headless(), contextlib.redirect_stdout(io.StringIO()):
+            task = bench.setup(StubWindow(), [rec], timer)
+            bench.drive(task, bench.schedule(np.random.default_rng(1)), timer)
+        assert rec.sent
+        assert set(rec.sent) <= rec.prepared, name
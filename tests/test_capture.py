@@ -0,0 +1,34 @@
+import numpy as np
+from PIL import Image
+from lncdtask.capture import FrameCapture
+
+
+def test_dedup_and_order(tmp_path):
+    """repeats are reported with the first file. rows flipped (gl is bottom up)"""
+    cap = FrameCapture(str(tmp_path), max_pending=2)
+    a = np.zeros((3, 2, 3), dtype=np.uint8)
+    a[0] = 255  # bottom row white
+    b = np.ones((3, 2, 3), dtype=np.uint8)
+    for i, frame in enumerate([a, b, a]):
+        cap.submit(frame, float(i))
+    cap.submit(a, 3.0, name='named')
+    cap.flush()
+    saved = cap.poll()
+    assert [t for _, t, _ in saved] == [0.0, 1.0, 2.0, 3.0]
+    assert saved[0][0] == saved[2][0] != saved[1][0]
+    assert saved[3][0].endswith('named.png')
+    assert len(list(tmp_path.iterdir())) == 3
+    img = np.asarray(Image.open(saved[0][0]))
+    assert img[-1].min() == 255 and img[0].max() == 0
+    cap.close()
+
+
+def test_close_all_writes_queue(tmp_path):
+    """nothing queued is lost at exit (close_all is registered with atexit)"""
+    from lncdtask.capture import close_all
+    cap = FrameCapture(str(tmp_path))
+    for i in range(5):
+        cap.submit(np.full((2, 2, 3), i, dtype=np.uint8), float(i))
+    close_all()
+    assert not cap.worker.is_alive()
+    assert len(cap.poll()) == 5
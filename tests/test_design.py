@@ -0,0 +1,32 @@
+import numpy as np
+from lncdtask import design
+from lncdtask.dollarreward import read_timing_tr_independent
+
+
+def test_generate_counts():
+    trials = design.generate(np.random.default_rng(1))
+    df = design.to_onset_df(trials)
+    counts = df.event_name.value_counts()
+    assert counts['ring'] == 46
+    assert counts['prep'] == 36
+    assert counts['dot'] == 32
+    assert (df.onset.diff().dropna() > 0).all()
+    assert df.onset.iloc[-1] == 302.7
+    iti = trials['iti']
+    assert iti.min() >= 1.5 and iti.max() <= 15
+
+
+def test_search_reproducible():
+    best = design.search(50, top_n=2, n_jobs=1)
+    assert len(best) == 2
+    score, vif, seed = best[0]
+    assert design.evaluate(seed)[0] == score
+
+
+def test_tsv_roundtrip(tmp_path):
+    df = design.to_onset_df(design.generate(np.random.default_rng(2)))
+    fname = str(tmp_path / "dollar_reward_noTR_304.2_2.tsv")
+    design.write_tsv(df, fname)
+    onset_df = read_timing_tr_independent(fname)
+    assert onset_df.shape[0] == df.shape[0]
+    assert onset_df.position.max() <= 1
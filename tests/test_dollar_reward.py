@@ -11,3 +11,29 @@ def test_ttl():
 
     v = ttl(1, 'iti', 'iti', None)
     assert v == 15
+
+
+def test_read_timing_cached(tmp_path, monkeypatch):
+    import shutil
+    from lncdtask import dollarreward
+    monkeypatch.setattr(dollarreward, 'TIMING_CACHE_DIR', str(tmp_path / "cache"))
+    fname = tmp_path / "dollar_reward_events.txt"
+    shutil.copy("dollar_reward_events.txt", fname)
+
+    df = dollarreward.read_timing(2, fname=str(fname))
+    assert len(list((tmp_path / "cache").glob("dollar_reward_events.txt-*.npz"))) == 1
+    assert not list(tmp_path.glob(".*.npz"))
+    assert df.event_name.tolist()[:4] == ['iti', 'iti', 'iti', 'ring']
+    assert (df.run.dropna() == 2).all()
+    assert df.onset.tolist()[:3] == [0, 1.5, 3]
+
+    # run() changes onset_df. cached copy should not see that
+    df['onset'] += 100
+    assert dollarreward.read_timing(2, fname=str(fname)).onset[0] == 0
+
+    # fresh session reads from npz
+    dollarreward._TIMING_COLUMNS.clear()
+    dollarreward._TIMING_DFS.clear()
+    from_npz = dollarreward.read_timing(2, fname=str(fname))
+    assert from_npz.ring_type.isna().sum() == df.ring_type.isna().sum()
+    assert from_npz.position.equals(df.position)
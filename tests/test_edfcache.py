@@ -0,0 +1,53 @@
+import os
+import numpy as np
+from lncdtask.edfcache import write_cache, ConvertedEDF, load_edf, cache_dir_for
+
+
+def fake_edf():
+    """shaped like eyelinkio.read_edf output"""
+    times = np.arange(0, 10, .002)
+    ev = [('eye', 'f8'), ('stime', 'f8'), ('etime', 'f8')]
+    msgs = np.array([(0.5, b'GAZE_COORDS 0.00 0.00 1919.00 1079.00'), (2.0, b'1_dot_rew_0.5'), (4.0, b'2_ring_neu')],
+                    dtype=[('stime', 'f8'), ('msg', 'O')])
+    return {'times': times,
+            'samples': np.vstack([times * 10, times * 20]),
+            'info': {'sample_fields': ['xpos_left', 'xpos_right'], 'sfreq': np.float64(500)},
+            'discrete': {'messages': msgs,
+                         'blinks': np.array([(0., 1., 1.2)], dtype=ev),
+                         'saccades': np.array([(0., 2.1, 2.2), (0., 4.1, 4.3)], dtype=ev)}}
+
+
+def test_roundtrip(tmp_path):
+    edf = ConvertedEDF(write_cache(fake_edf(), str(tmp_path / 'run1-abc')))
+    assert isinstance(edf.samples, np.memmap)
+    assert edf.samples.shape == (2, 5000)
+    assert edf.messages('dot') == [(2.0, '1_dot_rew_0.5')]
+    assert (edf.info['screen_x'], edf.info['screen_y']) == ('1919.00', '1079.00')
+    assert edf.info['sfreq'] == 500
+    assert edf.events['saccades']['stime'].tolist() == [2.1, 4.1]
+
+
+def test_cache_hit(tmp_path):
+    """cached conversion is used: read_edf (eyelinkio) not needed"""
+    fname = tmp_path / 'run1.edf'
+    fname.write_bytes(b'not really an edf')
+    outdir = cache_dir_for(str(fname))
+    write_cache(fake_edf(), outdir)
+    assert load_edf(str(fname)).find('ring').tolist() == [2]
+    fname.write_bytes(b'changed')
+    assert cache_dir_for(str(fname)) != outdir
+
+
+def test_same_name_shared_root(tmp_path):
+    """same file name in two directories: each keeps its own hash in a shared cache_root"""
+    root = str(tmp_path / 'cache')
+    a, b = tmp_path / 'a', tmp_path / 'b'
+    a.mkdir(), b.mkdir()
+    (a / 'run1.edf').write_bytes(b'edf a')
+    (b / 'run1.edf').write_bytes(b'edf b')
+    for f in (a / 'run1.edf', b / 'run1.edf'):
+        os.utime(f, ns=(10**18, 10**18))  # same size and mtime: only the path tells them apart
+    dir_a = cache_dir_for(str(a / 'run1.edf'), root)
+    dir_b = cache_dir_for(str(b / 'run1.edf'), root)
+    assert dir_a != dir_b
+    assert cache_dir_for(str(a / 'run1.edf'), root) == dir_a
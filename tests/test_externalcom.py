@@ -0,0 +1,156 @@
+import time
+from lncdtask.externalcom import ExternalCom, AllExternal
+
+
+class SlowDevice(ExternalCom):
+    """records events. takes 'delay' seconds per event"""
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.sent = []
+
+    def event(self, code=None):
+        time.sleep(self.delay)
+        self.sent.append(code)
+
+    def event_at(self, t, code=None):
+        self.event(code)
+
+    def start(self): pass
+
+    def stop(self):
+        return "stopped"
+
+
+def test_async_ordered():
+    slow = SlowDevice(.02)
+    fast = SlowDevice()
+    allext = AllExternal([slow], asynchronous=True)
+    allext.prepend(fast, inline=True)
+
+    t0 = time.perf_counter()
+    for i in range(5):
+        allext.event(f"ev {i}")
+    # did not wait on the slow device
+    assert time.perf_counter() - t0 < .05
+    # inline device already has everything
+    assert len(fast.sent) == 5
+
+    assert allext.stop() == ["stopped", "stopped"]
+    assert slow.sent == [f"ev {i}" for i in range(5)]
+
+
+def test_async_only_if_honors_time():
+    """a device that would log the send time instead of the flip time is not queued"""
+    class NoTime(SlowDevice):
+        event_at = ExternalCom.event_at
+    dev = NoTime()
+    allext = AllExternal([dev], asynchronous=True)
+    allext.event("a")
+    assert dev.sent == ["a"]
+    assert allext.workers == {}
+
+
+def test_queue_stats():
+    dev = SlowDevice()
+    allext = AllExternal([dev], asynchronous=True)
+    allext.event("a")
+    allext.drain()
+    stats = allext.queue_stats()
+    assert stats[0]['n'] == 1
+    assert stats[0]['depth'] == 0
+
+
+class FakePort():
+    """like psychopy.parallel.ParallelPort. remember every setData"""
+    def __init__(self):
+        self.data = []
+
+    def setData(self, code):
+        self.data.append(code)
+
+
+def test_ttl_no_block():
+    from lncdtask.externalcom import TTLScheduler
+    port = FakePort()
+    ttl = TTLScheduler(port, pulse_width=.01)
+    t0 = time.perf_counter()
+    ttl.send(10)
+    ttl.send(20)  # within pulse width: should wait its turn
+    assert time.perf_counter() - t0 < .005
+    assert port.data == [10]
+    ttl.flush()
+    assert port.data == [10, 0, 20, 0]
+    (first, second) = ttl.pulses
+    assert first[3] - first[2] >= .01
+    # second not raised until first was zeroed
+    assert second[2] >= first[3]
+    assert ttl.report()['n'] == 2
+
+
+def test_filelogger(tmp_path):
+    from lncdtask.externalcom import FileLogger
+    fname = tmp_path / "test.log"
+    logger = FileLogger(flush_interval=10)
+    logger.new(fname)
+    logger.start()
+    logger.event("1 ring rew 0.5")
+    # nothing written until a flush
+    assert fname.read_text() == ""
+    logger.flush()
+    assert "1 ring rew 0.5" in fname.read_text()
+    logger.stop()
+    lines = fname.read_text().splitlines()
+    assert len(lines) == 3
+    (wall, mono, msg) = lines[-1].split(" ", 2)
+    assert msg == "stopping task"
+    assert float(wall) > float(mono)
+
+
+def test_filelogger_keeps_lines_without_file(tmp_path):
+    """lines logged before there is a file are written once there is one"""
+    from lncdtask.externalcom import FileLogger
+    fname = tmp_path / "test.log"
+    logger = FileLogger(flush_interval=10)
+    logger.event("early")
+    logger.flush()
+    logger.new(fname)
+    logger.flush()
+    assert "early" in fname.read_text()
+    logger.close()
+
+
+def test_eyelink_messages_in_order():
+    """eyelink events stay on the task thread, between the task's own trial_start and trial_end"""
+    import threading
+    from lncdtask.externalcom import Eyelink
+
+    class FakePylink():
+        def __init__(self):
+            self.sent = []
+
+        def log(self, msg):
+            self.sent.append((msg, threading.current_thread()))
+
+        def trigger(self, eventname, offset=0):
+            time.sleep(.01)
+            self.log(eventname)
+
+        def trial_start(self, trialid):
+            self.log(f"TRIALID {trialid}")
+
+        def trial_end(self):
+            self.log("TRIAL END")
+
+        def stop(self):
+            return "stopped"
+
+    el = Eyelink.__new__(Eyelink)
+    el.eyelink = FakePylink()
+    allext = AllExternal([el], asynchronous=True)
+    el.eyelink.trial_start(1)
+    allext.event("1 ring")
+    allext.event("1 dot")
+    el.eyelink.trial_end()
+    allext.stop()
+    assert [msg for msg, _ in el.eyelink.sent] == ["TRIALID 1", "1 ring", "1 dot", "TRIAL END"]
+    assert all(th is threading.main_thread() for _, th in el.eyelink.sent)
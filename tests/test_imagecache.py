@@ -0,0 +1,30 @@
+import os
+import numpy as np
+from PIL import Image
+from lncdtask.imagecache import ImageCache
+
+
+def mk_png(path, value=0):
+    Image.fromarray(np.full((10, 10, 3), value, dtype=np.uint8)).save(path)
+    return str(path)
+
+
+def test_lru_cap(tmp_path):
+    cache = ImageCache(max_bytes=700)  # room for two 300 byte images
+    a, b, c = [mk_png(tmp_path / f"{x}.png") for x in "abc"]
+    cache.image(a)
+    cache.image(b)
+    cache.image(a)  # a is now most recent
+    cache.image(c)  # b evicted
+    assert cache.nbytes == 600
+    paths = [key[1] for key in cache.entries]
+    assert paths == [os.path.abspath(a), os.path.abspath(c)]
+
+
+def test_changed_file(tmp_path):
+    cache = ImageCache()
+    a = mk_png(tmp_path / "a.png", 0)
+    assert cache.image(a).getpixel((0, 0)) == (0, 0, 0)
+    mk_png(a, 255)
+    os.utime(a, ns=(0, os.stat(a).st_mtime_ns + 10**9))
+    assert cache.image(a).getpixel((0, 0)) == (255, 255, 255)
@@ -0,0 +1,42 @@
+import numpy as np
+from lncdtask.edfcache import write_cache, cache_dir_for
+from plot_edf_dr import extract_target
+
+
+def gappy_edf():
+    """read_edf shaped. irregular sample steps and a dropout (2.3 to 2.6s) inside the first trial"""
+    rng = np.random.default_rng(1)
+    times = np.cumsum(rng.uniform(.001, .003, 5000))
+    times = times[(times < 2.3) | (times >= 2.6)]
+    ev = [('eye', 'f8'), ('stime', 'f8'), ('etime', 'f8')]
+    msgs = np.array([(0.5, b'GAZE_COORDS 0.00 0.00 1919.00 1079.00'),
+                     (2.0, b'1_dot_rew_0.5'), (4.0, b'2_ring_neu'), (6.0, b'3_dot_neu_-0.5')],
+                    dtype=[('stime', 'f8'), ('msg', 'O')])
+    return {'times': times,
+            'samples': np.vstack([times * 10, times * 20]),
+            'info': {'sample_fields': ['xpos_left', 'xpos_right']},
+            'discrete': {'messages': msgs,
+                         # in trial 1, ends after trial 1
+                         'blinks': np.array([(0., 2.4, 2.5), (0., 2.9, 3.1)], dtype=ev),
+                         # starts before trial 1, in 1, other eye, in 3
+                         'saccades': np.array([(0., 1.9, 2.05), (0., 2.1, 2.2), (1., 2.3, 2.4), (0., 6.5, 6.7)],
+                                              dtype=ev)}}
+
+
+def test_extract_target_windows(tmp_path):
+    fname = tmp_path / 'run1.edf'
+    fname.write_bytes(b'not really an edf')
+    edf = gappy_edf()
+    write_cache(edf, cache_dir_for(str(fname)))
+
+    t_data, hdr = extract_target(str(fname), 'dot', 1)
+    assert hdr['screen_x'] == '1919.00'
+    assert [d['msg'] for d in t_data] == ['1_dot_rew_0.5', '3_dot_neu_-0.5']
+    for d in t_data:
+        keep = (edf['times'] >= d['onset']) & (edf['times'] < d['onset'] + 1)
+        assert np.array_equal(d['times'], edf['times'][keep])
+        assert np.array_equal(d['samples'], edf['samples'][:, keep])
+    assert [(s['stime'], s['etime']) for s in t_data[0]['saccades']] == [(2.1, 2.2)]
+    assert [(b['stime'], b['etime']) for b in t_data[0]['blinks']] == [(2.4, 2.5)]
+    assert [(s['stime'], s['etime']) for s in t_data[1]['saccades']] == [(6.5, 6.7)]
+    assert len(t_data[1]['blinks']) == 0
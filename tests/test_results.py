@@ -0,0 +1,21 @@
+import pandas as pd
+from lncdtask.results import ResultStore
+
+
+def test_store_and_bind():
+    res = ResultStore(3)
+    res[0] = {'flip': 1.0}
+    res[2] = {'flip': 3.0, 'rt': .4}
+    res[1] = None  # event function that returned nothing
+    assert len(res) == 3
+    assert res[0] == {'flip': 1.0}
+    assert res[2]['rt'] == .4
+    assert 0 not in res.extras
+
+    onset_df = pd.DataFrame({'onset': [0, 1, 2], 'event_name': ['a', 'b', 'c']}, index=[5, 6, 7])
+    df = res.to_df()
+    df.index = onset_df.index
+    merged = onset_df.join(df)
+    assert merged.flip.tolist()[::2] == [1.0, 3.0]
+    assert merged.rt.isna().sum() == 2
+    assert 'late' in merged.columns
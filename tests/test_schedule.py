@@ -0,0 +1,67 @@
+import pandas as pd
+from lncdtask.lncdtask import EventRunner
+from lncdtask.schedule import EventSchedule
+
+
+def onset_df():
+    return pd.DataFrame({
+      'onset'     :[     0,      1,     2,     3],
+      'event_name':['ring', 'prep', 'dot', 'nope'],
+      'ring_type': ['neu',  'neu',  'rew', 'neu'],
+      'position':  [.75,      .75,    -1,   .75]})
+
+
+def test_bind():
+    sched = EventSchedule(onset_df())
+    ev = EventRunner(lambda *x: x, ['onset', 'ring_type', 'position'], 'ring')
+    sched.shift_onsets(10)
+    sched.bind({'ring': ev, 'prep': ev, 'dot': ev})
+    assert sched.runners[0] is ev
+    assert sched.runners[3] is None
+    assert sched.args[2] == (12.0, 'rew', -1.0)
+    # same as what EventRunner.run would have given from a pandas row
+    assert sched.args[1] == ev.run(pd.Series({'onset': 11.0, 'ring_type': 'neu', 'position': .75}))
+
+
+def test_event_timing_onset():
+    df = pd.DataFrame({'dur': [1, 2], 'event_name': ['iti', 'iti']})
+    sched = EventSchedule(df)
+    ev = EventRunner(lambda onset: onset, ['onset'], 'iti')
+    sched.bind({'iti': ev})
+    assert sched.args_with_onset(1, 5.5) == (5.5,)
+    assert sched.durs[0] == 1
+
+
+def test_build_schedule_mgs():
+    import numpy as np
+    from lncdtask.schedule import build_schedule, block_permutations
+    trials = {'position': [-.5, .5], 'delay': [2.5, 7.5]}
+    timing = {'cue': 2, 'delay': 0, 'exec': 2}
+    df = build_schedule(trials, timing, variable={'delay': 'delay'}, code_cols=['delay', 'position'])
+    assert df.onset.tolist() == [0, 2, 4.5, 6.5, 8.5, 16]
+    assert df.code[0] == 'cue_2.5_-0.5'
+    # every candidate run has each condition once per block
+    orders = block_permutations(8, 4, np.random.default_rng(1), n_runs=100)
+    blocks = np.sort(orders.reshape(100, 4, 8), axis=-1)
+    assert (blocks == np.arange(8)).all()
+
+
+def test_event_timing_reads_updated_dur():
+    """'event' timing: an event can set its own duration (e.g. to an RT) in onset_df"""
+    import io
+    import contextlib
+    from lncdtask.lncdtask import LNCDTask
+    from lncdtask.benchmark import StubWindow, QuietExternal, headless
+
+    with headless(), contextlib.redirect_stdout(io.StringIO()):
+        task = LNCDTask(win=StubWindow(), externals=[QuietExternal()])
+
+        def resp(onset):
+            flip = task.flip_at(onset)
+            task.onset_df.loc[task.event_number, 'dur'] = .05  # instead of 10s
+            return flip
+        task.add_event_type('resp', resp, ['onset'])
+        task.set_onsets(pd.DataFrame({'dur': [10., 10., 10.], 'event_name': ['resp']*3}))
+        task.run()
+    flips = task.results.flip
+    assert flips[2] - flips[0] < 1
@@ -0,0 +1,43 @@
+import time
+from psychopy import core
+from lncdtask.screen import wait_until, frame_deadline
+
+
+def test_wait_until_overshoot():
+    late = wait_until(core.getTime() + .05)
+    assert 0 <= late < .005
+
+
+def test_wait_until_sleeps():
+    """most of a long wait should not be spent on the cpu"""
+    cpu_start = time.process_time()
+    wait_until(core.getTime() + .5, spin_margin=.01)
+    assert time.process_time() - cpu_start < .25
+
+
+def test_wait_until_past():
+    assert wait_until(core.getTime() - 1) >= 1
+
+
+def test_frame_deadline():
+    # 60Hz, last flip at 0. onset at 1s is frame 60: ask just after frame 59
+    deadline = frame_deadline(1, 0, 1/60)
+    assert 59/60 < deadline < 1
+    # onset exactly between frames rounds to nearest
+    assert frame_deadline(1/60 * 10.4, 0, 1/60) < 10/60
+    # onset already past: no waiting
+    assert frame_deadline(.5, 1, 1/60) == 1
+
+
+def test_geometry_matches_replace_img():
+    from lncdtask.screen import ScreenGeometry
+    geo = ScreenGeometry((1024, 768))
+    geo.prepare([-1, -.66, .33, 1.0, float('nan'), 'left'], img_percents=[.15])
+    for horz in [-1, -.66, .33, 1.0]:
+        # replace_img's math for a 225 wide image at 15% of the screen
+        scale = 1024 * .15 / 225
+        half_img = scale * 225 / 2
+        want = min(max(horz * 512, half_img - 512), 512 - half_img)
+        assert geo.img_pos(horz, .15) == (want, 0.0)
+        assert geo.dot_pos(horz) == (horz * 512, 0)
+    assert len(geo.dots) == 4
@@ -0,0 +1,51 @@
+import glob
+import pandas as pd
+import pytest
+from lncdtask import dollarreward
+from lncdtask.session import SessionPlan
+from lncdtask.dollarreward import read_timing_tr_independent, event_messages, ttl_wrap
+
+
+@pytest.fixture(autouse=True)
+def timing_cache(tmp_path, monkeypatch):
+    """parsed timing files cached in tmp_path, not the user's cache"""
+    monkeypatch.setattr(dollarreward, 'TIMING_CACHE_DIR', str(tmp_path / "cache"))
+
+
+class FakeParticipant():
+    def __init__(self, root):
+        self.root = root
+
+    def ses_id(self):
+        return "sub-x_ses-1"
+
+    def log_path(self, bname):
+        return str(self.root / "log" / f"{bname}.log")
+
+    def run_path(self, bname):
+        return str(self.root / f"{bname}.csv")
+
+
+def test_plan_all_dollarreward(tmp_path):
+    tfiles = sorted(glob.glob('timing/dollarreward/*.tsv'))
+    session = SessionPlan(lambda r: read_timing_tr_independent(tfiles[r-1]), len(tfiles),
+                          message_func=event_messages, ttl_func=ttl_wrap,
+                          events=['ring', 'prep', 'dot', 'iti'])
+    runs = session.plan_all()
+    assert len(runs) == len(tfiles)
+    assert len(runs[1].ttl) == runs[1].onset_df.shape[0]
+
+    session.set_participant(FakeParticipant(tmp_path), 'DR')
+    assert runs[2].run_id == "sub-x_ses-1_task-DR_run-2"
+    session.prepare(2)
+    plan = session.get(2)
+    assert plan.log_path.endswith("run-2.log")
+    assert (tmp_path / "log").is_dir()
+
+
+def test_plan_all_bad():
+    dfs = {1: pd.DataFrame({'onset': [0, 1], 'event_name': ['iti', 'dot']}),
+           2: pd.DataFrame({'onset': [1, 0], 'event_name': ['iti', 'nope']})}
+    session = SessionPlan(dfs.get, 2, events=['iti', 'dot'])
+    with pytest.raises(ValueError, match="run 2"):
+        session.plan_all()
@@ -0,0 +1,21 @@
+from lncdtask.telemetry import EventTiming
+
+
+def test_report():
+    t = EventTiming(4, frame_period=1/60)
+    # on time, on time, one frame late, not run
+    for i, late in enumerate([.001, .002, 1/60 + .002]):
+        t.draw(i, i - .5)
+        t.flipped(i, i, i - .001, i + late)
+    rep = t.report()
+    assert rep['n'] == 3
+    assert rep['n_late'] == 1
+    assert rep['dropped_frames'] == 1
+    assert abs(rep['late_max'] - (1/60 + .002)) < 1e-9
+
+    df = t.to_df()
+    assert df.shape[0] == 4
+    assert df.late.isna().sum() == 1
+
+    t.reset()
+    assert t.report() == {'n': 0}
@@ -0,0 +1,38 @@
+from lncdtask.timing import read_timing, read_onset_df, read_onset_dfs, parse_1d
+
+
+def mk_stims(root, seed):
+    d = root / seed
+    d.mkdir()
+    (d / "vgs_Left.1D").write_text("2:1.5 10:1.5\n")
+    (d / "vgs_Right.1D").write_text("6*0.5:1.5 14:1.5\n")
+    (d / "dly.1D").write_text("*\n")
+    return str(d) + "/"
+
+
+def test_read_timing_dict(tmp_path):
+    prefix = mk_stims(tmp_path, "1234")
+    onsets = read_timing(prefix)
+    assert onsets['vgs_Left'] == [2, 10]
+    assert onsets['vgs_Right'] == [6, 14]
+    assert onsets['dly'] == []
+
+
+def test_read_onset_df(tmp_path):
+    prefix = mk_stims(tmp_path, "1234")
+    df = read_onset_df(prefix)
+    assert df.onset.tolist() == [2, 6, 10, 14]
+    assert df.event_name.tolist() == ['vgs_Left', 'vgs_Right', 'vgs_Left', 'vgs_Right']
+    assert (df.dur == 1.5).all()
+    assert df['mod'].notna().sum() == 1
+
+
+def test_read_many(tmp_path):
+    prefixes = [mk_stims(tmp_path, str(seed)) for seed in range(5)]
+    dfs = read_onset_dfs(prefixes, max_workers=2)
+    assert list(dfs) == prefixes
+    assert all(len(df) == 4 for df in dfs.values())
+
+
+def test_parse_empty():
+    assert len(parse_1d("*\n")['onset']) == 0
@@ -0,0 +1,36 @@
+import numpy as np
+from lncdtask.trial_shuffle import shuf_for_ntrials, constrained_order, constrained_orders, max_run
+
+
+def test_shuf_no_mutate():
+    vec = [1, 2, 3]
+    x = shuf_for_ntrials(vec, 5, np.random.default_rng(1))
+    assert vec == [1, 2, 3]
+    assert len(x) == 5
+
+
+def test_constrained_caps():
+    side = np.repeat(['L', 'R'], 16)
+    rew = np.tile(np.repeat(['neu', 'rew'], 8), 2)
+    factors = {'side': side, 'rew': rew}
+    orders = constrained_orders(20, factors, {'side': 3, 'rew': 2}, balance=['side'], seed=1)
+    for order in orders:
+        assert sorted(order) == list(range(32))
+        assert max_run(side[order]) <= 3
+        assert max_run(rew[order]) <= 2
+    # same seed, same orders
+    again = constrained_orders(20, factors, {'side': 3, 'rew': 2}, balance=['side'], seed=1)
+    assert all((a == b).all() for a, b in zip(orders, again))
+
+
+def test_constrained_impossible():
+    import pytest
+    with pytest.raises(ValueError):
+        constrained_order({'side': ['L']*5 + ['R']}, {'side': 2}, max_tries=5)
+
+
+def test_constrained_level_cap():
+    catch = np.repeat([False, True], [32, 16])
+    order = constrained_order({'catch': catch}, {'catch': {True: 2}}, rng=np.random.default_rng(3))
+    assert sorted(order) == list(range(48))
+    assert max_run(catch[order], True) <= 2